@@ -1,13 +1,111 @@
 from fastapi import FastAPI, Request, BackgroundTasks
+from fastapi.responses import FileResponse, JSONResponse, Response
 from pydantic import BaseModel
 from typing import Optional
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
 import uvicorn
 import os
-from datetime import datetime
+import time
 
-from app.services import kamis_scraper, write_excel, weather_api, price_engine, sheets_logger, whatsapp_agent, buyers_service
+from app.services import kamis_scraper, write_excel, weather_api, price_engine, sheets_logger, whatsapp_agent, buyers_service, run_registry, response_cache, message_dedup, delivery_status, conversation_store, twilio_events, metrics, prometheus, http_client, profiler, snapshots, broadcast_shards
+from app.services.webhook_queue import WebhookQueue
+from app.services.loop_monitor import LoopMonitor
+from app.services import logging_setup
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Startup and shutdown hooks shared by every worker.
+    """
+    # Here rather than at import, so importing app.main (scripts, benchmarks,
+    # export_openapi.py) leaves the caller's logging alone. Runs after uvicorn
+    # has set up its own loggers, which it then routes through the queue.
+    logging_setup.configure_logging()
+    await loop_monitor.start()
+    await webhook_queue.start(process_whatsapp_payload)
+    flusher_task = asyncio.create_task(flush_delivery_statuses())
+    twilio_task = asyncio.create_task(flush_twilio_summaries())
+    metrics_task = asyncio.create_task(publish_metrics())
+    shards_task = None
+    if broadcast_shards.SHARD_COUNT > 0 and broadcast_shards.SHARD_POLL_SECONDS > 0:
+        shards_task = asyncio.create_task(work_sharded_runs())
+    
+    # Resume an interrupted broadcast without blocking startup
+    resume_task = asyncio.create_task(asyncio.to_thread(resume_abandoned_run))
+    yield
+    await webhook_queue.stop()
+    flusher_task.cancel()
+    twilio_task.cancel()
+    metrics_task.cancel()
+    if shards_task is not None:
+        shards_task.cancel()
+    await loop_monitor.stop()
+    await asyncio.to_thread(delivery_status.flush)
+    if not resume_task.done():
+        logger.warning("Shutting down while a resumed daily workflow is still running")
+    logging_setup.shutdown_logging()
+
+async def flush_delivery_statuses():
+    """
+    Writes buffered delivery statuses that have waited long enough.
+    """
+    while True:
+        await asyncio.sleep(delivery_status.FLUSH_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(delivery_status.flush_if_due)
+        except Exception as e:
+            logger.exception("Error flushing delivery statuses: %s", e)
+
+async def flush_twilio_summaries():
+    """
+    Writes Twilio debugger event summaries to Sheets once per window, and
+    deletes expired conversation states on the same schedule.
+    """
+    while True:
+        await asyncio.sleep(twilio_events.SUMMARY_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(twilio_events.flush_summaries)
+        except Exception as e:
+            logger.exception("Error flushing Twilio summaries: %s", e)
+        try:
+            await asyncio.to_thread(conversation_store.purge_expired)
+        except Exception as e:
+            logger.exception("Error purging expired conversations: %s", e)
+
+async def publish_metrics():
+    """
+    Publishes this worker's metrics so /metrics on any worker can add them up.
+    """
+    while True:
+        await asyncio.sleep(prometheus.PUBLISH_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(prometheus.publish)
+        except Exception as e:
+            logger.warning("Error publishing metrics: %s", e)
+
+async def work_sharded_runs():
+    """
+    Joins sharded daily broadcasts: claims and sends shards of any running
+    run that has some left (see broadcast_shards).
+    """
+    while True:
+        await asyncio.sleep(broadcast_shards.SHARD_POLL_SECONDS)
+        try:
+            run_id = await asyncio.to_thread(broadcast_shards.find_claimable_run)
+            if run_id:
+                await asyncio.to_thread(work_shards, run_id)
+        except Exception as e:
+            logger.exception("Error working on broadcast shards: %s", e)
 
 app = FastAPI(
+    lifespan=lifespan,
     title="AgroGhala API",
     description="Agricultural market intelligence and farmer notification system for Kenya",
     version="1.0.0",
@@ -21,6 +119,9 @@ app = FastAPI(
     ]
 )
 
+app.add_middleware(profiler.ProfilingMiddleware)
+app.add_middleware(prometheus.RequestMetricsMiddleware)
+
 class WebhookMessage(BaseModel):
     object: str
     entry: list
@@ -37,6 +138,7 @@ def read_root():
             "fair_prices": "/api/prices/fair",
             "counties": "/api/counties",
             "workflow": "/trigger-daily",
+            "runs": "/runs",
             "openapi": "/openapi.json"
         },
         "docs": {
@@ -120,8 +222,39 @@ async def get_weather_endpoint(county: str):
             "message": f"Failed to get weather for {county}"
         }
 
+# Seconds clients may reuse cached responses before revalidating
+PRICES_MAX_AGE = 300
+COUNTIES_MAX_AGE = 86400
+BUYERS_MAX_AGE = 300
+
+def build_prices_content(force_refresh: bool = False) -> dict:
+    """
+    Builds the /api/prices response body.
+    """
+    prices = kamis_scraper.scrape_kamis(force_refresh=force_refresh)
+    is_cached = prices.get('source') == 'cache'
+    
+    return {
+        "success": True,
+        "data": {
+            "wholesale_prices": {
+                "tomato": prices.get("tomato"),
+                "sukuma": prices.get("sukuma"),
+                "onion": prices.get("onion"),
+                "cabbage": prices.get("cabbage"),
+                "maize": prices.get("maize"),
+                "beans": prices.get("beans")
+            },
+            "date": prices.get("date"),
+            "source": prices.get("source")
+        },
+        "cached": is_cached,
+        "message": "Using cached prices" if is_cached else "Prices retrieved successfully",
+        "note": "Prices are in KSh per kg (Nairobi wholesale)"
+    }
+
 @app.get("/api/prices")
-async def get_prices_endpoint(force_refresh: bool = False):
+async def get_prices_endpoint(request: Request, force_refresh: bool = False):
     """
     Get current wholesale prices from KAMIS.
     
@@ -133,30 +266,16 @@ async def get_prices_endpoint(force_refresh: bool = False):
         - Date of data
         - Whether data is cached
         
-    By default, uses cached data if available from today.
+    By default, uses cached data if available from today. Responses carry
+    an ETag; send it back in If-None-Match to get 304 Not Modified.
     """
     try:
-        prices = kamis_scraper.scrape_kamis(force_refresh=force_refresh)
-        is_cached = prices.get('source') == 'cache'
+        version = None if force_refresh else kamis_scraper.get_cached_prices_version()
+        if version is None:
+            return build_prices_content(force_refresh)
         
-        return {
-            "success": True,
-            "data": {
-                "wholesale_prices": {
-                    "tomato": prices.get("tomato"),
-                    "sukuma": prices.get("sukuma"),
-                    "onion": prices.get("onion"),
-                    "cabbage": prices.get("cabbage"),
-                    "maize": prices.get("maize"),
-                    "beans": prices.get("beans")
-                },
-                "date": prices.get("date"),
-                "source": prices.get("source")
-            },
-            "cached": is_cached,
-            "message": "Using cached prices" if is_cached else "Prices retrieved successfully",
-            "note": "Prices are in KSh per kg (Nairobi wholesale)"
-        }
+        cached = response_cache.get_or_build(("prices",), version, build_prices_content)
+        return response_cache.respond(request, cached, PRICES_MAX_AGE)
     except Exception as e:
         return {
             "success": False,
@@ -164,8 +283,41 @@ async def get_prices_endpoint(force_refresh: bool = False):
             "message": "Failed to retrieve prices"
         }
 
+def build_fair_prices_content(force_refresh: bool = False) -> dict:
+    """
+    Builds the /api/prices/fair response body.
+    """
+    # Get wholesale prices (uses cache if available)
+    wholesale_prices = kamis_scraper.scrape_kamis(force_refresh=force_refresh)
+    is_cached = wholesale_prices.get('source') == 'cache'
+    
+    # Calculate fair prices
+    fair_prices = price_engine.calculate_fair_prices(wholesale_prices)
+    
+    return {
+        "success": True,
+        "data": {
+            "fair_prices": {
+                "tomato": fair_prices.get("fair_tomato"),
+                "sukuma": fair_prices.get("fair_sukuma"),
+                "onion": fair_prices.get("fair_onion"),
+                "cabbage": fair_prices.get("fair_cabbage")
+            },
+            "wholesale_prices": {
+                "tomato": wholesale_prices.get("tomato"),
+                "sukuma": wholesale_prices.get("sukuma"),
+                "onion": wholesale_prices.get("onion"),
+                "cabbage": wholesale_prices.get("cabbage")
+            },
+            "date": wholesale_prices.get("date")
+        },
+        "cached": is_cached,
+        "message": "Using cached prices" if is_cached else "Fair prices calculated successfully",
+        "note": "Fair price = Wholesale price × 0.75 (farm-gate margin)"
+    }
+
 @app.get("/api/prices/fair")
-async def get_fair_prices_endpoint(force_refresh: bool = False):
+async def get_fair_prices_endpoint(request: Request, force_refresh: bool = False):
     """
     Get fair farm-gate prices (calculated from wholesale).
     
@@ -179,36 +331,15 @@ async def get_fair_prices_endpoint(force_refresh: bool = False):
         - Whether data is cached
         
     By default, uses cached wholesale prices if available from today.
+    Supports ETag / If-None-Match like /api/prices.
     """
     try:
-        # Get wholesale prices (uses cache if available)
-        wholesale_prices = kamis_scraper.scrape_kamis(force_refresh=force_refresh)
-        is_cached = wholesale_prices.get('source') == 'cache'
+        version = None if force_refresh else kamis_scraper.get_cached_prices_version()
+        if version is None:
+            return build_fair_prices_content(force_refresh)
         
-        # Calculate fair prices
-        fair_prices = price_engine.calculate_fair_prices(wholesale_prices)
-        
-        return {
-            "success": True,
-            "data": {
-                "fair_prices": {
-                    "tomato": fair_prices.get("fair_tomato"),
-                    "sukuma": fair_prices.get("fair_sukuma"),
-                    "onion": fair_prices.get("fair_onion"),
-                    "cabbage": fair_prices.get("fair_cabbage")
-                },
-                "wholesale_prices": {
-                    "tomato": wholesale_prices.get("tomato"),
-                    "sukuma": wholesale_prices.get("sukuma"),
-                    "onion": wholesale_prices.get("onion"),
-                    "cabbage": wholesale_prices.get("cabbage")
-                },
-                "date": wholesale_prices.get("date")
-            },
-            "cached": is_cached,
-            "message": "Using cached prices" if is_cached else "Fair prices calculated successfully",
-            "note": "Fair price = Wholesale price × 0.75 (farm-gate margin)"
-        }
+        cached = response_cache.get_or_build(("prices_fair",), version, build_fair_prices_content)
+        return response_cache.respond(request, cached, PRICES_MAX_AGE)
     except Exception as e:
         return {
             "success": False,
@@ -216,13 +347,9 @@ async def get_fair_prices_endpoint(force_refresh: bool = False):
             "message": "Failed to calculate fair prices"
         }
 
-@app.get("/api/counties")
-async def get_counties_endpoint():
+def build_counties_content() -> dict:
     """
-    Get list of all supported Kenyan counties.
-    
-    Returns:
-        - List of 47 Kenyan counties with coordinates
+    Builds the /api/counties response body.
     """
     from app.services.weather_api import KENYA_COUNTIES
     
@@ -242,12 +369,48 @@ async def get_counties_endpoint():
         "message": "All Kenyan counties retrieved"
     }
 
+@app.get("/api/counties")
+async def get_counties_endpoint(request: Request):
+    """
+    Get list of all supported Kenyan counties.
+    
+    Returns:
+        - List of 47 Kenyan counties with coordinates
+    """
+    cached = response_cache.get_or_build(("counties",), "static", build_counties_content)
+    return response_cache.respond(request, cached, COUNTIES_MAX_AGE)
+
 # ============================================================================
 # BUYER ENDPOINTS
 # ============================================================================
 
+def build_buyers_content(
+    buyer_type: Optional[str] = None,
+    county: Optional[str] = None,
+    crop: Optional[str] = None
+) -> dict:
+    """
+    Builds the /api/buyers response body.
+    """
+    # Apply filters if provided
+    if buyer_type:
+        buyers = buyers_service.get_buyers_by_type(buyer_type)
+    elif county:
+        buyers = buyers_service.get_buyers_by_county(county)
+    elif crop:
+        buyers = buyers_service.get_buyers_by_crop(crop)
+    else:
+        buyers = buyers_service.get_all_buyers()
+    
+    # Return buyers directly - no extra metadata to confuse AI
+    return {
+        "count": len(buyers),
+        "buyers": buyers
+    }
+
 @app.get("/api/buyers")
 async def get_all_buyers_endpoint(
+    request: Request,
     buyer_type: Optional[str] = None,
     county: Optional[str] = None,
     crop: Optional[str] = None
@@ -266,21 +429,15 @@ async def get_all_buyers_endpoint(
         - THIS IS REAL BUYER DATA - Show it directly to farmers with contact details!
     """
     try:
-        # Apply filters if provided
-        if buyer_type:
-            buyers = buyers_service.get_buyers_by_type(buyer_type)
-        elif county:
-            buyers = buyers_service.get_buyers_by_county(county)
-        elif crop:
-            buyers = buyers_service.get_buyers_by_crop(crop)
-        else:
-            buyers = buyers_service.get_all_buyers()
-        
-        # Return buyers directly - no extra metadata to confuse AI
-        return {
-            "count": len(buyers),
-            "buyers": buyers
-        }
+        # Filters are case-insensitive, so normalize them for the cache key
+        key = ("buyers",) + tuple((value or "").lower() for value in (buyer_type, county, crop))
+        cached = response_cache.get_or_build(
+            key,
+            buyers_service.get_buyers_version(),
+            lambda: build_buyers_content(buyer_type, county, crop)
+        )
+        # Buyers' names and phone numbers must not be kept by shared caches
+        return response_cache.respond(request, cached, BUYERS_MAX_AGE, cache_control="private")
     except Exception as e:
         return {
             "error": str(e)
@@ -466,50 +623,67 @@ async def whatsapp_webhook_verify(request: Request):
         return int(params.get("hub.challenge"))
     return {"error": "Verification failed"}, 403
 
+# Optional: verify X-Hub-Signature-256 when the Meta app secret is configured
+WHATSAPP_APP_SECRET = os.getenv("WHATSAPP_APP_SECRET")
+
+webhook_queue = WebhookQueue()
+loop_monitor = LoopMonitor()
+metrics.register_gauge("webhook_queue_depth", webhook_queue.depth)
+
+def verify_webhook_signature(body: bytes, signature: Optional[str]) -> bool:
+    """
+    Checks Meta's X-Hub-Signature-256 header against the raw body.
+    Always passes when WHATSAPP_APP_SECRET is not set.
+    """
+    if not WHATSAPP_APP_SECRET:
+        return True
+    if not signature or not signature.startswith("sha256="):
+        return False
+    expected = hmac.new(WHATSAPP_APP_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature[len("sha256="):])
+
 @app.post("/webhook")
-async def whatsapp_webhook(request: Request, background_tasks: BackgroundTasks):
+async def whatsapp_webhook(request: Request):
     """
     Handle incoming WhatsApp messages from Meta Cloud API.
     Expects JSON payload from WhatsApp Cloud API.
+    
+    The payload is only validated and queued here; webhook workers process
+    it after the response is sent. Returns 503 when the queue is full so
+    Meta retries the delivery later.
     """
     try:
         # Get content type to determine how to parse
         content_type = request.headers.get("content-type", "")
         
-        # Try to parse as JSON (WhatsApp Cloud API sends JSON)
+        # WhatsApp Cloud API sends JSON
         if "application/json" in content_type:
-            data = await request.json()
-            print(f"Received WhatsApp webhook data: {data}")
+            body = await request.body()
+            
+            if not verify_webhook_signature(body, request.headers.get("x-hub-signature-256")):
+                return JSONResponse(status_code=401, content={"status": "error", "message": "Invalid signature"})
             
-            # Extract message details
             try:
-                entry = data['entry'][0]
-                changes = entry['changes'][0]
-                value = changes['value']
-                
-                if 'messages' in value:
-                    message = value['messages'][0]
-                    from_phone = message['from']
-                    text_body = message['text']['body'].strip().upper()
-                    
-                    if text_body == "YES":
-                        # Trigger YES-reply workflow in background
-                        background_tasks.add_task(handle_yes_reply, from_phone)
-                        
-            except Exception as e:
-                print(f"Error processing WhatsApp message: {e}")
-                
+                data = json.loads(body)
+            except ValueError:
+                return JSONResponse(status_code=400, content={"status": "error", "message": "Invalid JSON"})
+            
+            if not isinstance(data, dict) or not isinstance(data.get("entry"), list):
+                return JSONResponse(status_code=400, content={"status": "error", "message": "Missing entry list"})
+            
+            if not webhook_queue.enqueue(data):
+                return JSONResponse(status_code=503, content={"status": "busy", "message": "Webhook queue full"})
+            
             return {"status": "received"}
         
         # If not JSON, try form data (might be Twilio or other service)
         else:
             form_data = await request.form()
-            print(f"Received form-encoded webhook data: {dict(form_data)}")
+            logger.debug("Received form-encoded webhook data", extra={"fields": sorted(form_data.keys())})
             
             # If this looks like a Twilio debugger event, redirect
             if form_data.get("AccountSid") or form_data.get("Level"):
-                print("⚠️  Detected Twilio event sent to wrong endpoint!")
-                print(f"   Please use /webhook/twilio for Twilio debugger events")
+                logger.warning("Twilio event sent to /webhook; use /webhook/twilio for Twilio debugger events")
                 return {
                     "status": "received",
                     "warning": "Twilio events should be sent to /webhook/twilio"
@@ -518,15 +692,95 @@ async def whatsapp_webhook(request: Request, background_tasks: BackgroundTasks):
             return {"status": "received", "message": "Non-JSON webhook received"}
             
     except Exception as e:
-        print(f"Error processing webhook: {e}")
+        logger.exception("Error processing webhook: %s", e)
         return {"status": "error", "message": str(e)}
 
+@app.get("/webhook/stats")
+async def webhook_stats_endpoint():
+    """
+    Webhook queue depth, counters and drain latency for this worker.
+    """
+    return {
+        "success": True,
+        "data": webhook_queue.stats()
+    }
+
+def process_whatsapp_payload(data: dict):
+    """
+    Acts on a queued WhatsApp webhook payload (runs on a webhook worker).
+    
+    Handles every message and status in the payload. Message IDs are
+    deduplicated in one batch before any message is handled.
+    """
+    messages, statuses = whatsapp_agent.parse_webhook_payload(data)
+    
+    if messages:
+        # Skip redeliveries of messages already handled by any worker
+        new_ids = set(message_dedup.claim_new(m['id'] for m in messages if m.get('id')))
+        
+        for message in messages:
+            if message.get('id') and message['id'] not in new_ids:
+                continue
+            try:
+                handle_incoming_message(message)
+            except Exception as e:
+                logger.exception("Error processing WhatsApp message %s: %s", message.get('id'), e)
+                # A transient failure must not turn Meta's redelivery into a "duplicate"
+                if message.get('id'):
+                    message_dedup.release(message['id'])
+    
+    if statuses:
+        handle_status_updates(statuses)
+
+def handle_incoming_message(message: dict):
+    """
+    Routes one incoming WhatsApp message using the farmer's conversation state.
+    """
+    if message.get('type', 'text') != 'text':
+        return
+    
+    from_phone = message['from']
+    text_body = message['text']['body'].strip().upper()
+    
+    if text_body == "YES":
+        # Trigger YES-reply workflow
+        handle_yes_reply(from_phone)
+        return
+    
+    state = conversation_store.get(from_phone)
+    if state and state.get('stage') == conversation_store.STAGE_AWAITING_CROP:
+        handle_crop_choice(from_phone, text_body, state)
+
+def handle_status_updates(statuses: list):
+    """
+    Records delivery status events (sent/delivered/read/failed).
+    """
+    delivery_status.record_status_events(statuses)
+
+@app.get("/webhook/twilio/summary")
+async def twilio_summary_endpoint(since_seconds: int = 3600):
+    """
+    Twilio debugger event counts by time window, level and error code.
+    
+    Query Parameters:
+        - since_seconds (optional): How far back to look (default: 1 hour)
+    """
+    groups = await asyncio.to_thread(twilio_events.get_summary, since_seconds)
+    return {
+        "success": True,
+        "window_seconds": twilio_events.SUMMARY_INTERVAL_SECONDS,
+        "total_events": sum(group["count"] for group in groups),
+        "data": groups
+    }
+
 @app.post("/webhook/twilio")
 async def twilio_debugger_webhook(request: Request):
     """
     Handle Twilio debugger events (errors and warnings).
     
     Receives error/warning events from Twilio for monitoring and troubleshooting.
+    Events are stored locally and summarized to Google Sheets by error code
+    every TWILIO_SUMMARY_INTERVAL_SECONDS, so bursts do not hit the Sheets quota.
     
     Expected payload:
     - AccountSid: Account identifier
@@ -552,122 +806,513 @@ async def twilio_debugger_webhook(request: Request):
             "Payload": form_data.get("Payload")
         }
         
-        print(f"=" * 70)
-        print(f"Twilio Debugger Event Received:")
-        print(f"  Level: {event_data['Level']}")
-        print(f"  Timestamp: {event_data['Timestamp']}")
-        print(f"  Account: {event_data['AccountSid']}")
-        print(f"  Event ID: {event_data['Sid']}")
-        
-        # Parse the JSON payload if present
-        if event_data['Payload']:
-            import json
-            try:
-                payload_json = json.loads(event_data['Payload'])
-                print(f"  Payload: {json.dumps(payload_json, indent=2)}")
-            except:
-                print(f"  Payload: {event_data['Payload']}")
-        
-        print(f"=" * 70)
-        
-        # Log to Google Sheets if configured
-        try:
-            sheets_logger.log_activity(
-                farmer_name="System",
-                county="N/A",
-                prices_sent="N/A",
-                weather_summary="N/A",
-                farmer_reply=f"Twilio {event_data['Level']}",
-                buyer_list_sent=f"Event: {event_data['Sid']}"
-            )
-        except Exception as e:
-            print(f"Could not log to sheets: {e}")
+        # Store locally; summaries go to Google Sheets periodically
+        is_new = await asyncio.to_thread(twilio_events.record_event, event_data)
         
         return {
             "status": "received",
-            "message": "Twilio debugger event logged successfully",
+            "message": "Twilio debugger event logged successfully" if is_new else "Duplicate Twilio event ignored",
             "event_id": event_data['Sid'],
             "level": event_data['Level']
         }
         
     except Exception as e:
-        print(f"Error processing Twilio webhook: {e}")
+        logger.exception("Error processing Twilio webhook: %s", e)
         return {
             "status": "error",
             "message": str(e)
         }
 
-def handle_yes_reply(phone_number):
+def parse_crops(crops_text) -> list:
     """
-    Logic to handle YES reply:
-    1. Identify farmer (mock lookup or from sheets)
-    2. Find relevant buyers (mock logic: assume they have all crops or ask - for MVP we send all buyers or random)
-    3. Send buyer list
-    4. Log it
+    Splits a farmer's "Crops" cell ("Tomatoes, Sukuma") into a list.
     """
-    print(f"Handling YES reply from {phone_number}")
-    
-    # In a real app, we'd need to know WHICH crop the farmer has. 
-    # The prompt implies we just send available buyers.
-    # Let's fetch buyers for all 4 crops or just a mix.
+    return [crop.strip() for crop in str(crops_text or "").split(",") if crop.strip()]
+
+def find_buyers_for_crop(crop: str, county: Optional[str] = None) -> list:
+    """
+    Buyers interested in a crop, preferring the farmer's county.
     
-    # Mock: Fetch buyers for Tomatoes as default or aggregate
-    buyers = sheets_logger.get_buyers("Tomato") 
-    # Add more if needed
+    Returns:
+        Buyer dicts with the keys format_buyer_list expects
+    """
+    # Match on the first word so "Sukuma" finds "Sukuma Wiki"
+    crop_key = crop.split()[0] if crop else "Tomatoes"
+    buyers = buyers_service.get_buyers_by_crop(crop_key)
+    if county:
+        in_county = [b for b in buyers if (b.get('County') or '').lower() == county.lower()]
+        buyers = in_county or buyers
     
+    return [
+        {
+            "name": buyer.get("Buyer Name", ""),
+            "crop": crop,
+            "price": buyer.get("Price Range (KSh/kg)", "N/A"),
+            "phone": buyer.get("Contact Phone", "")
+        }
+        for buyer in buyers[:5]
+    ]
+
+def send_buyers_for_crop(phone_number: str, crop: str, state: dict):
+    """
+    Sends the buyer list for one crop, logs it and closes the conversation.
+    """
+    buyers = find_buyers_for_crop(crop, state.get('county'))
     msg = whatsapp_agent.format_buyer_list(buyers)
     whatsapp_agent.send_whatsapp_message(phone_number, msg)
     
+    conversation_store.update(phone_number, stage=conversation_store.STAGE_DONE, crop=crop)
+    
     # Log
     sheets_logger.log_activity(
-        farmer_name=f"Farmer {phone_number}", # Placeholder if not found
-        county="Unknown",
+        farmer_name=state.get('name') or f"Farmer {phone_number}",
+        county=state.get('county') or "Unknown",
         prices_sent="N/A", # Not sending prices now
         weather_summary="N/A",
         farmer_reply="YES",
-        buyer_list_sent="Yes"
+        buyer_list_sent=f"Yes ({crop})"
     )
 
+def handle_yes_reply(phone_number):
+    """
+    Logic to handle YES reply:
+    1. Identify farmer from the conversation state written by the broadcast
+    2. If they grow several crops, ask which one they are selling
+    3. Otherwise send buyers for their crop (Tomatoes if unknown)
+    4. Log it
+    """
+    logger.info("Handling YES reply from %s", phone_number)
+    
+    state = conversation_store.get(phone_number) or {}
+    crops = state.get('crops') or []
+    
+    if len(crops) > 1:
+        options = "\n".join(f"{i}. {crop}" for i, crop in enumerate(crops, 1))
+        whatsapp_agent.send_whatsapp_message(
+            phone_number,
+            f"Which crop are you selling today?\n\n{options}\n\nReply with the number."
+        )
+        conversation_store.update(phone_number, stage=conversation_store.STAGE_AWAITING_CROP)
+        return
+    
+    send_buyers_for_crop(phone_number, crops[0] if crops else "Tomatoes", state)
+
+def handle_crop_choice(phone_number: str, text_body: str, state: dict):
+    """
+    Resolves the farmer's answer to "Which crop?" (number or crop name).
+    """
+    crops = state.get('crops') or []
+    choice = None
+    text_body = text_body.strip().upper()
+    
+    if text_body.isdigit() and 1 <= int(text_body) <= len(crops):
+        choice = crops[int(text_body) - 1]
+    elif text_body:
+        # Skipped for an empty reply, which would prefix-match the first crop
+        for crop in crops:
+            if crop.upper().startswith(text_body) or text_body.startswith(crop.upper()):
+                choice = crop
+                break
+    
+    if choice is None:
+        options = "\n".join(f"{i}. {crop}" for i, crop in enumerate(crops, 1))
+        whatsapp_agent.send_whatsapp_message(phone_number, f"Please reply with one of:\n\n{options}")
+        return
+    
+    send_buyers_for_crop(phone_number, choice, state)
+
 @app.post("/trigger-daily")
 async def trigger_daily_workflow(background_tasks: BackgroundTasks):
     """
     Manually trigger the daily 4:30 AM workflow.
+
+    Only one run per day is started across all workers. A duplicate trigger
+    returns the existing run instead of starting another broadcast; a run
+    whose worker died is taken over and resumed.
+    """
+    run, started = run_registry.claim_run(run_registry.make_run_id())
+    if started:
+        background_tasks.add_task(run_daily_workflow, run["run_id"])
+        return {"status": "Daily workflow triggered", "run": run}
+    return {"status": f"Daily workflow already {run['status']}", "run": run}
+
+@app.get("/runs")
+async def list_runs_endpoint(limit: int = 30):
+    """
+    List recent daily workflow runs, newest first.
+    """
+    runs = run_registry.list_runs(limit)
+    return {
+        "success": True,
+        "count": len(runs),
+        "data": runs
+    }
+
+@app.get("/runs/summaries")
+async def list_run_summaries_endpoint(limit: int = 30):
+    """
+    Stage timing summaries of recent runs, newest first, for comparing days.
+    """
+    summaries = run_registry.list_summaries(limit)
+    return {
+        "success": True,
+        "count": len(summaries),
+        "data": summaries
+    }
+
+@app.get("/runs/{run_id}")
+async def get_run_endpoint(run_id: str):
+    """
+    Get status and progress of a daily workflow run.
+
+    Path Parameters:
+        - run_id: Run ID (e.g., "daily-2025-11-21")
     """
-    background_tasks.add_task(run_daily_workflow)
-    return {"status": "Daily workflow triggered"}
+    run = run_registry.get_run(run_id)
+    if not run:
+        return {"success": False, "error": f"Run {run_id} not found"}
+    return {"success": True, "data": run}
 
-def run_daily_workflow():
-    print("Starting daily workflow...")
+@app.get("/runs/{run_id}/delivery")
+async def get_run_delivery_endpoint(run_id: str):
+    """
+    Delivery outcomes for a broadcast run.
     
-    # 1. Scrape KAMIS (force refresh for daily workflow)
-    prices = kamis_scraper.scrape_kamis(force_refresh=True)
+    Returns:
+        - Messages sent, delivered, read and failed
+        - Delivery and read rates
+        - Send throughput (messages/sec)
+        - Latency percentiles from send to delivered and to read
+    """
+    stats = await asyncio.to_thread(delivery_status.get_run_delivery_stats, run_id)
+    return {"success": True, "data": stats}
+
+@app.get("/runs/{run_id}/summary")
+async def get_run_summary_endpoint(run_id: str):
+    """
+    Stage timings and counters for each attempt at a run.
     
+    Returns (per attempt):
+        - wall_seconds for the attempt
+        - stages: count, total, mean, max and p50/p95/p99 seconds, and share
+          of wall time for scrape, excel, fair_prices, farmers, weather,
+          format, send, sheets_log, checkpoint and conversation_state
+        - counters: farmers_total, messages_sent, messages_failed,
+          farmers_skipped, weather_mock, sheets_log_failed
+    """
+    summaries = run_registry.get_summaries(run_id)
+    if not summaries:
+        return {"success": False, "error": f"No summary recorded for run {run_id}"}
+    return {"success": True, "data": summaries}
+
+@app.get("/runs/{run_id}/shards")
+async def get_run_shards_endpoint(run_id: str):
+    """
+    Shards of a sharded broadcast run (BROADCAST_SHARDS).
+
+    Returns:
+        - shard_count and total farmers planned
+        - Per shard: status, farmer_count, owner, processed, attempts,
+          error and the shard's stage summary once completed
+    """
+    plan = await asyncio.to_thread(broadcast_shards.get_plan, run_id)
+    if not plan:
+        return {"success": False, "error": f"Run {run_id} is not sharded"}
+    shards = await asyncio.to_thread(broadcast_shards.list_shards, run_id)
+    return {
+        "success": True,
+        "data": {
+            "shard_count": plan["shard_count"],
+            "total": plan["total"],
+            "shards": shards
+        }
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics_endpoint():
+    """
+    Metrics for all workers in the Prometheus text format.
+    """
+    body = await asyncio.to_thread(lambda: prometheus.render(prometheus.collect()))
+    return Response(content=body, media_type=prometheus.CONTENT_TYPE)
+
+@app.get("/metrics/upstreams")
+async def upstream_metrics_endpoint():
+    """
+    Latency summary and error count per upstream service (KAMIS,
+    Open-Meteo, OpenWeatherMap, Graph API, Sheets) for this worker.
+    """
+    return {"success": True, "data": metrics.get_upstream_summary()}
+
+@app.get("/metrics/hosts")
+async def host_metrics_endpoint():
+    """
+    Outbound HTTP latency, requests by status, retries and bytes per host
+    for this worker.
+    """
+    return {"success": True, "data": http_client.get_host_stats()}
+
+@app.get("/metrics/event-loop")
+async def event_loop_metrics_endpoint():
+    """
+    Event loop lag for this worker: heartbeat lag percentiles, how often
+    the loop was blocked past LOOP_LAG_THRESHOLD_SECONDS, and the stack of
+    the blocking code for recent stalls.
+    """
+    return {"success": True, "data": loop_monitor.stats()}
+
+@app.get("/metrics/snapshots")
+async def snapshot_metrics_endpoint():
+    """
+    Data snapshots this worker has mapped: source version, when and by
+    which process each was built, size and layout. Records (buyers) are
+    read from the mapping; a value snapshot reports the memory its decoded
+    copy takes in this worker (decoded_rss_bytes). Every worker should
+    report the same versions.
+    """
+    return {"success": True, "data": snapshots.stats()}
+
+@app.get("/profiles")
+async def list_profiles_endpoint(request: Request, limit: int = 50):
+    """
+    Saved request profiles, newest first (method, path, status, duration,
+    trigger). Requires X-Profile-Token matching PROFILE_ADMIN_TOKEN
+    (without one configured, only served with PROFILE_ALLOW_UNAUTHENTICATED).
+    """
+    if not profiler.is_authorized(request.headers.get("x-profile-token")):
+        return JSONResponse(status_code=403, content={"success": False, "error": "Invalid profile token"})
+    profiles = await asyncio.to_thread(profiler.list_profiles, limit)
+    return {
+        "success": True,
+        "count": len(profiles),
+        "data": profiles
+    }
+
+@app.get("/profiles/{profile_id}")
+async def get_profile_endpoint(request: Request, profile_id: str, format: str = "prof", sort: str = "cumulative", limit: int = 60):
+    """
+    Download a request profile.
+
+    Query Parameters:
+        - format: "prof" (cProfile data for pstats/snakeviz) or "text"
+          (pstats report)
+        - sort, limit: ordering and number of functions in the text report
+    """
+    if not profiler.is_authorized(request.headers.get("x-profile-token")):
+        return JSONResponse(status_code=403, content={"success": False, "error": "Invalid profile token"})
+    path = profiler.get_profile_path(profile_id)
+    if not path:
+        return JSONResponse(status_code=404, content={"success": False, "error": f"Profile {profile_id} not found"})
+    if format == "text":
+        try:
+            report = await asyncio.to_thread(profiler.render_text, path, sort, limit)
+        except KeyError:
+            return JSONResponse(status_code=400, content={"success": False, "error": f"Unknown sort key {sort}"})
+        return Response(content=report, media_type="text/plain; charset=utf-8")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+
+@app.post("/runs/{run_id}/cancel")
+async def cancel_run_endpoint(run_id: str):
+    """
+    Ask a running workflow to stop after the farmer it is processing.
+    """
+    run = run_registry.request_cancel(run_id)
+    if broadcast_shards.spans_hosts() and await asyncio.to_thread(broadcast_shards.get_plan, run_id):
+        # Hosts without the run in their registry check the shared flag
+        await asyncio.to_thread(broadcast_shards.request_cancel, run_id)
+        if not run:
+            return {"success": True, "message": "Cancellation requested from the hosts working on the run"}
+    if not run:
+        return {"success": False, "error": f"Run {run_id} not found"}
+    return {
+        "success": True,
+        "data": run,
+        "message": "Cancellation requested" if run["cancel_requested"] else f"Run is {run['status']}"
+    }
+
+@app.post("/runs/{run_id}/resume")
+async def resume_run_endpoint(run_id: str, background_tasks: BackgroundTasks):
+    """
+    Resume a failed or cancelled run, or take over one whose worker died.
+    """
+    if not run_registry.get_run(run_id):
+        return {"success": False, "error": f"Run {run_id} not found"}
+
+    run, started = run_registry.claim_run(run_id, resume=True)
+    if started:
+        background_tasks.add_task(run_daily_workflow, run_id)
+    return {
+        "success": started,
+        "data": run,
+        "message": "Run resumed" if started else f"Run is {run['status']}"
+    }
+
+def run_daily_workflow(run_id: Optional[str] = None):
+    """
+    Runs the daily broadcast for a run claimed through run_registry.
+
+    Every farmer handled is checkpointed; when a run is resumed, farmers
+    already checkpointed are skipped so nobody is messaged twice.
+
+    Each stage is timed, and a summary of stage timings and counters is
+    stored with the run (GET /runs/{run_id}/summary) however it ends.
+
+    With BROADCAST_SHARDS set, the farmers are split into shards that
+    every worker can work on: those of this host, or of every host with
+    BROADCAST_SHARD_BACKEND=redis (see run_sharded_workflow).
+
+    Args:
+        run_id: Run owned by this process (claimed here if not given)
+    """
+    if run_id is None:
+        run, started = run_registry.claim_run(run_registry.make_run_id())
+        if not started:
+            logger.info("Daily workflow %s already %s, skipping", run['run_id'], run['status'])
+            return
+        run_id = run["run_id"]
+
+    # Keeps the run's heartbeat fresh through long stages, so no other worker
+    # mistakes this process for a dead owner and broadcasts too
+    with run_registry.hold_lease(run_id):
+        # A run planned in shards stays sharded when it is taken over or resumed
+        if broadcast_shards.SHARD_COUNT > 0 or broadcast_shards.get_plan(run_id):
+            run_sharded_workflow(run_id)
+            return
+
+        logger.info("Starting daily workflow %s", run_id)
+
+        timer = metrics.StageTimer()
+        status = run_registry.STATUS_FAILED
+
+        try:
+            fair_prices, farmers = prepare_broadcast(timer)
+            total = len(farmers)
+            completed = run_registry.completed_farmers(run_id)
+
+            if completed:
+                logger.info("Resuming %s: %d/%d farmers already done", run_id, len(completed), total)
+
+            # Weather for every county with farmers, from the cache in one round trip
+            with timer.stage("weather"):
+                weather_by_county = weather_api.get_weather_many(farmer_county(farmer) for farmer in farmers)
+
+            if not run_registry.heartbeat(run_id, total):
+                status = run_registry.STATUS_CANCELLED
+                run_registry.finish_run(run_id, status)
+                logger.info("Daily workflow %s cancelled", run_id)
+                return
+
+            # 5. Loop through farmers and send messages
+            for farmer in farmers:
+                phone = broadcast_shards.farmer_key(farmer)
+                if phone in completed:
+                    timer.count("farmers_skipped")
+                    continue
+
+                sent = message_farmer(run_id, farmer, fair_prices, weather_by_county, timer)
+
+                completed.add(phone)
+                with timer.stage("checkpoint"):
+                    keep_going = run_registry.checkpoint_farmer(run_id, phone, sent, total)
+                if not keep_going:
+                    status = run_registry.STATUS_CANCELLED
+                    run_registry.finish_run(run_id, status)
+                    logger.info("Daily workflow %s stopped after %d/%d farmers", run_id, len(completed), total)
+                    return
+
+            status = run_registry.STATUS_COMPLETED
+
+        except Exception as e:
+            run_registry.finish_run(run_id, run_registry.STATUS_FAILED, error=str(e))
+            logger.exception("Daily workflow %s failed: %s", run_id, e)
+            return
+        finally:
+            delivery_status.flush()
+            summary = timer.summary()
+            run_registry.save_summary(run_id, status, summary)
+            logger.info(
+                "Daily workflow %s %s in %.1fs", run_id, status, summary["wall_seconds"],
+                extra={"run_id": run_id, "summary": summary}
+            )
+
+        run_registry.finish_run(run_id, run_registry.STATUS_COMPLETED)
+
+def prepare_broadcast(timer: metrics.StageTimer) -> tuple:
+    """
+    The once-per-run stages of the daily broadcast: scrape, Excel, fair
+    prices and the farmer roster.
+
+    Returns:
+        (fair_prices, farmers)
+    """
+    # 1. Scrape KAMIS (force refresh for daily workflow)
+    with timer.stage("scrape"):
+        prices = kamis_scraper.scrape_kamis(force_refresh=True)
+
     # 2. Write to Excel
-    write_excel.write_to_excel(prices)
-    
+    with timer.stage("excel"):
+        write_excel.write_to_excel(prices)
+
     # 3. Calculate Fair Prices
-    fair_prices = price_engine.calculate_fair_prices(prices)
-    
+    with timer.stage("fair_prices"):
+        fair_prices = price_engine.calculate_fair_prices(prices)
+
     # 4. Get Farmers
-    farmers = sheets_logger.get_farmers()
-    
-    # 5. Loop through farmers and send messages
-    for farmer in farmers:
-        county = farmer.get('county', 'Nairobi')
-        phone = farmer.get('phone')
-        name = farmer.get('name')
-        
-        # Fetch weather for farmer's county
-        weather = weather_api.get_weather(county)
-        
-        # Format message
+    with timer.stage("farmers"):
+        farmers = sheets_logger.get_farmers()
+    timer.count("farmers_total", len(farmers))
+    return fair_prices, farmers
+
+def farmer_county(farmer: dict) -> str:
+    # Sheets rows use capitalised headers (Name, Phone, County)
+    return farmer.get('county') or farmer.get('County') or 'Nairobi'
+
+def message_farmer(run_id: str, farmer: dict, fair_prices: dict, weather_by_county: dict,
+                   timer: metrics.StageTimer) -> bool:
+    """
+    Sends one farmer the daily message, records the delivery and logs the
+    activity.
+
+    The conversation state is written before the send, so a reply that
+    arrives right away (or after this worker crashes) finds who the farmer
+    is and which crops they grow.
+
+    Returns:
+        True if the message was sent
+    """
+    county = farmer_county(farmer)
+    phone = broadcast_shards.farmer_key(farmer)
+    name = farmer.get('name') or farmer.get('Name')
+
+    weather = weather_by_county[county]
+    if weather.get('source', '').startswith('Mock'):
+        timer.count("weather_mock")
+
+    # Format message
+    with timer.stage("format"):
         msg = whatsapp_agent.format_daily_message(fair_prices, weather, county)
-        
-        # Send message
-        whatsapp_agent.send_whatsapp_message(phone, msg)
-        
-        # Log
-        sheets_logger.log_activity(
+
+    with timer.stage("conversation_state"):
+        conversation_store.save(phone, {
+            "stage": conversation_store.STAGE_AWAITING_REPLY,
+            "run_id": run_id,
+            "name": name,
+            "county": county,
+            "crops": parse_crops(farmer.get('crops') or farmer.get('Crops'))
+        })
+
+    # Send message
+    with timer.stage("send"):
+        response = whatsapp_agent.send_whatsapp_message(phone, msg)
+    sent = response is not None
+    timer.count("messages_sent" if sent else "messages_failed")
+    message_id = whatsapp_agent.get_message_id(response)
+    if message_id:
+        delivery_status.record_sent(message_id, run_id, phone)
+
+    # Log
+    with timer.stage("sheets_log"):
+        logged = sheets_logger.log_activity(
             farmer_name=name,
             county=county,
             prices_sent=str(fair_prices),
@@ -675,8 +1320,204 @@ def run_daily_workflow():
             farmer_reply="Pending",
             buyer_list_sent="No"
         )
-        
-    print("Daily workflow completed.")
+    if not logged:
+        timer.count("sheets_log_failed")
+    return sent
+
+def run_sharded_workflow(run_id: str):
+    """
+    Plans a sharded broadcast for a run owned by this process, then works
+    on its shards alongside every other worker polling for them.
+
+    Planning (scrape, fair prices, roster, splitting into shards) happens
+    once; a run taken over after planning, or planned by another host,
+    goes straight to the shards.
+
+    Args:
+        run_id: Run owned by this process
+    """
+    if broadcast_shards.get_plan(run_id) is None:
+        logger.info("Planning sharded daily workflow %s", run_id)
+        timer = metrics.StageTimer()
+        try:
+            fair_prices, farmers = prepare_broadcast(timer)
+            if not run_registry.heartbeat(run_id, len(farmers)):
+                run_registry.finish_run(run_id, run_registry.STATUS_CANCELLED)
+                logger.info("Daily workflow %s cancelled", run_id)
+                return
+            with timer.stage("plan"):
+                broadcast_shards.create_plan(run_id, fair_prices, farmers, summary=timer.summary())
+        except Exception as e:
+            run_registry.finish_run(run_id, run_registry.STATUS_FAILED, error=str(e))
+            run_registry.save_summary(run_id, run_registry.STATUS_FAILED, timer.summary())
+            logger.exception("Daily workflow %s failed while planning: %s", run_id, e)
+            return
+
+    work_shards(run_id)
+    if broadcast_shards.spans_hosts():
+        finish_sharded_run(run_id)
+
+def finish_sharded_run(run_id: str):
+    """
+    Waits for a run whose shards are shared with other hosts to close, then
+    closes this host's record of it with the same status and stores the
+    combined summary.
+
+    The last shard may finish on another host, so while waiting this
+    process keeps working on shards that come free (a host died) and
+    forwards a cancellation requested on this host to the other hosts.
+
+    Args:
+        run_id: Run owned by this process
+    """
+    while True:
+        closed = broadcast_shards.closed_status(run_id)
+        if closed:
+            break
+        run = run_registry.get_run(run_id) or {}
+        if run.get("cancel_requested"):
+            broadcast_shards.request_cancel(run_id)
+        time.sleep(broadcast_shards.SHARD_POLL_SECONDS or 5)
+        work_shards(run_id)
+
+    run_registry.finish_run(run_id, closed["status"], closed.get("error"))
+    combined = broadcast_shards.combined_summary(run_id)
+    run_registry.save_summary(run_id, closed["status"], combined)
+    logger.info(
+        "Daily workflow %s %s in %.1fs across %d shards", run_id, closed["status"], combined["wall_seconds"],
+        combined["shards"], extra={"run_id": run_id, "summary": combined}
+    )
+
+def work_shards(run_id: str) -> int:
+    """
+    Claims and sends shards of a sharded run until none is left for this
+    process, or one fails or the run is cancelled.
+
+    Returns:
+        Number of shards this process completed
+    """
+    plan = broadcast_shards.get_plan(run_id)
+    if plan is None:
+        return 0
+
+    done = 0
+    while True:
+        shard = broadcast_shards.claim_shard(run_id)
+        if shard is None or not send_shard(run_id, shard, plan["fair_prices"]):
+            break
+        done += 1
+
+    if broadcast_shards.cancel_if_requested(run_id):
+        logger.info("Daily workflow %s cancelled", run_id)
+    return done
+
+def send_shard(run_id: str, shard: dict, fair_prices: dict) -> bool:
+    """
+    Messages the farmers of a claimed shard, skipping those already
+    checkpointed for the run, and completes the shard. The process that
+    completes the run's last shard stores the run summary.
+
+    Returns:
+        True if the shard was completed; False if it was released
+        (error, cancellation, or its lease was lost)
+    """
+    number = shard["shard"]
+    logger.info("Working on shard %d of %s (%d farmers, attempt %d)", number, run_id,
+                shard["farmer_count"], shard["attempts"])
+
+    timer = metrics.StageTimer()
+    finished = False
+    try:
+        completed = broadcast_shards.completed_farmers(run_id, number)
+        farmers = [farmer for farmer in shard["farmers"] if broadcast_shards.farmer_key(farmer) not in completed]
+        timer.count("farmers_skipped", len(shard["farmers"]) - len(farmers))
+
+        with timer.stage("weather"):
+            weather_by_county = weather_api.get_weather_many(farmer_county(farmer) for farmer in farmers)
+
+        for farmer in farmers:
+            sent = message_farmer(run_id, farmer, fair_prices, weather_by_county, timer)
+            with timer.stage("checkpoint"):
+                keep_going = broadcast_shards.checkpoint(run_id, number, broadcast_shards.farmer_key(farmer), sent)
+            if not keep_going:
+                break
+        else:
+            finished = True
+
+    except Exception as e:
+        logger.exception("Shard %d of %s failed: %s", number, run_id, e)
+        broadcast_shards.release_shard(run_id, number, error=str(e))
+        return False
+    finally:
+        delivery_status.flush()
+
+    if not finished:
+        broadcast_shards.release_shard(run_id, number)
+        logger.info("Stopped shard %d of %s (cancelled or re-queued)", number, run_id)
+        return False
+
+    summary = timer.summary()
+    status = broadcast_shards.complete_shard(run_id, number, summary)
+    logger.info("Finished shard %d of %s in %.1fs", number, run_id, summary["wall_seconds"])
+    # Across hosts, every host that started the run stores the summary (finish_sharded_run)
+    if status and not broadcast_shards.spans_hosts():
+        combined = broadcast_shards.combined_summary(run_id)
+        run_registry.save_summary(run_id, status, combined)
+        logger.info(
+            "Daily workflow %s %s in %.1fs across %d shards", run_id, status, combined["wall_seconds"],
+            combined["shards"], extra={"run_id": run_id, "summary": combined}
+        )
+    return True
+
+def resume_abandoned_run():
+    """
+    Picks up today's run if the worker that owned it has died.
+
+    Called at startup, so restarting the service continues an interrupted
+    broadcast from the first unprocessed farmer.
+    """
+    abandoned = run_registry.find_abandoned_run()
+    if not abandoned:
+        return
+
+    run, started = run_registry.claim_run(abandoned["run_id"])
+    if started:
+        logger.info("Resuming abandoned daily workflow %s (%s/%s done)", run['run_id'], run['processed'], run['total'])
+        run_daily_workflow(run["run_id"])
+
+def warm_caches() -> dict:
+    """
+    Loads the read-only data sets and pre-builds the cached bodies for
+    /api/counties, /api/buyers and, when today's KAMIS prices are already
+    on disk, /api/prices and /api/prices/fair.
+
+    app/prefork.py calls this in the master process, so the workers it
+    forks share the results copy-on-write instead of each building them.
+    Buyers and prices come from the shared snapshots, so a worker warming
+    after another has published maps the file instead of parsing Excel.
+
+    Returns:
+        Seconds spent per data set
+    """
+    timings = {}
+
+    def timed(name, func):
+        started = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            logger.warning("Could not warm %s: %s", name, e)
+        timings[name] = round(time.perf_counter() - started, 3)
+
+    timed("counties", lambda: response_cache.get_or_build(("counties",), "static", build_counties_content))
+    timed("buyers", lambda: response_cache.get_or_build(
+        ("buyers", "", "", ""), buyers_service.get_buyers_version(), build_buyers_content
+    ))
+    version = kamis_scraper.get_cached_prices_version()
+    if version is not None:
+        timed("prices", lambda: response_cache.get_or_build(("prices",), version, build_prices_content))
+        timed("prices_fair", lambda: response_cache.get_or_build(("prices_fair",), version, build_fair_prices_content))
+    return timings
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
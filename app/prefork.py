@@ -0,0 +1,309 @@
+"""
+Pre-fork server - One warm master, workers forked copy-on-write
+
+`uvicorn --workers 4` starts four interpreters that each import pandas,
+gspread and the rest, and each build their own buyers, prices and
+counties caches. Here the master does that once:
+
+1. imports app.main and the heavy dependencies (see lazy_imports)
+2. warms the read-only caches (main.warm_caches)
+3. moves everything into the GC's permanent generation (gc.freeze), so
+   the workers' garbage collections do not write to, and so copy, the
+   shared pages
+4. binds the listening socket and forks the workers, which all accept on it
+
+Workers start with the master's memory shared until they write to it.
+Modules holding connections or threads reset them in the child with
+os.register_at_fork (local_store, http_client, sheets_logger, metrics,
+logging_setup). The master restarts workers that die, forwards SIGTERM and
+SIGINT to them, and logs a memory report (RSS, PSS and private memory per
+process) once the workers are up and on SIGUSR1.
+
+Usage:
+    python -m app.prefork [--host 0.0.0.0] [--port 8000] [--workers 4] [--no-preload]
+
+--no-preload imports and warms in each worker after fork instead, like
+uvicorn --workers, for comparing memory (benchmarks/bench_prefork_memory.py).
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, List, Optional
+
+from app.services import logging_setup
+
+logger = logging.getLogger("app.prefork")
+
+# Heavy dependencies imported by the master so workers share them
+PRELOAD_MODULES = ("pandas", "numpy", "openpyxl", "bs4", "gspread")
+
+# Seconds to wait before logging the memory report (0 disables)
+MEMORY_REPORT_DELAY_SECONDS = float(os.getenv("PREFORK_MEMORY_REPORT_SECONDS", "15"))
+
+# Workers that die within this many seconds of starting are restarted after a pause
+MIN_WORKER_LIFETIME_SECONDS = 5
+
+# How long workers get to finish requests on shutdown before SIGKILL
+GRACEFUL_TIMEOUT_SECONDS = 30
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def preload() -> Dict[str, float]:
+    """
+    Imports the app and its heavy dependencies and warms the caches.
+
+    Returns:
+        Seconds spent per step
+    """
+    import importlib
+
+    timings = {}
+    started = time.perf_counter()
+    from app import main
+    timings["import_app"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    if main.sheets_logger.USE_GOOGLE_AUTH:
+        importlib.import_module("google.oauth2.service_account")
+        importlib.import_module("google.auth.transport.requests")
+    timings["import_dependencies"] = round(time.perf_counter() - started, 3)
+
+    for name, seconds in main.warm_caches().items():
+        timings[f"warm_{name}"] = seconds
+    return timings
+
+
+def memory_info(pid: int) -> Dict[str, int]:
+    """
+    RSS, PSS and shared/private memory of a process in bytes, from
+    /proc/<pid>/smaps_rollup (RSS only where that is unavailable).
+    """
+    info = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if value.strip().endswith("kB"):
+                    info[name.strip()] = int(value.split()[0]) * 1024
+    except OSError:
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                info["Rss"] = int(f.read().split()[1]) * PAGE_SIZE
+        except OSError:
+            return {}
+
+    shared = info.get("Shared_Clean", 0) + info.get("Shared_Dirty", 0)
+    private = info.get("Private_Clean", 0) + info.get("Private_Dirty", 0)
+    return {
+        "rss": info.get("Rss", 0),
+        "pss": info.get("Pss", info.get("Rss", 0)),
+        "shared": shared,
+        "private": private,
+    }
+
+
+def memory_report(pids: Dict[str, int]) -> List[Dict]:
+    """
+    memory_info for each named process, plus a total row (PSS adds up to
+    the memory actually used; RSS double counts shared pages).
+    """
+    rows = []
+    for name, pid in pids.items():
+        info = memory_info(pid)
+        if info:
+            rows.append(dict(info, name=name, pid=pid))
+    rows.append({
+        "name": "total",
+        "pid": None,
+        **{key: sum(row[key] for row in rows) for key in ("rss", "pss", "shared", "private")},
+    })
+    return rows
+
+
+def log_memory_report(pids: Dict[str, int]) -> None:
+    def mb(value):
+        return f"{value / 1024 / 1024:8.1f}"
+
+    lines = [f"{'process':<12}{'pid':>8}{'RSS MB':>10}{'PSS MB':>10}{'shared MB':>11}{'private MB':>12}"]
+    for row in memory_report(pids):
+        lines.append(f"{row['name']:<12}{row['pid'] or '':>8}{mb(row['rss']):>10}{mb(row['pss']):>10}"
+                     f"{mb(row['shared']):>11}{mb(row['private']):>12}")
+    logger.info("Memory report\n%s", "\n".join(lines))
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, preloaded: bool) -> None:
+    """
+    Serves the app on the shared socket until uvicorn is told to stop.
+    """
+    import uvicorn
+
+    # Undo the master's handlers (uvicorn installs its own for SIGTERM and
+    # SIGINT); SIGUSR1 sent to the whole group asks the master for a report
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+
+    if not preloaded:
+        from app import main
+        main.warm_caches()
+    from app.main import app
+
+    config = uvicorn.Config(app, lifespan="on", log_config=None, proxy_headers=True)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Master:
+    """
+    Forks workers, restarts them when they die and stops them on SIGTERM/SIGINT.
+    """
+
+    def __init__(self, sock: socket.socket, workers: int, preloaded: bool):
+        self.sock = sock
+        self.worker_count = workers
+        self.preloaded = preloaded
+        self.workers: Dict[int, float] = {}  # pid -> start time
+        self.stopping = False
+        self.report_requested = False
+
+    def spawn(self) -> int:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.sock, self.preloaded)
+            except BaseException:
+                logger.exception("Worker %d crashed", os.getpid())
+                code = 1
+            finally:
+                logging_setup.shutdown_logging()
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+        logger.info("Started worker %d", pid)
+        return pid
+
+    def _handle_stop(self, signum, frame) -> None:
+        self.stopping = True
+
+    def _handle_report(self, signum, frame) -> None:
+        self.report_requested = True
+
+    def pids(self) -> Dict[str, int]:
+        named = {"master": os.getpid()}
+        for index, pid in enumerate(sorted(self.workers), 1):
+            named[f"worker-{index}"] = pid
+        return named
+
+    def run(self, report_after: float = MEMORY_REPORT_DELAY_SECONDS) -> None:
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGUSR1, self._handle_report)
+
+        for _ in range(self.worker_count):
+            self.spawn()
+        report_at: Optional[float] = time.monotonic() + report_after if report_after > 0 else None
+
+        while not self.stopping:
+            self.reap()
+            if self.stopping:
+                break
+            while len(self.workers) < self.worker_count:
+                self.spawn()
+            if self.report_requested or (report_at is not None and time.monotonic() >= report_at):
+                self.report_requested = False
+                report_at = None
+                log_memory_report(self.pids())
+            time.sleep(0.5)
+
+        self.shutdown()
+
+    def reap(self) -> None:
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.workers.clear()
+                return
+            if pid == 0:
+                return
+            started = self.workers.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            logger.warning("Worker %d exited (status %d), restarting", pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < MIN_WORKER_LIFETIME_SECONDS:
+                # Crashing at startup: do not fork in a tight loop
+                time.sleep(MIN_WORKER_LIFETIME_SECONDS)
+
+    def shutdown(self) -> None:
+        logger.info("Stopping %d workers", len(self.workers))
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.workers.pop(pid, None)
+
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT_SECONDS
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            logger.warning("Worker %d did not stop in time, killing it", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.workers.clear()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "4")))
+    parser.add_argument("--no-preload", action="store_true", help="Import and warm in each worker instead of the master")
+    parser.add_argument("--memory-report-after", type=float, default=MEMORY_REPORT_DELAY_SECONDS,
+                        help="Seconds after start to log the memory report (0: only on SIGUSR1)")
+    args = parser.parse_args(argv)
+
+    logging_setup.configure_logging()
+    preloaded = not args.no_preload
+
+    if preloaded:
+        timings = preload()
+        gc.collect()
+        gc.freeze()
+        logger.info("Preloaded in %.2fs: %s", sum(timings.values()), timings)
+
+    sock = bind_socket(args.host, args.port)
+    logger.info("Listening on %s:%d with %d workers (%s)", args.host, args.port, args.workers,
+                "preloaded" if preloaded else "no preload")
+
+    Master(sock, args.workers, preloaded).run(args.memory_report_after)
+    sock.close()
+    logging_setup.shutdown_logging()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,874 @@
+"""
+Broadcast Shards - The daily broadcast split over many workers
+
+With BROADCAST_SHARDS set, the run's owner does the one-off work
+(scrape, fair prices, roster) and then writes a plan to a shared store:
+the roster split into SHARD_COUNT shards by consistent hashing on the
+farmer's phone number, so a farmer always lands in the same shard, and
+changing the shard count moves only about 1/N of the farmers.
+
+Every process with a shard poller (one per worker, see main.py) then
+claims one pending shard at a time and messages its farmers, renewing its
+claim with every farmer it checkpoints. A shard whose owner stops is
+claimed again by another process. Farmers already checkpointed for the
+run are skipped, so a failed worker only re-queues what it had not yet
+done. A shard that fails SHARD_MAX_ATTEMPTS times is marked failed. The
+process completing the last shard closes the run (completed, or failed if
+any shard failed).
+
+Two stores, picked with BROADCAST_SHARD_BACKEND:
+
+- sqlite (default): tables in the local store, for the workers of one
+  host. Claiming takes the store's write lock, so no two processes get
+  the same shard; a claimed shard is re-queued once its owner's process
+  has exited (run_registry.owner_gone). SQLite in WAL mode cannot be
+  shared by machines, even over a network filesystem.
+- redis: keys on a Redis-protocol server (BROADCAST_SHARD_URL, by default
+  the cache's CACHE_URL), for workers on several hosts. The plan is
+  published with SET NX, so one planner wins. Each claim is a lease,
+  SET NX PX SHARD_LEASE_SECONDS on the shard's lease key, extended
+  (PEXPIRE) by every checkpoint; a shard whose owner dies is re-queued
+  when its lease expires, or straight away if the owner was on the
+  claiming host and has exited. Checkpoints are kept per shard on the
+  server. Every host that started the run waits for the shared run to
+  close before closing its own record of it (see main.finish_sharded_run).
+"""
+import bisect
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set
+
+from app.services import cache, local_store, run_registry
+
+logger = logging.getLogger(__name__)
+
+# Number of shards a run is split into (0 runs the broadcast in one process)
+SHARD_COUNT = int(os.getenv("BROADCAST_SHARDS", "0"))
+
+# Where plans and claims live: sqlite (one host) or redis (several hosts)
+SHARD_BACKEND = os.getenv("BROADCAST_SHARD_BACKEND", "sqlite").lower()
+
+# Redis server for the redis store (defaults to the cache's server)
+SHARD_URL = os.getenv("BROADCAST_SHARD_URL") or cache.CACHE_URL
+
+# Socket timeout for the redis store
+SHARD_TIMEOUT_SECONDS = float(os.getenv("BROADCAST_SHARD_TIMEOUT_SECONDS", "5"))
+
+# A claimed shard whose owner has not checkpointed for this long is
+# re-queued (sqlite: only owners on other hosts; redis: the lease length)
+SHARD_LEASE_SECONDS = int(os.getenv("BROADCAST_SHARD_LEASE_SECONDS", "120"))
+
+# Seconds between each worker checking for shards to claim (0: only the
+# process that planned the run works on it)
+SHARD_POLL_SECONDS = float(os.getenv("BROADCAST_SHARD_POLL_SECONDS", "5"))
+
+# Claims of one shard before it is marked failed
+SHARD_MAX_ATTEMPTS = int(os.getenv("BROADCAST_SHARD_MAX_ATTEMPTS", "3"))
+
+# How long the redis store keeps a run's plan, claims and checkpoints
+SHARD_PLAN_TTL_SECONDS = int(os.getenv("BROADCAST_SHARD_PLAN_TTL_SECONDS", str(3 * 24 * 3600)))
+
+# Points per shard on the hash ring (more points, more even shard sizes)
+RING_REPLICAS = 64
+
+# Shard states
+SHARD_PENDING = "pending"
+SHARD_CLAIMED = "claimed"
+SHARD_COMPLETED = "completed"
+SHARD_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcast_plans (
+    run_id TEXT PRIMARY KEY,
+    shard_count INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    fair_prices TEXT NOT NULL,
+    summary TEXT,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS broadcast_shards (
+    run_id TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    farmers TEXT NOT NULL,
+    farmer_count INTEGER NOT NULL,
+    owner TEXT,
+    heartbeat_at REAL,
+    claimed_at REAL,
+    finished_at REAL,
+    processed INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    summary TEXT,
+    PRIMARY KEY (run_id, shard)
+);
+CREATE INDEX IF NOT EXISTS idx_broadcast_shards_status ON broadcast_shards (status, run_id);
+"""
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping keys to shard numbers.
+    """
+
+    def __init__(self, shard_count: int, replicas: int = RING_REPLICAS):
+        points = sorted(
+            (_hash(f"shard-{shard}-{replica}"), shard)
+            for shard in range(shard_count)
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, key: str) -> int:
+        """
+        The shard owning key: the first ring point at or after the key's hash.
+        """
+        index = bisect.bisect_left(self._hashes, _hash(key))
+        return self._shards[index % len(self._shards)]
+
+
+@lru_cache(maxsize=8)
+def get_ring(shard_count: int) -> HashRing:
+    return HashRing(shard_count)
+
+
+def farmer_key(farmer: Dict) -> str:
+    """
+    The phone number identifying a roster row (Sheets rows use capitalised headers).
+    """
+    return str(farmer.get('phone') or farmer.get('Phone') or '')
+
+
+def partition(farmers: Iterable[Dict], shard_count: int) -> Dict[int, List[Dict]]:
+    """
+    Splits the roster into shards by consistent hashing on phone number.
+
+    Returns:
+        Farmers by shard number (every shard present, possibly empty)
+    """
+    ring = get_ring(shard_count)
+    shards = {shard: [] for shard in range(shard_count)}
+    for farmer in farmers:
+        shards[ring.shard_for(farmer_key(farmer))].append(farmer)
+    return shards
+
+
+def _final_status(failed: int) -> tuple:
+    # (status, error) of a run whose shards are all completed or failed
+    if failed:
+        return run_registry.STATUS_FAILED, f"{failed} shard(s) failed"
+    return run_registry.STATUS_COMPLETED, None
+
+
+class SQLiteShards:
+    """
+    Plans and claims in the local store, shared by the workers of one host.
+    """
+
+    name = "sqlite"
+    spans_hosts = False
+
+    def _ensure_schema(self):
+        local_store.ensure_schema("broadcast_shards", SCHEMA)
+
+    def create_plan(self, run_id: str, fair_prices: Dict, farmers: List[Dict],
+                    shard_count: int, summary: Optional[Dict]) -> None:
+        self._ensure_schema()
+        with local_store.transaction() as conn:
+            exists = conn.execute("SELECT 1 FROM broadcast_plans WHERE run_id = ?", (run_id,)).fetchone()
+            if exists:
+                return
+            conn.execute(
+                """INSERT INTO broadcast_plans (run_id, shard_count, total, fair_prices, summary, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (run_id, shard_count, len(farmers), json.dumps(fair_prices), json.dumps(summary), time.time())
+            )
+            conn.executemany(
+                """INSERT INTO broadcast_shards (run_id, shard, status, farmers, farmer_count)
+                   VALUES (?, ?, ?, ?, ?)""",
+                [
+                    (run_id, shard, SHARD_PENDING if members else SHARD_COMPLETED, json.dumps(members), len(members))
+                    for shard, members in partition(farmers, shard_count).items()
+                ]
+            )
+            logger.info("Planned %s: %d farmers in %d shards", run_id, len(farmers), shard_count)
+
+    def get_plan(self, run_id: str) -> Optional[Dict]:
+        self._ensure_schema()
+        row = local_store.get_connection().execute(
+            "SELECT * FROM broadcast_plans WHERE run_id = ?", (run_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        plan = dict(row)
+        plan["fair_prices"] = json.loads(plan["fair_prices"])
+        plan["summary"] = json.loads(plan["summary"]) if plan["summary"] else None
+        return plan
+
+    @staticmethod
+    def _claimable(row, now: float) -> bool:
+        if row["status"] == SHARD_PENDING:
+            return True
+        return row["status"] == SHARD_CLAIMED and run_registry.owner_gone(
+            row["owner"], row["heartbeat_at"], SHARD_LEASE_SECONDS, now
+        )
+
+    def claim_shard(self, run_id: str) -> Optional[Dict]:
+        self._ensure_schema()
+        now = time.time()
+        me = run_registry.owner_id()
+
+        with local_store.transaction() as conn:
+            run = conn.execute("SELECT status, cancel_requested FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            if run is None or run["status"] != run_registry.STATUS_RUNNING or run["cancel_requested"]:
+                return None
+
+            rows = conn.execute(
+                """SELECT shard, status, owner, heartbeat_at, attempts FROM broadcast_shards
+                   WHERE run_id = ? AND status IN (?, ?) ORDER BY status = ?, shard""",
+                (run_id, SHARD_PENDING, SHARD_CLAIMED, SHARD_CLAIMED)
+            ).fetchall()
+            for row in rows:
+                if not self._claimable(row, now):
+                    continue
+                if row["status"] == SHARD_CLAIMED:
+                    logger.warning("Re-queueing shard %d of %s from %s (owner gone)", row["shard"], run_id, row["owner"])
+                if row["attempts"] >= SHARD_MAX_ATTEMPTS:
+                    conn.execute(
+                        "UPDATE broadcast_shards SET status = ?, finished_at = ? WHERE run_id = ? AND shard = ?",
+                        (SHARD_FAILED, now, run_id, row["shard"])
+                    )
+                    logger.error("Shard %d of %s failed %d times, giving up", row["shard"], run_id, row["attempts"])
+                    continue
+                conn.execute(
+                    """UPDATE broadcast_shards SET status = ?, owner = ?, heartbeat_at = ?, claimed_at = ?,
+                                                   attempts = attempts + 1, error = NULL
+                       WHERE run_id = ? AND shard = ?""",
+                    (SHARD_CLAIMED, me, now, now, run_id, row["shard"])
+                )
+                shard = conn.execute(
+                    "SELECT * FROM broadcast_shards WHERE run_id = ? AND shard = ?", (run_id, row["shard"])
+                ).fetchone()
+                shard = dict(shard)
+                shard["farmers"] = json.loads(shard["farmers"])
+                return shard
+
+            # Shards given up on above may have been the last open ones
+            self._close_if_done(conn, run_id)
+        return None
+
+    def completed_farmers(self, run_id: str, shard: int) -> Set[str]:
+        # The run's checkpoints are kept by run_registry
+        return run_registry.completed_farmers(run_id)
+
+    def checkpoint(self, run_id: str, shard: int, phone: str, sent: bool) -> bool:
+        with local_store.transaction() as conn:
+            row = conn.execute(
+                """SELECT s.owner, s.status, r.cancel_requested FROM broadcast_shards s
+                   JOIN runs r ON r.run_id = s.run_id
+                   WHERE s.run_id = ? AND s.shard = ?""",
+                (run_id, shard)
+            ).fetchone()
+            if row is None or row["owner"] != run_registry.owner_id() or row["status"] != SHARD_CLAIMED:
+                return False
+
+            run_registry.record_checkpoint(conn, run_id, phone, sent)
+            conn.execute(
+                "UPDATE broadcast_shards SET heartbeat_at = ?, processed = processed + 1 WHERE run_id = ? AND shard = ?",
+                (time.time(), run_id, shard)
+            )
+            return not row["cancel_requested"]
+
+    def release_shard(self, run_id: str, shard: int, error: Optional[str]) -> None:
+        with local_store.transaction() as conn:
+            conn.execute(
+                """UPDATE broadcast_shards SET status = ?, owner = NULL, heartbeat_at = NULL, error = ?
+                   WHERE run_id = ? AND shard = ? AND owner = ? AND status = ?""",
+                (SHARD_PENDING, error, run_id, shard, run_registry.owner_id(), SHARD_CLAIMED)
+            )
+
+    def complete_shard(self, run_id: str, shard: int, summary: Dict) -> Optional[str]:
+        with local_store.transaction() as conn:
+            conn.execute(
+                """UPDATE broadcast_shards SET status = ?, finished_at = ?, summary = ?
+                   WHERE run_id = ? AND shard = ? AND owner = ? AND status = ?""",
+                (SHARD_COMPLETED, time.time(), json.dumps(summary), run_id, shard, run_registry.owner_id(), SHARD_CLAIMED)
+            )
+            return self._close_if_done(conn, run_id)
+
+    def _close_if_done(self, conn, run_id: str) -> Optional[str]:
+        counts = {
+            row["status"]: row["shards"]
+            for row in conn.execute(
+                "SELECT status, COUNT(*) AS shards FROM broadcast_shards WHERE run_id = ? GROUP BY status", (run_id,)
+            )
+        }
+        if counts.get(SHARD_PENDING) or counts.get(SHARD_CLAIMED):
+            return None
+
+        status, error = _final_status(counts.get(SHARD_FAILED, 0))
+        if not run_registry.close_run(conn, run_id, status, error):
+            return None
+        return status
+
+    def cancel_if_requested(self, run_id: str) -> bool:
+        with local_store.transaction() as conn:
+            row = conn.execute("SELECT cancel_requested FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            if row is None or not row["cancel_requested"]:
+                return False
+            claimed = conn.execute(
+                "SELECT COUNT(*) AS shards FROM broadcast_shards WHERE run_id = ? AND status = ?", (run_id, SHARD_CLAIMED)
+            ).fetchone()["shards"]
+            if claimed:
+                return False
+            return run_registry.close_run(conn, run_id, run_registry.STATUS_CANCELLED)
+
+    def request_cancel(self, run_id: str) -> None:
+        # The runs table holds the flag the shards check
+        pass
+
+    def closed_status(self, run_id: str) -> Optional[Dict]:
+        run = run_registry.get_run(run_id)
+        if run is None or run["status"] == run_registry.STATUS_RUNNING:
+            return None
+        return {"status": run["status"], "error": run.get("error"), "finished_at": run.get("finished_at")}
+
+    def find_claimable_run(self) -> Optional[str]:
+        self._ensure_schema()
+        now = time.time()
+        rows = local_store.get_connection().execute(
+            """SELECT s.run_id, s.shard, s.status, s.owner, s.heartbeat_at FROM broadcast_shards s
+               JOIN runs r ON r.run_id = s.run_id
+               WHERE s.status IN (?, ?) AND r.status = ? AND r.cancel_requested = 0
+               ORDER BY r.created_at""",
+            (SHARD_PENDING, SHARD_CLAIMED, run_registry.STATUS_RUNNING)
+        ).fetchall()
+        for row in rows:
+            if self._claimable(row, now):
+                return row["run_id"]
+        return None
+
+    def list_shards(self, run_id: str) -> List[Dict]:
+        self._ensure_schema()
+        rows = local_store.get_connection().execute(
+            """SELECT shard, status, farmer_count, owner, heartbeat_at, claimed_at, finished_at,
+                      processed, attempts, error, summary
+               FROM broadcast_shards WHERE run_id = ? ORDER BY shard""",
+            (run_id,)
+        ).fetchall()
+        shards = []
+        for row in rows:
+            shard = dict(row)
+            shard["summary"] = json.loads(shard["summary"]) if shard["summary"] else None
+            shards.append(shard)
+        return shards
+
+    def after_fork(self) -> None:
+        pass
+
+
+class RedisShards:
+    """
+    Plans, leases and checkpoints on a Redis-protocol server, shared by
+    workers on any number of hosts.
+
+    Keys, under CACHE_KEY_PREFIX + "shards:":
+
+        latest                      the last run planned (for pollers)
+        <run>:plan                  plan JSON, written once with SET NX
+        <run>:<token>:farmers:<n>   shard n's farmers (token: the plan's)
+        <run>:lease:<n>             owner of shard n, SET NX PX / PEXPIRE
+        <run>:attempts:<n>          claims of shard n (INCR)
+        <run>:sent:<n>              phones checkpointed in shard n (list)
+        <run>:done:<n>, failed:<n>  how shard n finished, error:<n> its last error
+        <run>:cancel, <run>:closed  cancel request; final status (SET NX)
+    """
+
+    name = "redis"
+    spans_hosts = True
+
+    def __init__(self, url: str = SHARD_URL, timeout: float = SHARD_TIMEOUT_SECONDS):
+        self.client = cache.RedisBackend(url, timeout=timeout)
+        self.prefix = cache.KEY_PREFIX + "shards:"
+        self.ttl_ms = SHARD_PLAN_TTL_SECONDS * 1000
+        self.lease_ms = SHARD_LEASE_SECONDS * 1000
+
+    def _key(self, run_id: str, *parts) -> str:
+        return self.prefix + ":".join([run_id, *map(str, parts)])
+
+    def _shard_keys(self, run_id: str, kind: str, shard_count: int) -> List[str]:
+        return [self._key(run_id, kind, shard) for shard in range(shard_count)]
+
+    def _get_json(self, key: str) -> Optional[Dict]:
+        value = self.client.pipeline([("GET", key)])[0]
+        return json.loads(value) if value is not None else None
+
+    def create_plan(self, run_id: str, fair_prices: Dict, farmers: List[Dict],
+                    shard_count: int, summary: Optional[Dict]) -> None:
+        token = uuid.uuid4().hex[:12]
+        shards = partition(farmers, shard_count)
+        now = time.time()
+
+        # Farmers go under this planner's token first, so the plan never
+        # points at shards that are not written yet
+        self.client.pipeline([
+            ("SET", self._key(run_id, token, "farmers", shard), json.dumps(members), "PX", self.ttl_ms)
+            for shard, members in shards.items()
+        ])
+        plan = {
+            "shard_count": shard_count,
+            "total": len(farmers),
+            "fair_prices": fair_prices,
+            "summary": summary,
+            "created_at": now,
+            "token": token,
+            "counts": [len(shards[shard]) for shard in range(shard_count)],
+        }
+        won = self.client.pipeline([("SET", self._key(run_id, "plan"), json.dumps(plan), "NX", "PX", self.ttl_ms)])[0]
+        if won is None:
+            # Another host planned first: its shards are the run's
+            self.client.pipeline([("DEL", *self._shard_keys(run_id, f"{token}:farmers", shard_count))])
+            return
+
+        finished = json.dumps({"finished_at": now, "summary": None})
+        self.client.pipeline([
+            ("SET", self._key(run_id, "done", shard), finished, "PX", self.ttl_ms)
+            for shard, members in shards.items() if not members
+        ] + [("SET", self.prefix + "latest", run_id, "PX", self.ttl_ms)])
+        logger.info("Planned %s: %d farmers in %d shards (shared)", run_id, len(farmers), shard_count)
+
+    def get_plan(self, run_id: str) -> Optional[Dict]:
+        plan = self._get_json(self._key(run_id, "plan"))
+        if plan is not None:
+            plan["run_id"] = run_id
+        return plan
+
+    def _state(self, run_id: str, shard_count: int) -> Dict[str, List]:
+        # done, failed and lease values of every shard, in one round trip
+        kinds = ("done", "failed", "lease")
+        replies = self.client.pipeline([("MGET", *self._shard_keys(run_id, kind, shard_count)) for kind in kinds])
+        return dict(zip(kinds, replies))
+
+    def _lease_gone(self, run_id: str, shard: int, lease: Optional[bytes]) -> bool:
+        # An unleased shard is free; a lease of a process on this host that
+        # has exited is dropped rather than waited out
+        if lease is None:
+            return True
+        owner = json.loads(lease)["owner"]
+        if run_registry.is_local_owner(owner) and run_registry.owner_exited(owner):
+            key = self._key(run_id, "lease", shard)
+            if self.client.pipeline([("GET", key)])[0] == lease:
+                self.client.pipeline([("DEL", key)])
+                logger.warning("Re-queueing shard %d of %s from %s (owner exited)", shard, run_id, owner)
+            return True
+        return False
+
+    def _open(self, run_id: str) -> bool:
+        flags = self.client.pipeline([("MGET", self._key(run_id, "cancel"), self._key(run_id, "closed"))])[0]
+        return not any(flags)
+
+    def claim_shard(self, run_id: str) -> Optional[Dict]:
+        plan = self.get_plan(run_id)
+        if plan is None or not self._open(run_id):
+            return None
+
+        me = run_registry.owner_id()
+        state = self._state(run_id, plan["shard_count"])
+        for shard in range(plan["shard_count"]):
+            if state["done"][shard] or state["failed"][shard]:
+                continue
+            if not self._lease_gone(run_id, shard, state["lease"][shard]):
+                continue
+
+            now = time.time()
+            lease = json.dumps({"owner": me, "claimed_at": now})
+            lease_key = self._key(run_id, "lease", shard)
+            if self.client.pipeline([("SET", lease_key, lease, "NX", "PX", self.lease_ms)])[0] is None:
+                continue
+            attempts, _ = self.client.pipeline([
+                ("INCR", self._key(run_id, "attempts", shard)),
+                ("PEXPIRE", self._key(run_id, "attempts", shard), self.ttl_ms),
+            ])
+            if attempts > SHARD_MAX_ATTEMPTS:
+                self.client.pipeline([
+                    ("SET", self._key(run_id, "failed", shard), json.dumps({"finished_at": now}), "PX", self.ttl_ms),
+                    ("DEL", lease_key),
+                ])
+                logger.error("Shard %d of %s failed %d times, giving up", shard, run_id, attempts - 1)
+                continue
+            if attempts > 1:
+                logger.warning("Claiming shard %d of %s again (attempt %d)", shard, run_id, attempts)
+
+            farmers = self._get_json(self._key(run_id, plan["token"], "farmers", shard))
+            return {
+                "run_id": run_id,
+                "shard": shard,
+                "status": SHARD_CLAIMED,
+                "farmers": farmers,
+                "farmer_count": len(farmers),
+                "owner": me,
+                "claimed_at": now,
+                "attempts": attempts,
+            }
+
+        # Shards given up on above may have been the last open ones
+        self._close_if_done(run_id, plan["shard_count"])
+        return None
+
+    def completed_farmers(self, run_id: str, shard: int) -> Set[str]:
+        phones = self.client.pipeline([("LRANGE", self._key(run_id, "sent", shard), 0, -1)])[0]
+        return {phone.decode() for phone in phones}
+
+    def _owns(self, lease: Optional[bytes]) -> bool:
+        return lease is not None and json.loads(lease)["owner"] == run_registry.owner_id()
+
+    def checkpoint(self, run_id: str, shard: int, phone: str, sent: bool) -> bool:
+        lease_key = self._key(run_id, "lease", shard)
+        lease, cancel = self.client.pipeline([("MGET", lease_key, self._key(run_id, "cancel"))])[0]
+        if not self._owns(lease):
+            return False
+
+        sent_key = self._key(run_id, "sent", shard)
+        # If the lease expired since the check and another process claimed
+        # the shard, this extends that process's lease, which is harmless
+        self.client.pipeline([
+            ("RPUSH", sent_key, phone),
+            ("PEXPIRE", sent_key, self.ttl_ms),
+            ("PEXPIRE", lease_key, self.lease_ms),
+        ])
+        return cancel is None
+
+    def release_shard(self, run_id: str, shard: int, error: Optional[str]) -> None:
+        lease_key = self._key(run_id, "lease", shard)
+        if not self._owns(self.client.pipeline([("GET", lease_key)])[0]):
+            return
+        commands = [("DEL", lease_key)]
+        if error:
+            commands.append(("SET", self._key(run_id, "error", shard), error, "PX", self.ttl_ms))
+        self.client.pipeline(commands)
+
+    def complete_shard(self, run_id: str, shard: int, summary: Dict) -> Optional[str]:
+        lease_key = self._key(run_id, "lease", shard)
+        lease = self.client.pipeline([("GET", lease_key)])[0]
+        if self._owns(lease):
+            finished = json.dumps({
+                "owner": run_registry.owner_id(),
+                "claimed_at": json.loads(lease)["claimed_at"],
+                "finished_at": time.time(),
+                "summary": summary,
+            })
+            self.client.pipeline([
+                ("SET", self._key(run_id, "done", shard), finished, "PX", self.ttl_ms),
+                ("DEL", lease_key),
+            ])
+        plan = self.get_plan(run_id)
+        return self._close_if_done(run_id, plan["shard_count"]) if plan else None
+
+    def _close(self, run_id: str, status: str, error: Optional[str] = None) -> bool:
+        closed = json.dumps({"status": status, "error": error, "finished_at": time.time()})
+        return self.client.pipeline([("SET", self._key(run_id, "closed"), closed, "NX", "PX", self.ttl_ms)])[0] is not None
+
+    def _close_if_done(self, run_id: str, shard_count: int) -> Optional[str]:
+        state = self._state(run_id, shard_count)
+        if not all(done or failed for done, failed in zip(state["done"], state["failed"])):
+            return None
+        status, error = _final_status(sum(1 for failed in state["failed"] if failed))
+        return status if self._close(run_id, status, error) else None
+
+    def cancel_if_requested(self, run_id: str) -> bool:
+        plan = self.get_plan(run_id)
+        if plan is None or self._open(run_id):
+            return False
+        if self.client.pipeline([("GET", self._key(run_id, "cancel"))])[0] is None:
+            return False
+        if any(self._state(run_id, plan["shard_count"])["lease"]):
+            return False
+        return self._close(run_id, run_registry.STATUS_CANCELLED)
+
+    def request_cancel(self, run_id: str) -> None:
+        self.client.pipeline([("SET", self._key(run_id, "cancel"), "1", "PX", self.ttl_ms)])
+
+    def closed_status(self, run_id: str) -> Optional[Dict]:
+        return self._get_json(self._key(run_id, "closed"))
+
+    def find_claimable_run(self) -> Optional[str]:
+        run_id = self.client.pipeline([("GET", self.prefix + "latest")])[0]
+        if run_id is None:
+            return None
+        run_id = run_id.decode()
+        plan = self.get_plan(run_id)
+        if plan is None or not self._open(run_id):
+            return None
+        state = self._state(run_id, plan["shard_count"])
+        for shard in range(plan["shard_count"]):
+            if not state["done"][shard] and not state["failed"][shard] and self._lease_gone(run_id, shard, state["lease"][shard]):
+                return run_id
+        return None
+
+    def list_shards(self, run_id: str) -> List[Dict]:
+        plan = self.get_plan(run_id)
+        if plan is None:
+            return []
+        count = plan["shard_count"]
+        state = self._state(run_id, count)
+        attempts, errors = self.client.pipeline([
+            ("MGET", *self._shard_keys(run_id, "attempts", count)),
+            ("MGET", *self._shard_keys(run_id, "error", count)),
+        ])
+        replies = self.client.pipeline(
+            [("LLEN", key) for key in self._shard_keys(run_id, "sent", count)]
+            + [("PTTL", key) for key in self._shard_keys(run_id, "lease", count)]
+        )
+        processed, remaining = replies[:count], replies[count:]
+
+        shards = []
+        for shard in range(count):
+            finished = json.loads(state["done"][shard] or state["failed"][shard] or "null") or {}
+            lease = json.loads(state["lease"][shard] or "null") or {}
+            if state["done"][shard]:
+                status = SHARD_COMPLETED
+            elif state["failed"][shard]:
+                status = SHARD_FAILED
+            else:
+                status = SHARD_CLAIMED if lease else SHARD_PENDING
+            heartbeat_at = None
+            if lease and remaining[shard] > 0:
+                # The last renewal set the lease to its full length
+                heartbeat_at = time.time() - (self.lease_ms - remaining[shard]) / 1000
+            shards.append({
+                "shard": shard,
+                "status": status,
+                "farmer_count": plan["counts"][shard],
+                "owner": lease.get("owner") or finished.get("owner"),
+                "heartbeat_at": heartbeat_at,
+                "claimed_at": lease.get("claimed_at") or finished.get("claimed_at"),
+                "finished_at": finished.get("finished_at"),
+                "processed": processed[shard],
+                "attempts": int(attempts[shard] or 0),
+                "error": errors[shard].decode() if errors[shard] else None,
+                "summary": finished.get("summary"),
+            })
+        return shards
+
+    def after_fork(self) -> None:
+        self.client.after_fork()
+
+
+SHARD_BACKENDS = {
+    "sqlite": SQLiteShards,
+    "redis": RedisShards,
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """
+    The process-wide shard store selected by BROADCAST_SHARD_BACKEND.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                try:
+                    _store = SHARD_BACKENDS[SHARD_BACKEND]()
+                except KeyError:
+                    raise ValueError(f"Unknown shard backend {SHARD_BACKEND!r} "
+                                     f"(expected one of {', '.join(SHARD_BACKENDS)})") from None
+    return _store
+
+
+def set_store(store) -> None:
+    """
+    Replaces the process-wide shard store (benchmarks and tools).
+    """
+    global _store
+    _store = store
+
+
+def spans_hosts() -> bool:
+    """
+    True when workers on other hosts may hold the run's shards, so a run
+    can close on another host (see main.finish_sharded_run).
+    """
+    return get_store().spans_hosts
+
+
+def create_plan(run_id: str, fair_prices: Dict, farmers: List[Dict],
+                shard_count: int = SHARD_COUNT, summary: Optional[Dict] = None) -> Dict:
+    """
+    Writes the run's plan and its shards, unless the run already has one
+    (a run taken over after its owner died keeps its shards and progress,
+    and with the redis store the first host to plan wins).
+
+    Args:
+        run_id: Run being planned
+        fair_prices: Prices every shard sends
+        farmers: Today's roster
+        shard_count: Shards to split the roster into
+        summary: Stage summary of the planning work
+
+    Returns:
+        The run's plan (see get_plan)
+    """
+    get_store().create_plan(run_id, fair_prices, farmers, shard_count, summary)
+    return get_plan(run_id)
+
+
+def get_plan(run_id: str) -> Optional[Dict]:
+    """
+    Gets a run's plan: shard count, roster size and fair prices.
+
+    Returns:
+        Plan dictionary or None if the run is not sharded
+    """
+    return get_store().get_plan(run_id)
+
+
+def claim_shard(run_id: str) -> Optional[Dict]:
+    """
+    Claims the next pending shard of a run for this process, or a claimed
+    one whose owner is gone.
+
+    Returns:
+        The shard with its farmers, or None if nothing is left to claim
+    """
+    return get_store().claim_shard(run_id)
+
+
+def completed_farmers(run_id: str, shard: int) -> Set[str]:
+    """
+    Phone numbers already checkpointed that a claim of shard must skip
+    (sqlite: the whole run's; redis: the shard's).
+    """
+    return get_store().completed_farmers(run_id, shard)
+
+
+def checkpoint(run_id: str, shard: int, phone: str, sent: bool) -> bool:
+    """
+    Records a farmer handled by this process's shard and renews its lease.
+
+    Returns:
+        True to continue, False if the run was cancelled or the shard was
+        re-queued to another process
+    """
+    return get_store().checkpoint(run_id, shard, phone, sent)
+
+
+def release_shard(run_id: str, shard: int, error: Optional[str] = None) -> None:
+    """
+    Puts this process's shard back in the queue (after an error or a
+    cancellation), keeping its checkpoints.
+    """
+    get_store().release_shard(run_id, shard, error)
+
+
+def complete_shard(run_id: str, shard: int, summary: Dict) -> Optional[str]:
+    """
+    Marks this process's shard done, and closes the run if it was the
+    last open shard.
+
+    Returns:
+        The run's final status if this call closed it, otherwise None
+    """
+    return get_store().complete_shard(run_id, shard, summary)
+
+
+def cancel_if_requested(run_id: str) -> bool:
+    """
+    Closes a sharded run as cancelled once no process holds a shard.
+
+    Returns:
+        True if the run was closed here
+    """
+    return get_store().cancel_if_requested(run_id)
+
+
+def request_cancel(run_id: str) -> None:
+    """
+    Asks every process working on the run's shards to stop (the redis
+    store; with sqlite, run_registry.request_cancel is enough).
+    """
+    get_store().request_cancel(run_id)
+
+
+def closed_status(run_id: str) -> Optional[Dict]:
+    """
+    How the sharded run ended: status, error and finished_at, or None
+    while it is still open.
+    """
+    return get_store().closed_status(run_id)
+
+
+def find_claimable_run() -> Optional[str]:
+    """
+    The running sharded run with a shard this process could claim, if any.
+    """
+    return get_store().find_claimable_run()
+
+
+def list_shards(run_id: str) -> List[Dict]:
+    """
+    The run's shards with their state, owner and progress (without farmers).
+    """
+    return get_store().list_shards(run_id)
+
+
+def combined_summary(run_id: str) -> Dict:
+    """
+    Stage timings and counters of the planning work and every completed
+    shard added together, with the run's wall time and the processes that
+    worked on it.
+    """
+    plan = get_plan(run_id) or {}
+    run = run_registry.get_run(run_id) or {}
+    shards = list_shards(run_id)
+
+    stages: Dict[str, Dict] = {}
+    counters: Dict[str, int] = {}
+    parts = [plan.get("summary")] + [shard["summary"] for shard in shards]
+    for part in filter(None, parts):
+        for name, stats in part.get("stages", {}).items():
+            total = stages.setdefault(name, {"count": 0, "sum_seconds": 0.0, "max_seconds": 0.0})
+            total["count"] += stats["count"]
+            total["sum_seconds"] = round(total["sum_seconds"] + stats["sum_seconds"], 4)
+            total["max_seconds"] = max(total["max_seconds"], stats["max_seconds"] or 0)
+        for name, value in part.get("counters", {}).items():
+            counters[name] = counters.get(name, 0) + value
+
+    # A host without the run in its registry times it from the shared plan
+    started = run.get("started_at") or plan.get("created_at") or time.time()
+    finished = run.get("finished_at") or max((shard["finished_at"] or 0 for shard in shards), default=0) or time.time()
+    for stats in stages.values():
+        stats["mean_seconds"] = round(stats["sum_seconds"] / stats["count"], 4) if stats["count"] else None
+    return {
+        "wall_seconds": round(finished - started, 3),
+        "stages": stages,
+        "counters": counters,
+        "shards": len(shards),
+        "shards_failed": sum(shard["status"] == SHARD_FAILED for shard in shards),
+        "owners": sorted({shard["owner"] for shard in shards if shard["owner"]}),
+    }
+
+
+def _after_fork() -> None:
+    global _store_lock
+    _store_lock = threading.Lock()
+    if _store is not None:
+        _store.after_fork()
+
+
+os.register_at_fork(after_in_child=_after_fork)
@@ -1,39 +1,206 @@
 """
 Buyers Service - Manages buyer data from Excel file
 """
-import pandas as pd
+from __future__ import annotations
+
+import hashlib
+import logging
+import math
 import os
-from typing import Dict, List, Optional
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from app.services import cache, snapshots
+from app.services.lazy_imports import lazy_module
+
+# Imported on first use (see lazy_imports)
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+logger = logging.getLogger(__name__)
 
 # Path to buyers data
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data")
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data"))
 BUYERS_FILE = os.path.join(DATA_DIR, "buyers.xlsx")
 
+# Normalized buyers are shared by all workers as the "buyers" snapshot,
+# rebuilt when the file changes (see get_buyers_version)
+SNAPSHOT_NAME = "buyers"
 
-def get_all_buyers() -> List[Dict]:
+# Snapshot indexes: the filters below decode only the buyers they return
+SNAPSHOT_INDEXES = {
+    "type": lambda buyer: [buyer.get('Buyer Type') or ''],
+    "county": lambda buyer: [buyer.get('County') or ''],
+    "crop": lambda buyer: [crop.strip() for crop in (buyer.get('Crops Interested') or '').split(',') if crop.strip()],
+}
+
+# Normalized buyers by workbook content, so other nodes with the same file
+# skip parsing it (see cache)
+CACHE_TTL_SECONDS = int(os.getenv("BUYERS_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+buyers_cache = cache.Cache("buyers", ttl=CACHE_TTL_SECONDS)
+
+
+def normalize_value(value: Any) -> Any:
     """
-    Get all buyers from the Excel file.
+    Converts a pandas/numpy cell value to a plain JSON-safe Python value.
+    
+    - NaN / NaT / None -> None
+    - Timestamps and dates -> "YYYY-MM-DD" (ISO datetime if there is a time part)
+    - numpy integers -> int, numpy floats -> float (int if whole, as in the sheet)
+    - numpy bools -> bool
+    
+    Args:
+        value: Cell value from a DataFrame
+        
+    Returns:
+        str, int, float, bool or None
+    """
+    if value is None or isinstance(value, str):
+        return value
+    
+    # numpy scalars (np.float64 subclasses float) -> matching Python type
+    if isinstance(value, np.generic):
+        value = value.item()
+    
+    if isinstance(value, (datetime, date)):
+        if pd.isna(value):
+            return None
+        if isinstance(value, datetime) and (value.hour or value.minute or value.second or value.microsecond):
+            return value.isoformat()
+        return value.strftime("%Y-%m-%d")
+    
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return None
+        if value.is_integer():
+            return int(value)
+        return value
+    
+    if isinstance(value, (int, bool)):
+        return value
+    
+    if pd.isna(value):
+        return None
+    return str(value)
+
+
+def normalize_records(df: pd.DataFrame) -> List[Dict]:
+    """
+    Converts a DataFrame to a list of dictionaries holding only plain
+    Python types, so responses serialize without jsonable_encoder.
     
+    Args:
+        df: DataFrame read from the buyers workbook
+        
     Returns:
         List of buyer dictionaries
     """
+    columns = [str(col) for col in df.columns]
+    return [
+        dict(zip(columns, map(normalize_value, row)))
+        for row in df.itertuples(index=False, name=None)
+    ]
+
+
+def load_buyers_file(path: str = BUYERS_FILE) -> List[Dict]:
+    """
+    Reads and normalizes the buyers workbook.
+    
+    Args:
+        path: Path to the buyers Excel file
+        
+    Returns:
+        List of normalized buyer dictionaries
+    """
+    df = pd.read_excel(path, engine='openpyxl')
+    return normalize_records(df)
+
+
+def get_buyers_snapshot() -> Optional[snapshots.Snapshot]:
+    """
+    The buyers snapshot for the current file.
+    
+    The workbook is read and normalized once per file version, by whichever
+    worker first sees it, and published as a snapshot that every worker
+    maps (see snapshots).
+    
+    Returns:
+        Snapshot, or None when the mock buyers should be used (no file, or
+        it cannot be read)
+    """
     try:
         if not os.path.exists(BUYERS_FILE):
-            print(f"⚠️  Buyers file not found: {BUYERS_FILE}")
-            return get_mock_buyers()
-        
-        # Read Excel file
-        df = pd.read_excel(BUYERS_FILE, engine='openpyxl')
+            logger.warning("Buyers file not found: %s", BUYERS_FILE, extra={"sample_every": 100})
+            return None
         
-        # Convert to list of dictionaries
-        buyers = df.to_dict('records')
-        
-        print(f"✅ Loaded {len(buyers)} buyers from Excel")
-        return buyers
+        return snapshots.get(SNAPSHOT_NAME, get_buyers_version(), build_buyers_snapshot, SNAPSHOT_INDEXES)
         
     except Exception as e:
-        print(f"❌ Error reading buyers file: {e}")
+        logger.error("Error reading buyers file: %s", e)
+        return None
+
+
+def get_all_buyers() -> List[Dict]:
+    """
+    Get all buyers from the Excel file.
+    
+    Every buyer is decoded from the snapshot on each call; prefer the
+    filtered lookups below, which decode only the buyers they return.
+    
+    Returns:
+        List of buyer dictionaries
+    """
+    snapshot = get_buyers_snapshot()
+    if snapshot is None:
         return get_mock_buyers()
+    return snapshot.records()
+
+
+def select_buyers(index: str, match: Callable[[str], bool]) -> List[Dict]:
+    """
+    Buyers filed under the keys of a snapshot index that match accepts.
+    
+    Args:
+        index: Name in SNAPSHOT_INDEXES
+        match: Called with each key (as it appears in the sheet)
+        
+    Returns:
+        Matching buyers, in sheet order
+    """
+    snapshot = get_buyers_snapshot()
+    if snapshot is None:
+        keys_of = SNAPSHOT_INDEXES[index]
+        return [buyer for buyer in get_mock_buyers() if any(match(key) for key in keys_of(buyer))]
+    return snapshot.lookup(index, match)
+
+
+def build_buyers_snapshot() -> List[Dict]:
+    """
+    Reads the buyers workbook for a new snapshot, or takes its records
+    from the shared cache when a node has already parsed the same file.
+    
+    Returns:
+        List of normalized buyer dictionaries
+    """
+    with open(BUYERS_FILE, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:32]
+    buyers = buyers_cache.get_or_set("records", load_buyers_file, version=digest)
+    logger.info("Loaded %d buyers from Excel", len(buyers))
+    return buyers
+
+
+def get_buyers_version() -> tuple:
+    """
+    Identifies the current buyer data without reading it.
+    
+    Returns:
+        (mtime_ns, size) of the buyers file, or ("mock",) when the file is missing
+    """
+    try:
+        stat = os.stat(BUYERS_FILE)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return ("mock",)
 
 
 def get_buyers_by_type(buyer_type: str) -> List[Dict]:
@@ -46,15 +213,10 @@ def get_buyers_by_type(buyer_type: str) -> List[Dict]:
     Returns:
         List of buyers matching the type
     """
-    all_buyers = get_all_buyers()
-    
     # Filter by type (case-insensitive)
-    filtered = [
-        buyer for buyer in all_buyers 
-        if buyer.get('Buyer Type', '').lower() == buyer_type.lower()
-    ]
+    filtered = select_buyers("type", lambda key: key.lower() == buyer_type.lower())
     
-    print(f"🔍 Found {len(filtered)} buyers of type '{buyer_type}'")
+    logger.debug("Found %d buyers of type '%s'", len(filtered), buyer_type)
     return filtered
 
 
@@ -68,15 +230,10 @@ def get_buyers_by_county(county: str) -> List[Dict]:
     Returns:
         List of buyers in that county
     """
-    all_buyers = get_all_buyers()
-    
     # Filter by county (case-insensitive)
-    filtered = [
-        buyer for buyer in all_buyers 
-        if buyer.get('County', '').lower() == county.lower()
-    ]
+    filtered = select_buyers("county", lambda key: key.lower() == county.lower())
     
-    print(f"🔍 Found {len(filtered)} buyers in '{county}'")
+    logger.debug("Found %d buyers in '%s'", len(filtered), county)
     return filtered
 
 
@@ -90,15 +247,10 @@ def get_buyers_by_crop(crop: str) -> List[Dict]:
     Returns:
         List of buyers interested in that crop
     """
-    all_buyers = get_all_buyers()
+    # Filter by crop interest (case-insensitive, partial match on each crop listed)
+    filtered = select_buyers("crop", lambda key: crop.strip().lower() in key.lower())
     
-    # Filter by crop interest (case-insensitive, partial match)
-    filtered = [
-        buyer for buyer in all_buyers 
-        if crop.lower() in buyer.get('Crops Interested', '').lower()
-    ]
-    
-    print(f"🔍 Found {len(filtered)} buyers interested in '{crop}'")
+    logger.debug("Found %d buyers interested in '%s'", len(filtered), crop)
     return filtered
 
 
@@ -112,15 +264,17 @@ def get_buyer_by_id(buyer_id: str) -> Optional[Dict]:
     Returns:
         Buyer dictionary or None if not found
     """
-    all_buyers = get_all_buyers()
-    
-    for buyer in all_buyers:
-        if buyer.get('Buyer ID') == buyer_id:
-            print(f"✅ Found buyer: {buyer.get('Buyer Name')}")
-            return buyer
-    
-    print(f"❌ Buyer not found: {buyer_id}")
-    return None
+    snapshot = get_buyers_snapshot()
+    if snapshot is None:
+        buyer = next((buyer for buyer in get_mock_buyers() if buyer.get('Buyer ID') == buyer_id), None)
+    else:
+        buyer = snapshot.find('Buyer ID', buyer_id)
+    
+    if buyer is None:
+        logger.debug("Buyer not found: %s", buyer_id)
+    else:
+        logger.debug("Found buyer: %s", buyer.get('Buyer Name'))
+    return buyer
 
 
 def get_buyer_types() -> List[str]:
@@ -130,10 +284,10 @@ def get_buyer_types() -> List[str]:
     Returns:
         List of buyer type strings
     """
-    all_buyers = get_all_buyers()
-    types = list(set(buyer.get('Buyer Type', '') for buyer in all_buyers))
-    types.sort()
-    return types
+    snapshot = get_buyers_snapshot()
+    if snapshot is None:
+        return sorted(set(buyer.get('Buyer Type') or '' for buyer in get_mock_buyers()))
+    return snapshot.keys("type")
 
 
 def get_buyer_counties() -> List[str]:
@@ -143,10 +297,10 @@ def get_buyer_counties() -> List[str]:
     Returns:
         List of county strings
     """
-    all_buyers = get_all_buyers()
-    counties = list(set(buyer.get('County', '') for buyer in all_buyers))
-    counties.sort()
-    return counties
+    snapshot = get_buyers_snapshot()
+    if snapshot is None:
+        return sorted(set(buyer.get('County') or '' for buyer in get_mock_buyers()))
+    return snapshot.keys("county")
 
 
 def get_mock_buyers() -> List[Dict]:
@@ -238,7 +392,7 @@ def get_buyers_by_commodity(county: str = "Nairobi", limit_per_crop: int = 2) ->
     # For each crop, find buyers interested in it
     for crop_name in crops.keys():
         for buyer in nairobi_buyers:
-            crops_interested = buyer.get('Crops Interested', '')
+            crops_interested = buyer.get('Crops Interested') or ''
             
             # Check if buyer is interested in this crop
             if crop_name.lower() in crops_interested.lower() or \
@@ -248,9 +402,10 @@ def get_buyers_by_commodity(county: str = "Nairobi", limit_per_crop: int = 2) ->
                 if len(crops[crop_name]) < limit_per_crop:
                     crops[crop_name].append(buyer)
     
-    print(f"📊 Organized buyers by commodity for {county}:")
-    for crop, buyers in crops.items():
-        print(f"   {crop}: {len(buyers)} buyers")
+    logger.debug(
+        "Organized buyers by commodity for %s: %s",
+        county, {crop: len(buyers) for crop, buyers in crops.items()}
+    )
     
     return crops
 
@@ -277,7 +432,7 @@ def get_buyer_stats() -> Dict:
         county_counts[county] = county_counts.get(county, 0) + 1
     
     # Calculate total weekly volume
-    total_volume = sum(buyer.get('Weekly Volume (kg)', 0) for buyer in all_buyers)
+    total_volume = sum(buyer.get('Weekly Volume (kg)') or 0 for buyer in all_buyers)
     
     # Count active buyers
     active_count = sum(1 for buyer in all_buyers if buyer.get('Status') == 'Active')
@@ -0,0 +1,493 @@
+"""
+Cache - Shared key/value cache for prices, weather and buyers
+
+One interface over three backends, picked with CACHE_BACKEND:
+
+- memory: a dict in each process (the default; nothing is shared)
+- sqlite: a table in the local store, shared by the workers on one machine
+- redis: any server speaking the Redis protocol (CACHE_URL), shared by
+  every node behind the load balancer. The client is built in, so no
+  redis package is needed; benchmarks/fake_redis.py is a local stand-in
+  server for trying it out.
+
+Callers use a Cache per data set:
+
+    weather_cache = cache.Cache("weather", ttl=1800)
+    weather_cache.get_many(["Nairobi", "Kisumu"], version="2025-11-21")
+
+Keys are versioned: the version becomes part of the stored key, so new
+data never reads an old entry, and old entries simply expire. Values are
+stored as JSON. Every lookup counts towards cache_requests_total under
+the cache's name.
+
+The cache is an optimization: when the backend is down, lookups miss and
+writes are dropped (logged, and counted in cache_errors_total) instead
+of failing the request.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+from app.services import local_store, metrics
+
+logger = logging.getLogger(__name__)
+
+# Backend: memory, sqlite or redis
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+
+# Redis server for the redis backend, e.g. redis://:password@10.0.0.5:6379/0
+CACHE_URL = os.getenv("CACHE_URL", "redis://127.0.0.1:6379/0")
+
+# Prepended to every key, so deployments can share one server
+KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "agrosoko:")
+
+# Socket timeout for the redis backend; a slow cache is treated as a miss
+TIMEOUT_SECONDS = float(os.getenv("CACHE_TIMEOUT_SECONDS", "0.5"))
+
+# Entries kept by the memory backend per process
+MEMORY_MAX_ENTRIES = int(os.getenv("CACHE_MEMORY_MAX_ENTRIES", "10000"))
+
+# Keys per SQLite statement or Redis command in bulk operations
+BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires_at REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_cache_entries_expires ON cache_entries (expires_at);
+"""
+
+
+class CacheError(Exception):
+    """
+    Raised by a backend that cannot reach its storage.
+    """
+
+
+def _batches(items: List, size: int = BATCH_SIZE) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class MemoryBackend:
+    """
+    Per-process LRU dict with expiry times.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = MEMORY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Optional[float], bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                expires_at, value = entry
+                if expires_at is not None and expires_at <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, items: Dict[str, bytes], ttl: Optional[float]) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys: List[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+
+class SQLiteBackend:
+    """
+    cache_entries table in the local store, shared by this machine's workers.
+    """
+
+    name = "sqlite"
+
+    def __init__(self):
+        local_store.ensure_schema("cache", SCHEMA)
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        conn = local_store.get_connection()
+        now = time.time()
+        found = {}
+        for batch in _batches(keys):
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, value FROM cache_entries WHERE key IN ({placeholders}) "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (*batch, now),
+            )
+            found.update((row["key"], bytes(row["value"])) for row in rows)
+        return found
+
+    def set_many(self, items: Dict[str, bytes], ttl: Optional[float]) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with local_store.transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                [(key, value, expires_at) for key, value in items.items()],
+            )
+            conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+
+    def delete_many(self, keys: List[str]) -> None:
+        with local_store.transaction() as conn:
+            for batch in _batches(keys):
+                placeholders = ",".join("?" * len(batch))
+                conn.execute(f"DELETE FROM cache_entries WHERE key IN ({placeholders})", batch)
+
+    def clear(self) -> None:
+        with local_store.transaction() as conn:
+            conn.execute("DELETE FROM cache_entries")
+
+    def after_fork(self) -> None:
+        # local_store resets its own connections
+        pass
+
+
+class RedisBackend:
+    """
+    Minimal Redis protocol (RESP2) client: one connection per thread,
+    commands pipelined for bulk operations.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = CACHE_URL, timeout: float = TIMEOUT_SECONDS):
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"Unsupported cache URL scheme: {parsed.scheme!r}")
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = (sock, sock.makefile("rb"))
+        self._local.conn = conn
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", str(self.db)))
+        if setup:
+            self._pipeline(setup)
+        return conn
+
+    def _close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            sock, reader = conn
+            reader.close()
+            sock.close()
+
+    @staticmethod
+    def _encode(command: Tuple) -> bytes:
+        parts = [b"*%d\r\n" % len(command)]
+        for arg in command:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    @classmethod
+    def _read_reply(cls, reader):
+        line = reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise CacheError("Connection closed by the cache server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return CacheError(rest.decode(errors="replace"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            if len(data) != length + 2:
+                raise CacheError("Connection closed by the cache server")
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            if length < 0:
+                return None
+            return [cls._read_reply(reader) for _ in range(length)]
+        raise CacheError(f"Unexpected reply from the cache server: {line[:40]!r}")
+
+    def _pipeline(self, commands: List[Tuple]) -> List:
+        """
+        Sends commands in one write and reads one reply per command.
+        """
+        conn = getattr(self._local, "conn", None)
+        try:
+            if conn is None:
+                conn = self._connect()
+            sock, reader = conn
+            sock.sendall(b"".join(self._encode(command) for command in commands))
+            replies = [self._read_reply(reader) for _ in commands]
+        except (OSError, CacheError, ValueError) as e:
+            # The connection may be mid-reply: never reuse it
+            self._close()
+            raise CacheError(f"{self.host}:{self.port}: {e}") from e
+        for reply in replies:
+            if isinstance(reply, CacheError):
+                raise reply
+        return replies
+
+    def pipeline(self, commands: List[Tuple]) -> List:
+        """
+        Runs raw commands in one round trip, for modules that coordinate
+        through the server rather than cache through it (broadcast_shards).
+
+        Returns:
+            One reply per command
+
+        Raises:
+            CacheError: if the server cannot be reached or rejects a command
+        """
+        return self._pipeline(commands)
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        found = {}
+        batches = list(_batches(keys))
+        replies = self._pipeline([("MGET", *batch) for batch in batches])
+        for batch, values in zip(batches, replies):
+            found.update((key, value) for key, value in zip(batch, values) if value is not None)
+        return found
+
+    def set_many(self, items: Dict[str, bytes], ttl: Optional[float]) -> None:
+        expiry = ("PX", max(1, int(ttl * 1000))) if ttl else ()
+        commands = [("SET", key, value, *expiry) for key, value in items.items()]
+        for batch in _batches(commands):
+            self._pipeline(batch)
+
+    def delete_many(self, keys: List[str]) -> None:
+        self._pipeline([("DEL", *batch) for batch in _batches(keys)])
+
+    def clear(self) -> None:
+        """
+        Deletes this deployment's keys (those starting with KEY_PREFIX).
+        """
+        cursor = "0"
+        while True:
+            cursor, keys = self._pipeline([("SCAN", cursor, "MATCH", KEY_PREFIX + "*", "COUNT", BATCH_SIZE)])[0]
+            if keys:
+                self._pipeline([("DEL", *keys)])
+            cursor = cursor.decode()
+            if cursor == "0":
+                return
+
+    def ping(self) -> bool:
+        return self._pipeline([("PING",)])[0] == "PONG"
+
+    def after_fork(self) -> None:
+        # The parent's sockets must not be shared with the child
+        self._local = threading.local()
+
+
+BACKENDS = {
+    "memory": MemoryBackend,
+    "sqlite": SQLiteBackend,
+    "redis": RedisBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(name: str = CACHE_BACKEND):
+    """
+    Creates a backend by name (memory, sqlite or redis).
+    """
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown cache backend {name!r} (expected one of {', '.join(BACKENDS)})") from None
+
+
+def get_backend():
+    """
+    The process-wide backend selected by CACHE_BACKEND.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+                logger.info("Using %s cache backend", _backend.name)
+    return _backend
+
+
+def set_backend(backend) -> None:
+    """
+    Replaces the process-wide backend (benchmarks and tools).
+    """
+    global _backend
+    _backend = backend
+
+
+def _json_default(value):
+    # numpy scalars and the like
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+class Cache:
+    """
+    A named set of versioned entries with a default TTL.
+    """
+
+    def __init__(self, name: str, ttl: Optional[float] = None, backend=None):
+        """
+        Args:
+            name: Cache name, part of every key and the metric label
+            ttl: Default seconds entries live (None: until evicted)
+            backend: Backend to use instead of the process-wide one
+        """
+        self.name = name
+        self.ttl = ttl
+        self._backend = backend
+
+    @property
+    def backend(self):
+        return self._backend or get_backend()
+
+    def make_key(self, key: Hashable, version: Hashable = None) -> str:
+        return f"{KEY_PREFIX}{self.name}:{'' if version is None else version}:{key}"
+
+    def get_many(self, keys: Iterable[Hashable], version: Hashable = None) -> Dict[Hashable, Any]:
+        """
+        Looks up several keys in one round trip.
+
+        Args:
+            keys: Keys to look up
+            version: Data version the entries must have been stored with
+
+        Returns:
+            Found entries by key (missing and expired keys are left out)
+        """
+        stored = {self.make_key(key, version): key for key in keys}
+        if not stored:
+            return {}
+        backend = self.backend
+        try:
+            raw = backend.get_many(list(stored))
+        except (CacheError, OSError, ValueError) as e:
+            metrics.increment("cache_errors_total", cache=self.name, backend=backend.name)
+            logger.warning("Cache %s lookup failed: %s", self.name, e, extra={"sample_every": 100})
+            raw = {}
+
+        found = {}
+        for stored_key, value in raw.items():
+            try:
+                found[stored[stored_key]] = json.loads(value)
+            except ValueError:
+                continue
+        hits = len(found)
+        if hits:
+            metrics.increment("cache_requests_total", hits, cache=self.name, result="hit")
+        if len(stored) > hits:
+            metrics.increment("cache_requests_total", len(stored) - hits, cache=self.name, result="miss")
+        return found
+
+    def get(self, key: Hashable, version: Hashable = None, default: Any = None) -> Any:
+        return self.get_many([key], version).get(key, default)
+
+    def set_many(self, items: Dict[Hashable, Any], version: Hashable = None, ttl: Optional[float] = None) -> None:
+        """
+        Stores several entries in one round trip.
+
+        Args:
+            items: Values (JSON-serializable) by key
+            version: Data version the values belong to
+            ttl: Seconds the entries live (default: the cache's TTL)
+        """
+        if not items:
+            return
+        encoded = {
+            self.make_key(key, version): json.dumps(
+                value, ensure_ascii=False, default=_json_default, separators=(",", ":")
+            ).encode("utf-8")
+            for key, value in items.items()
+        }
+        backend = self.backend
+        try:
+            backend.set_many(encoded, ttl if ttl is not None else self.ttl)
+        except (CacheError, OSError, ValueError) as e:
+            metrics.increment("cache_errors_total", cache=self.name, backend=backend.name)
+            logger.warning("Cache %s write failed: %s", self.name, e, extra={"sample_every": 100})
+
+    def set(self, key: Hashable, value: Any, version: Hashable = None, ttl: Optional[float] = None) -> None:
+        self.set_many({key: value}, version, ttl)
+
+    def delete(self, key: Hashable, version: Hashable = None) -> None:
+        backend = self.backend
+        try:
+            backend.delete_many([self.make_key(key, version)])
+        except (CacheError, OSError, ValueError) as e:
+            metrics.increment("cache_errors_total", cache=self.name, backend=backend.name)
+            logger.warning("Cache %s delete failed: %s", self.name, e, extra={"sample_every": 100})
+
+    def get_or_set(self, key: Hashable, build: Callable[[], Any], version: Hashable = None,
+                   ttl: Optional[float] = None) -> Any:
+        """
+        Returns the cached value, or builds and stores it. A build returning
+        None is not cached.
+        """
+        found = self.get_many([key], version)
+        if key in found:
+            return found[key]
+        value = build()
+        if value is not None:
+            self.set(key, value, version, ttl)
+        return value
+
+
+def _after_fork() -> None:
+    global _backend_lock
+    _backend_lock = threading.Lock()
+    if _backend is not None:
+        _backend.after_fork()
+
+
+os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,203 @@
+"""
+Conversation Store - Per-phone state for multi-step WhatsApp conversations
+
+The broadcast records who each farmer is (name, county, crops) and which
+run messaged them; reply handlers read and update that state instead of
+re-reading the Farmers and Buyers sheets on every message.
+
+State is written through to SQLite so every worker sees the same
+conversation. Each process keeps decoded copies in memory; a lookup only
+checks the row's version in SQLite and reuses the decoded copy if it
+still matches.
+
+States are keyed by normalize_phone(), so the roster's "0712 345 678" and
+WhatsApp's "254712345678" reach the same conversation.
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from app.services import local_store
+
+# Conversations expire after this long without an update
+TTL_SECONDS = int(os.getenv("CONVERSATION_TTL_SECONDS", str(24 * 3600)))
+
+# Decoded states kept in memory per process
+MEMORY_SIZE = int(os.getenv("CONVERSATION_MEMORY_SIZE", "50000"))
+
+# Prefix replacing the leading 0 of national numbers (07..., 01...)
+COUNTRY_CODE = os.getenv("PHONE_COUNTRY_CODE", "254")
+
+# Conversation stages
+STAGE_AWAITING_REPLY = "awaiting_reply"
+STAGE_AWAITING_CROP = "awaiting_crop"
+STAGE_DONE = "done"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    phone TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_conversations_expires ON conversations (expires_at);
+"""
+
+# phone -> (updated_at, expires_at, state)
+_memory: Dict[str, Tuple[float, float, Dict]] = {}
+_lock = threading.Lock()
+
+
+def normalize_phone(phone) -> str:
+    """
+    Canonical form of a phone number: digits only, with the country code.
+
+    "+254 712 345 678", "0712345678" and "254712345678" all give
+    "254712345678".
+
+    Args:
+        phone: Number from the Farmers sheet or WhatsApp's "from" field
+
+    Returns:
+        Normalized number ("" if it has no digits)
+    """
+    digits = "".join(ch for ch in str(phone or "") if ch.isdigit())
+    if len(digits) == 10 and digits.startswith("0"):
+        digits = COUNTRY_CODE + digits[1:]
+    return digits
+
+
+def _ensure_schema():
+    local_store.ensure_schema("conversation_store", SCHEMA)
+
+
+def _remember(phone: str, updated_at: float, expires_at: float, state: Dict) -> None:
+    with _lock:
+        if len(_memory) >= MEMORY_SIZE and phone not in _memory:
+            evict_expired()
+            if len(_memory) >= MEMORY_SIZE:
+                # Still full: drop the oldest insertion
+                _memory.pop(next(iter(_memory)))
+        _memory[phone] = (updated_at, expires_at, state)
+
+
+def evict_expired() -> int:
+    """
+    Drops expired conversations from memory (caller may hold the lock).
+
+    Returns:
+        Number of entries removed
+    """
+    now = time.time()
+    expired = [phone for phone, (_, expires_at, _) in list(_memory.items()) if expires_at <= now]
+    for phone in expired:
+        _memory.pop(phone, None)
+    return len(expired)
+
+
+def get(phone: str) -> Optional[Dict]:
+    """
+    Gets the current conversation state for a phone number.
+
+    Args:
+        phone: Farmer's phone number as sent by WhatsApp
+
+    Returns:
+        State dictionary (a copy), or None if there is no live conversation
+    """
+    _ensure_schema()
+    phone = normalize_phone(phone)
+    now = time.time()
+    row = local_store.get_connection().execute(
+        "SELECT updated_at, expires_at FROM conversations WHERE phone = ?", (phone,)
+    ).fetchone()
+    if row is None or row["expires_at"] <= now:
+        with _lock:
+            _memory.pop(phone, None)
+        return None
+
+    cached = _memory.get(phone)
+    if cached is not None and cached[0] == row["updated_at"]:
+        return dict(cached[2])
+
+    row = local_store.get_connection().execute(
+        "SELECT state, updated_at, expires_at FROM conversations WHERE phone = ?", (phone,)
+    ).fetchone()
+    if row is None:
+        return None
+    state = json.loads(row["state"])
+    _remember(phone, row["updated_at"], row["expires_at"], state)
+    return dict(state)
+
+
+def save(phone: str, state: Dict) -> None:
+    """
+    Replaces the conversation state for a phone number.
+
+    Args:
+        phone: Farmer's phone number
+        state: JSON-serializable state
+    """
+    set_many([(phone, state)])
+
+
+def update(phone: str, **changes) -> Dict:
+    """
+    Merges changes into the phone's state (creating it if needed).
+
+    Returns:
+        The new state
+    """
+    state = get(phone) or {}
+    state.update(changes)
+    save(phone, state)
+    return state
+
+
+def set_many(items: Iterable[Tuple[str, Dict]]) -> int:
+    """
+    Writes several conversation states in one transaction.
+
+    Args:
+        items: (phone, state) pairs; phones in any format normalize_phone() accepts
+
+    Returns:
+        Number of states written
+    """
+    _ensure_schema()
+    now = time.time()
+    expires_at = now + TTL_SECONDS
+    rows = [(normalize_phone(phone), json.dumps(state), now, expires_at) for phone, state in items]
+    rows = [row for row in rows if row[0]]
+    if not rows:
+        return 0
+
+    with local_store.transaction() as conn:
+        conn.executemany(
+            """INSERT INTO conversations (phone, state, updated_at, expires_at) VALUES (?, ?, ?, ?)
+               ON CONFLICT (phone) DO UPDATE SET
+                   state = excluded.state, updated_at = excluded.updated_at, expires_at = excluded.expires_at""",
+            rows
+        )
+
+    for phone, state_json, updated_at, row_expires_at in rows:
+        _remember(phone, updated_at, row_expires_at, json.loads(state_json))
+    return len(rows)
+
+
+def purge_expired() -> int:
+    """
+    Deletes expired conversations from SQLite and memory.
+
+    Returns:
+        Number of rows deleted from SQLite
+    """
+    _ensure_schema()
+    cursor = local_store.get_connection().execute(
+        "DELETE FROM conversations WHERE expires_at <= ?", (time.time(),)
+    )
+    with _lock:
+        evict_expired()
+    return cursor.rowcount
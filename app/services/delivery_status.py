@@ -0,0 +1,223 @@
+"""
+Delivery Status - Tracks what happened to each outgoing WhatsApp message
+
+One compact row per message ID holds the sent, delivered, read and failed
+times. Rows come from two places: the broadcast loop (when the Graph API
+accepts a message) and status events on /webhook. Both are buffered in
+memory and written in batches, so neither path pays for a database write
+per message.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from app.services import local_store
+from app.services.metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+# Buffered events are written when this many are waiting...
+BATCH_SIZE = int(os.getenv("DELIVERY_STATUS_BATCH_SIZE", "200"))
+
+# ...or when the oldest has waited this long (checked by flush_if_due)
+FLUSH_INTERVAL_SECONDS = float(os.getenv("DELIVERY_STATUS_FLUSH_SECONDS", "2"))
+
+# WhatsApp status names mapped to their timestamp columns
+STATUS_COLUMNS = {
+    "sent": "sent_at",
+    "delivered": "delivered_at",
+    "read": "read_at",
+    "failed": "failed_at",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS message_status (
+    message_id TEXT PRIMARY KEY,
+    run_id TEXT,
+    phone TEXT,
+    sent_at REAL,
+    delivered_at REAL,
+    read_at REAL,
+    failed_at REAL,
+    error_code INTEGER
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_message_status_run ON message_status (run_id);
+"""
+
+# Columns keep the first time seen; run_id/phone/error fill in when known
+UPSERT_SQL = """
+INSERT INTO message_status (message_id, run_id, phone, sent_at, delivered_at, read_at, failed_at, error_code)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (message_id) DO UPDATE SET
+    run_id = COALESCE(message_status.run_id, excluded.run_id),
+    phone = COALESCE(message_status.phone, excluded.phone),
+    sent_at = COALESCE(message_status.sent_at, excluded.sent_at),
+    delivered_at = COALESCE(message_status.delivered_at, excluded.delivered_at),
+    read_at = COALESCE(message_status.read_at, excluded.read_at),
+    failed_at = COALESCE(message_status.failed_at, excluded.failed_at),
+    error_code = COALESCE(excluded.error_code, message_status.error_code)
+"""
+
+_buffer: List[tuple] = []
+_buffer_lock = threading.Lock()
+_oldest_buffered_at: Optional[float] = None
+
+
+def _add(rows: Iterable[tuple]) -> None:
+    global _oldest_buffered_at
+    with _buffer_lock:
+        before = len(_buffer)
+        _buffer.extend(rows)
+        if before == 0 and _buffer:
+            _oldest_buffered_at = time.monotonic()
+        full = len(_buffer) >= BATCH_SIZE
+    if full:
+        flush()
+
+
+def record_sent(message_id: str, run_id: Optional[str], phone: Optional[str], sent_at: Optional[float] = None) -> None:
+    """
+    Buffers a message accepted by the Graph API.
+
+    Args:
+        message_id: WhatsApp message ID (wamid) from the send response
+        run_id: Broadcast run the message belongs to (None for replies)
+        phone: Recipient phone number
+        sent_at: Unix time the message was accepted (default: now)
+    """
+    sent_at = sent_at or time.time()
+    _add([(message_id, run_id, phone, sent_at, None, None, None, None)])
+
+
+def record_status_events(statuses: List[Dict]) -> int:
+    """
+    Buffers status events from a webhook payload.
+
+    Args:
+        statuses: Status dicts from whatsapp_agent.parse_webhook_payload()
+
+    Returns:
+        Number of events buffered
+    """
+    rows = []
+    for status in statuses:
+        column = STATUS_COLUMNS.get(status.get("status"))
+        message_id = status.get("id")
+        if not column or not message_id:
+            continue
+
+        try:
+            timestamp = float(status.get("timestamp"))
+        except (TypeError, ValueError):
+            timestamp = time.time()
+
+        error_code = None
+        errors = status.get("errors") or []
+        if errors:
+            error_code = errors[0].get("code")
+
+        times = {name: None for name in STATUS_COLUMNS.values()}
+        times[column] = timestamp
+        rows.append((
+            message_id, None, status.get("recipient_id"),
+            times["sent_at"], times["delivered_at"], times["read_at"], times["failed_at"],
+            error_code
+        ))
+
+    _add(rows)
+    return len(rows)
+
+
+def flush() -> int:
+    """
+    Writes all buffered events in one transaction.
+
+    Returns:
+        Number of events written
+    """
+    global _oldest_buffered_at
+    with _buffer_lock:
+        rows = list(_buffer)
+        _buffer.clear()
+        _oldest_buffered_at = None
+
+    if not rows:
+        return 0
+
+    local_store.ensure_schema("delivery_status", SCHEMA)
+    try:
+        with local_store.transaction() as conn:
+            conn.executemany(UPSERT_SQL, rows)
+    except Exception as e:
+        logger.error("Error writing delivery statuses: %s", e)
+        with _buffer_lock:
+            _buffer[:0] = rows
+        return 0
+    return len(rows)
+
+
+def flush_if_due() -> int:
+    """
+    Flushes the buffer if its oldest event has waited FLUSH_INTERVAL_SECONDS.
+
+    Returns:
+        Number of events written
+    """
+    with _buffer_lock:
+        due = _oldest_buffered_at is not None and time.monotonic() - _oldest_buffered_at >= FLUSH_INTERVAL_SECONDS
+    return flush() if due else 0
+
+
+def _latency_summary(deltas: List[float]) -> Dict:
+    summary = {"count": len(deltas)}
+    for pct in (50, 90, 99):
+        value = percentile(deltas, pct)
+        summary[f"p{pct}_seconds"] = round(value, 3) if value is not None else None
+    return summary
+
+
+def get_run_delivery_stats(run_id: str) -> Dict:
+    """
+    Aggregates delivery outcomes for a broadcast run.
+
+    Args:
+        run_id: Run ID (e.g., "daily-2025-11-21")
+
+    Returns:
+        Counts, delivery/read rates, send throughput and latency percentiles
+        from send to delivered and to read
+    """
+    flush()
+    local_store.ensure_schema("delivery_status", SCHEMA)
+    rows = local_store.get_connection().execute(
+        "SELECT sent_at, delivered_at, read_at, failed_at FROM message_status WHERE run_id = ?",
+        (run_id,)
+    ).fetchall()
+
+    sent_times = [row["sent_at"] for row in rows if row["sent_at"] is not None]
+    delivered = [row for row in rows if row["delivered_at"] is not None]
+    read = [row for row in rows if row["read_at"] is not None]
+    failed = sum(1 for row in rows if row["failed_at"] is not None)
+
+    sent = len(sent_times)
+    window = max(sent_times) - min(sent_times) if sent > 1 else 0
+
+    return {
+        "run_id": run_id,
+        "sent": sent,
+        "delivered": len(delivered),
+        "read": len(read),
+        "failed": failed,
+        "delivery_rate": round(len(delivered) / sent, 4) if sent else None,
+        "read_rate": round(len(read) / sent, 4) if sent else None,
+        "send_window_seconds": round(window, 1),
+        "messages_per_second": round(sent / window, 2) if window else None,
+        "delivery_latency": _latency_summary([
+            max(row["delivered_at"] - row["sent_at"], 0) for row in delivered if row["sent_at"] is not None
+        ]),
+        "read_latency": _latency_summary([
+            max(row["read_at"] - row["sent_at"], 0) for row in read if row["sent_at"] is not None
+        ]),
+    }
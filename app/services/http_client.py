@@ -0,0 +1,376 @@
+"""
+HTTP Client - Shared, instrumented outbound HTTP for every service
+
+KAMIS, Open-Meteo/OpenWeatherMap, the WhatsApp Graph API and Google Sheets
+(through gspread's session) all send requests through InstrumentedAdapter,
+which:
+- keeps a connection pool per host (reused across calls and threads)
+- applies per-host timeouts and retries idempotent requests on connection
+  errors and 429/5xx responses, with exponential backoff
+- records latency, status, retries and bytes per host (see metrics.py)
+- can record responses to local fixture files, or replay them instead of
+  touching the network (for tests and benchmarks)
+- can send a host's requests to another server (local stand-ins for the
+  upstreams in benchmarks/stubs.py), keeping the real host in metrics
+
+Configuration (environment):
+    HTTP_TIMEOUT_SECONDS   Default timeout when neither the caller nor host sets one (30)
+    HTTP_HOST_TIMEOUTS     Per-host timeouts, overriding callers, e.g. "api.open-meteo.com=5"
+    HTTP_RETRIES           Retries for GET/HEAD (default 2)
+    HTTP_HOST_RETRIES      Per-host retries, e.g. "kamis.kilimo.go.ke=4"
+    HTTP_RETRY_BACKOFF     First backoff in seconds, doubled per retry (0.5)
+    HTTP_POOL_SIZE         Connections kept per host (16)
+    HTTP_FIXTURES_MODE     "off" (default), "record" or "replay"
+    HTTP_FIXTURES_DIR      Fixture directory (default data/http_fixtures)
+    HTTP_HOST_OVERRIDES    Send a host to another server, e.g. "api.open-meteo.com=http://127.0.0.1:8900"
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from app.services import metrics
+from app.services.logging_setup import parse_mapping
+
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "30"))
+DEFAULT_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+RETRY_BACKOFF_SECONDS = float(os.getenv("HTTP_RETRY_BACKOFF", "0.5"))
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
+# Timeouts used when the caller passes none
+HOST_DEFAULT_TIMEOUTS = {
+    "api.open-meteo.com": 10,
+    "api.openweathermap.org": 10,
+    "graph.facebook.com": 15,
+    "kamis.kilimo.go.ke": 60,
+    "sheets.googleapis.com": 30,
+    "www.googleapis.com": 30,
+    "oauth2.googleapis.com": 30,
+}
+
+# Only these methods are retried; a repeated POST could send a message twice
+RETRY_METHODS = {"GET", "HEAD", "OPTIONS"}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Longest Retry-After honoured before giving up on a retry
+MAX_RETRY_AFTER_SECONDS = 30
+
+FIXTURES_MODE = os.getenv("HTTP_FIXTURES_MODE", "off").lower()
+FIXTURES_DIR = os.getenv(
+    "HTTP_FIXTURES_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data", "http_fixtures")
+)
+
+
+def _float_mapping(name: str) -> Dict[str, float]:
+    values = {}
+    for host, value in parse_mapping(os.getenv(name)).items():
+        try:
+            values[host] = float(value)
+        except ValueError:
+            continue
+    return values
+
+
+HOST_TIMEOUTS = _float_mapping("HTTP_HOST_TIMEOUTS")
+HOST_RETRIES = {host: int(value) for host, value in _float_mapping("HTTP_HOST_RETRIES").items()}
+
+# Host -> (scheme, netloc) requests are sent to instead
+HOST_OVERRIDES: Dict[str, tuple] = {}
+
+
+def set_host_override(host: str, base_url: Optional[str]) -> None:
+    """
+    Sends every request for host to base_url ("http://127.0.0.1:8900")
+    instead; None removes the override. Paths and queries are kept.
+    """
+    if base_url is None:
+        HOST_OVERRIDES.pop(host, None)
+        return
+    parts = urlsplit(base_url)
+    HOST_OVERRIDES[host] = (parts.scheme, parts.netloc)
+
+
+for _host, _base_url in parse_mapping(os.getenv("HTTP_HOST_OVERRIDES")).items():
+    set_host_override(_host, _base_url)
+
+
+class FixtureMissing(requests.exceptions.ConnectionError):
+    """
+    Raised in replay mode when no fixture was recorded for a request.
+    """
+
+
+def fixture_key(request: requests.PreparedRequest) -> str:
+    """
+    Identifies a request by method, full URL (with query) and body.
+    """
+    body = request.body or b""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(b" ")
+    digest.update(request.url.encode())
+    digest.update(b"\n")
+    digest.update(body if isinstance(body, bytes) else b"")
+    return digest.hexdigest()[:24]
+
+
+def fixture_path(request: requests.PreparedRequest) -> str:
+    host = urlsplit(request.url).hostname or "unknown"
+    return os.path.join(FIXTURES_DIR, host, f"{request.method.lower()}-{fixture_key(request)}.json")
+
+
+def save_fixture(request: requests.PreparedRequest, response: requests.Response) -> None:
+    """
+    Stores a response so replay mode can return it for the same request.
+    """
+    path = fixture_path(request)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fixture = {
+        "method": request.method,
+        "url": request.url,
+        "status": response.status_code,
+        "reason": response.reason,
+        "headers": {
+            name: value for name, value in response.headers.items()
+            if name.lower() not in ("content-encoding", "transfer-encoding", "content-length")
+        },
+        "body_b64": base64.b64encode(response.content).decode("ascii"),
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(fixture, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_fixture(request: requests.PreparedRequest) -> requests.Response:
+    """
+    Builds a response from the fixture recorded for this request.
+
+    Raises:
+        FixtureMissing: If nothing was recorded
+    """
+    path = fixture_path(request)
+    try:
+        with open(path) as f:
+            fixture = json.load(f)
+    except FileNotFoundError:
+        raise FixtureMissing(f"No fixture for {request.method} {request.url} ({path})", request=request)
+
+    response = requests.Response()
+    response.status_code = fixture["status"]
+    response.reason = fixture.get("reason")
+    response.headers = CaseInsensitiveDict(fixture["headers"])
+    response._content = base64.b64decode(fixture["body_b64"])
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.url = request.url
+    response.request = request
+    return response
+
+
+def _retry_delay(attempt: int, response: Optional[requests.Response]) -> float:
+    delay = RETRY_BACKOFF_SECONDS * (2 ** attempt)
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        delay = max(delay, min(float(retry_after), MAX_RETRY_AFTER_SECONDS))
+    return delay
+
+
+class InstrumentedAdapter(HTTPAdapter):
+    """
+    Transport adapter adding per-host timeouts, retries, metrics and
+    fixture record/replay. One instance is shared by every session, so
+    its connection pools (one per host) are shared too.
+    """
+
+    def __init__(self, pool_size: int = POOL_SIZE):
+        super().__init__(pool_connections=32, pool_maxsize=pool_size, max_retries=0)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        host = urlsplit(request.url).hostname or "unknown"
+        method = request.method.upper()
+
+        if host in HOST_TIMEOUTS:
+            timeout = HOST_TIMEOUTS[host]
+        elif timeout is None:
+            timeout = HOST_DEFAULT_TIMEOUTS.get(host, DEFAULT_TIMEOUT_SECONDS)
+
+        body = request.body
+        if isinstance(body, (bytes, str)) and body:
+            metrics.increment("http_client_request_bytes_total", len(body), host=host)
+
+        if FIXTURES_MODE == "replay":
+            response = load_fixture(request)
+            self._record(host, method, response, 0.0, stream)
+            return response
+
+        target = request
+        if host in HOST_OVERRIDES:
+            target = request.copy()
+            parts = urlsplit(request.url)
+            scheme, netloc = HOST_OVERRIDES[host]
+            target.url = urlunsplit((scheme, netloc, parts.path, parts.query, parts.fragment))
+
+        retries = HOST_RETRIES.get(host, DEFAULT_RETRIES) if method in RETRY_METHODS else 0
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = super().send(target, stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self._record(host, method, None, time.perf_counter() - started, stream)
+                if attempt >= retries:
+                    raise
+                time.sleep(_retry_delay(attempt, None))
+                attempt += 1
+                metrics.increment("http_client_retries_total", host=host)
+                continue
+
+            self._record(host, method, response, time.perf_counter() - started, stream)
+            if response.status_code in RETRY_STATUSES and attempt < retries:
+                delay = _retry_delay(attempt, response)
+                response.close()
+                time.sleep(delay)
+                attempt += 1
+                metrics.increment("http_client_retries_total", host=host)
+                continue
+            break
+
+        if FIXTURES_MODE == "record":
+            save_fixture(request, response)
+        return response
+
+    @staticmethod
+    def _record(host: str, method: str, response: Optional[requests.Response], elapsed: float, stream: bool) -> None:
+        metrics.observe("http_client_request_seconds", elapsed, host=host)
+        if response is None:
+            metrics.increment("http_client_requests_total", host=host, method=method, status="error")
+            return
+        metrics.increment("http_client_requests_total", host=host, method=method, status=response.status_code)
+
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit():
+            size = int(length)
+        elif not stream:
+            size = len(response.content)
+        else:
+            return
+        metrics.increment("http_client_response_bytes_total", size, host=host)
+
+
+_adapter: Optional[InstrumentedAdapter] = None
+_session: Optional[requests.Session] = None
+_lock = threading.Lock()
+
+
+def get_adapter() -> InstrumentedAdapter:
+    """
+    The process-wide adapter (created on first use).
+    """
+    global _adapter
+    with _lock:
+        if _adapter is None:
+            _adapter = InstrumentedAdapter()
+        return _adapter
+
+
+def instrument_session(session: requests.Session) -> requests.Session:
+    """
+    Routes an existing session (e.g. google-auth's AuthorizedSession)
+    through the shared adapter.
+    """
+    adapter = get_adapter()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def new_session(headers: Optional[Dict[str, str]] = None) -> requests.Session:
+    """
+    A session with its own headers and cookies that shares the connection
+    pools. Use for multi-request flows that need cookies (KAMIS pages).
+    """
+    session = instrument_session(requests.Session())
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    The shared session for stateless API calls.
+    """
+    global _session
+    if _session is None:
+        session = new_session()
+        with _lock:
+            if _session is None:
+                _session = session
+    return _session
+
+
+def _reset_after_fork() -> None:
+    # Pooled connections opened before fork (app/prefork.py) would be
+    # shared with the parent; children build their own adapter and session
+    global _adapter, _session, _lock
+    _adapter = None
+    _session = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Sends a request through the shared session (same arguments as requests.request).
+    """
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def get_host_stats() -> Dict[str, Dict]:
+    """
+    Latency summary, request count by status, retries and bytes per host.
+    """
+    stats: Dict[str, Dict] = {}
+    snapshot = metrics.snapshot()
+    for sample in snapshot["histograms"]:
+        if sample["name"] == "http_client_request_seconds":
+            histogram = metrics.Histogram(tuple(sample["bounds"]))
+            histogram.counts = sample["counts"]
+            histogram.count = sample["count"]
+            histogram.sum = sample["sum"]
+            histogram.max = sample["max"]
+            stats.setdefault(sample["labels"]["host"], {})["latency"] = histogram.summary()
+    for sample in snapshot["counters"]:
+        host = sample["labels"].get("host")
+        if host is None or not sample["name"].startswith("http_client_"):
+            continue
+        entry = stats.setdefault(host, {})
+        if sample["name"] == "http_client_requests_total":
+            by_status = entry.setdefault("requests", {})
+            status = sample["labels"]["status"]
+            by_status[status] = by_status.get(status, 0) + int(sample["value"])
+        else:
+            key = sample["name"][len("http_client_"):-len("_total")]
+            entry[key] = int(sample["value"])
+    return stats
@@ -1,12 +1,24 @@
-import requests
-from bs4 import BeautifulSoup
+from __future__ import annotations
+
 from datetime import datetime
-import pandas as pd
+import logging
 import os
 import re
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, Optional
 import time
 
+from app.services import cache, http_client, metrics, snapshots
+from app.services.lazy_imports import lazy_module
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+
+# Imported on first use (see lazy_imports)
+bs4 = lazy_module("bs4")
+pd = lazy_module("pandas")
+
+logger = logging.getLogger(__name__)
+
 # KAMIS URL
 KAMIS_BASE_URL = "https://kamis.kilimo.go.ke"
 KAMIS_MARKET_URL = f"{KAMIS_BASE_URL}/site/market"
@@ -22,7 +34,17 @@ KAMIS_PRODUCTS = {
 }
 
 # Data directory
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data")
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data"))
+
+# Today's parsed prices are shared by all workers under this snapshot name
+PRICES_SNAPSHOT = "prices"
+
+# Today's scraped prices, shared with nodes that have no KAMIS file of their own (see cache)
+PRICES_CACHE_TTL_SECONDS = int(os.getenv("PRICES_CACHE_TTL_SECONDS", str(24 * 3600)))
+prices_cache = cache.Cache("prices", ttl=PRICES_CACHE_TTL_SECONDS)
+
+# Pause between commodity downloads, to be nice to the server (0 for local stubs)
+REQUEST_DELAY_SECONDS = float(os.getenv("KAMIS_REQUEST_DELAY_SECONDS", "0.5"))
 
 # Track if initial download has been done
 INITIAL_DOWNLOAD_MARKER = os.path.join(DATA_DIR, ".kamis_initial_download_complete")
@@ -52,12 +74,12 @@ def download_commodity_data(product_id: int, per_page: int = 3000, export_excel:
         
         url = f"{KAMIS_MARKET_URL}"
         
-        session = requests.Session()
+        session = http_client.new_session()
         session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
         
-        print(f"  Downloading product ID {product_id} ({per_page} rows)...")
+        logger.debug("Downloading KAMIS product %s (%d rows)", product_id, per_page)
         response = session.get(url, params=params, timeout=60)
         response.raise_for_status()
         
@@ -77,11 +99,11 @@ def download_commodity_data(product_id: int, per_page: int = 3000, export_excel:
             except:
                 pass
             
-            print(f"  ✅ Downloaded {len(df)} rows for product {product_id}")
+            logger.info("Downloaded %d rows for KAMIS product %s", len(df), product_id)
             return df
         else:
             # Parse HTML table as fallback
-            soup = BeautifulSoup(response.text, 'html.parser')
+            soup = bs4.BeautifulSoup(response.text, 'html.parser')
             table = soup.find('table')
             
             if table:
@@ -94,14 +116,14 @@ def download_commodity_data(product_id: int, per_page: int = 3000, export_excel:
                 if rows:
                     headers = [th.get_text().strip() for th in table.find('thead').find_all('th')]
                     df = pd.DataFrame(rows, columns=headers)
-                    print(f"  ✅ Scraped {len(df)} rows for product {product_id}")
+                    logger.info("Scraped %d rows for KAMIS product %s", len(df), product_id)
                     return df
             
-            print(f"  ⚠️ No data found for product {product_id}")
+            logger.warning("No KAMIS data found for product %s", product_id)
             return pd.DataFrame()
             
     except Exception as e:
-        print(f"  ❌ Error downloading product {product_id}: {e}")
+        logger.warning("Error downloading KAMIS product %s: %s", product_id, e)
         return pd.DataFrame()
 
 
@@ -116,20 +138,19 @@ def download_all_commodities_historical(per_page: int = 3000) -> str:
     Returns:
         Path to the saved Excel file with all commodity data
     """
-    print(f"Downloading historical data ({per_page} rows per commodity)...")
-    print("=" * 70)
+    logger.info("Downloading KAMIS historical data (%d rows per commodity)", per_page)
     
     all_data = []
     
     for crop_key, product_info in KAMIS_PRODUCTS.items():
-        print(f"\n{product_info['name']}:")
+        logger.debug("Downloading %s", product_info['name'])
         df = download_commodity_data(product_info['id'], per_page=per_page)
         
         if not df.empty:
             # Add crop identifier
             df['crop_category'] = crop_key
             all_data.append(df)
-            time.sleep(1)  # Be nice to the server
+            time.sleep(REQUEST_DELAY_SECONDS * 2)  # Be nice to the server
     
     if not all_data:
         raise Exception("Failed to download any commodity data")
@@ -143,9 +164,7 @@ def download_all_commodities_historical(per_page: int = 3000) -> str:
     
     combined_df.to_excel(output_path, index=False, engine='openpyxl')
     
-    print("\n" + "=" * 70)
-    print(f"✅ Downloaded {len(combined_df)} total rows")
-    print(f"✅ Saved to: {output_path}")
+    logger.info("Downloaded %d KAMIS historical rows to %s", len(combined_df), output_path)
     
     # Mark initial download as complete
     with open(INITIAL_DOWNLOAD_MARKER, 'w') as f:
@@ -162,14 +181,13 @@ def download_todays_data() -> str:
     Returns:
         Path to the saved Excel file with today's data
     """
-    print("Downloading today's data...")
-    print("=" * 70)
+    logger.info("Downloading today's KAMIS data")
     
     all_data = []
     today = datetime.now().strftime("%Y-%m-%d")
     
     for crop_key, product_info in KAMIS_PRODUCTS.items():
-        print(f"\n{product_info['name']}:")
+        logger.debug("Downloading %s", product_info['name'])
         # Use smaller per_page for daily updates
         df = download_commodity_data(product_info['id'], per_page=100)
         
@@ -182,19 +200,19 @@ def download_todays_data() -> str:
                 if not today_data.empty:
                     today_data['crop_category'] = crop_key
                     all_data.append(today_data)
-                    print(f"  Found {len(today_data)} rows for today ({today})")
+                    logger.debug("Found %d %s rows for today (%s)", len(today_data), product_info['name'], today)
                 else:
-                    print(f"  No data for today ({today})")
+                    logger.debug("No %s data for today (%s)", product_info['name'], today)
             else:
                 # If no date column, just take recent data
                 recent_data = df.head(10).copy()
                 recent_data['crop_category'] = crop_key
                 all_data.append(recent_data)
         
-        time.sleep(0.5)  # Be nice to the server
+        time.sleep(REQUEST_DELAY_SECONDS)  # Be nice to the server
     
     if not all_data:
-        print("⚠️ No data found for today. Using recent data instead.")
+        logger.warning("No KAMIS data for today; using recent data instead")
         # Fallback: get recent data without date filter
         for crop_key, product_info in KAMIS_PRODUCTS.items():
             df = download_commodity_data(product_info['id'], per_page=50)
@@ -214,9 +232,7 @@ def download_todays_data() -> str:
     
     combined_df.to_excel(output_path, index=False, engine='openpyxl')
     
-    print("\n" + "=" * 70)
-    print(f"✅ Downloaded {len(combined_df)} rows for today")
-    print(f"✅ Saved to: {output_path}")
+    logger.info("Downloaded %d KAMIS rows for today to %s", len(combined_df), output_path)
     
     return output_path
 
@@ -241,7 +257,7 @@ def download_kamis_excel(output_path: Optional[str] = None) -> str:
     Returns:
         Path to the downloaded Excel file
     """
-    print("Downloading KAMIS data...")
+    logger.info("Downloading KAMIS Excel export")
     
     try:
         # Create data directory if it doesn't exist
@@ -249,7 +265,7 @@ def download_kamis_excel(output_path: Optional[str] = None) -> str:
             os.makedirs(DATA_DIR)
         
         # Set up session
-        session = requests.Session()
+        session = http_client.new_session()
         session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
@@ -269,21 +285,21 @@ def download_kamis_excel(output_path: Optional[str] = None) -> str:
         
         for excel_url in excel_urls_to_try:
             try:
-                print(f"Trying: {excel_url}")
+                logger.debug("Trying %s", excel_url)
                 response = session.get(excel_url, timeout=60)
                 if response.status_code == 200 and len(response.content) > 1000:
                     excel_response = response
                     successful_url = excel_url
                     break
             except Exception as e:
-                print(f"  Failed: {e}")
+                logger.debug("KAMIS export %s failed: %s", excel_url, e)
                 continue
         
         if not excel_response:
-            print("Excel export failed. Trying table scraping...")
+            logger.warning("KAMIS Excel export failed; trying table scraping")
             # Fallback to scraping the page directly
             response = session.get(KAMIS_MARKET_URL, timeout=30)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            soup = bs4.BeautifulSoup(response.text, 'html.parser')
             return scrape_kamis_table_to_excel(soup, output_path)
         
         # Save the Excel file
@@ -294,26 +310,24 @@ def download_kamis_excel(output_path: Optional[str] = None) -> str:
         with open(output_path, 'wb') as f:
             f.write(excel_response.content)
         
-        print(f"✅ KAMIS data downloaded from: {successful_url}")
-        print(f"✅ Saved to: {output_path}")
+        logger.info("KAMIS data downloaded from %s to %s", successful_url, output_path)
         
         # Check the file size
         file_size = os.path.getsize(output_path)
-        print(f"   File size: {file_size:,} bytes")
+        logger.debug("KAMIS export size: %d bytes", file_size)
         
         return output_path
         
     except Exception as e:
-        print(f"Error downloading Excel: {e}")
-        print("Falling back to table scraping...")
+        logger.warning("Error downloading KAMIS Excel: %s; falling back to table scraping", e)
         
         # Fallback: scrape the table
         try:
-            response = requests.get(KAMIS_MARKET_URL, timeout=30)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            response = http_client.get(KAMIS_MARKET_URL, timeout=30)
+            soup = bs4.BeautifulSoup(response.text, 'html.parser')
             return scrape_kamis_table_to_excel(soup, output_path)
         except Exception as e2:
-            print(f"Error in fallback scraping: {e2}")
+            logger.error("Error in KAMIS fallback scraping: %s", e2)
             raise
 
 
@@ -328,7 +342,7 @@ def scrape_kamis_ajax_data(output_path: Optional[str] = None) -> str:
     Returns:
         Path to the saved Excel file
     """
-    print("Scraping KAMIS via AJAX endpoint...")
+    logger.info("Scraping KAMIS via AJAX endpoint")
     
     try:
         # DataTables often uses an AJAX endpoint
@@ -339,7 +353,7 @@ def scrape_kamis_ajax_data(output_path: Optional[str] = None) -> str:
             f"{KAMIS_MARKET_URL}/data",
         ]
         
-        session = requests.Session()
+        session = http_client.new_session()
         session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'X-Requested-With': 'XMLHttpRequest'
@@ -360,7 +374,7 @@ def scrape_kamis_ajax_data(output_path: Optional[str] = None) -> str:
                     json_data = response.json()
                     if 'aaData' in json_data or 'data' in json_data:
                         data = json_data
-                        print(f"✅ Successfully fetched data from: {endpoint}")
+                        logger.debug("Fetched KAMIS data from %s", endpoint)
                         break
             except:
                 continue
@@ -389,11 +403,11 @@ def scrape_kamis_ajax_data(output_path: Optional[str] = None) -> str:
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         df.to_excel(output_path, index=False, engine='openpyxl')
         
-        print(f"✅ Scraped {len(df)} rows via AJAX and saved to: {output_path}")
+        logger.info("Scraped %d KAMIS rows via AJAX to %s", len(df), output_path)
         return output_path
         
     except Exception as e:
-        print(f"AJAX scraping failed: {e}")
+        logger.warning("KAMIS AJAX scraping failed: %s", e)
         raise
 
 
@@ -409,23 +423,22 @@ def scrape_kamis_table_to_excel(soup: Optional[BeautifulSoup] = None, output_pat
     Returns:
         Path to the saved Excel file
     """
-    print("Scraping KAMIS table data from HTML...")
+    logger.info("Scraping KAMIS table data from HTML")
     
     try:
         # First try AJAX method
         try:
             return scrape_kamis_ajax_data(output_path)
         except Exception as e:
-            print(f"AJAX method failed: {e}")
-            print("Falling back to HTML scraping...")
+            logger.info("KAMIS AJAX method failed (%s); falling back to HTML scraping", e)
         
         # HTML scraping fallback
         if soup is None:
-            response = requests.get(KAMIS_MARKET_URL, timeout=30, headers={
+            response = http_client.get(KAMIS_MARKET_URL, timeout=30, headers={
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             })
             response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
+            soup = bs4.BeautifulSoup(response.text, 'html.parser')
         
         # Find the data table
         table = soup.find('table') or soup.find('table', {'id': 'DataTables_Table_0'})
@@ -462,8 +475,7 @@ def scrape_kamis_table_to_excel(soup: Optional[BeautifulSoup] = None, output_pat
                     rows.append(row_data)
         
         if not rows:
-            print("Warning: No rows found in HTML table. The table might be loaded via JavaScript.")
-            print("You may need to wait a moment and try again, or the data might be unavailable.")
+            logger.warning("No rows found in the KAMIS HTML table; it may be loaded via JavaScript or unavailable")
         
         # Create DataFrame
         if headers and rows:
@@ -474,7 +486,7 @@ def scrape_kamis_table_to_excel(soup: Optional[BeautifulSoup] = None, output_pat
             # Create empty DataFrame with at least the structure
             df = pd.DataFrame(columns=['Commodity', 'Classification', 'Grade', 'Sex', 'Market', 
                                       'Wholesale', 'Retail', 'Supply Volume', 'County', 'Date'])
-            print("Warning: Created empty DataFrame. Data might be loaded dynamically.")
+            logger.warning("KAMIS table is empty; data might be loaded dynamically")
         
         # Save to Excel
         if not output_path:
@@ -486,11 +498,11 @@ def scrape_kamis_table_to_excel(soup: Optional[BeautifulSoup] = None, output_pat
         
         df.to_excel(output_path, index=False, engine='openpyxl')
         
-        print(f"✅ Scraped {len(df)} rows from HTML and saved to: {output_path}")
+        logger.info("Scraped %d KAMIS rows from HTML to %s", len(df), output_path)
         return output_path
         
     except Exception as e:
-        print(f"Error scraping table: {e}")
+        logger.error("Error scraping KAMIS table: %s", e)
         raise
 
 
@@ -504,10 +516,10 @@ def download_kamis_by_commodity(commodity: str) -> pd.DataFrame:
     Returns:
         DataFrame with the commodity data
     """
-    print(f"Searching for commodity: {commodity}...")
+    logger.info("Searching KAMIS for commodity %s", commodity)
     
     try:
-        session = requests.Session()
+        session = http_client.new_session()
         session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
@@ -536,19 +548,19 @@ def download_kamis_by_commodity(commodity: str) -> pd.DataFrame:
                     if 'Commodity' in df.columns:
                         matches = df[df['Commodity'].str.contains(commodity, case=False, na=False)]
                         if not matches.empty:
-                            print(f"  Found {len(matches)} entries for {commodity}")
+                            logger.info("Found %d KAMIS entries for %s", len(matches), commodity)
                             return matches
                     
-                    print(f"  No matches found in response from: {url}")
+                    logger.debug("No %s matches in response from %s", commodity, url)
             except Exception as e:
-                print(f"  Failed: {e}")
+                logger.debug("KAMIS search %s failed: %s", url, e)
                 continue
         
-        print(f"  Could not find data for {commodity}")
+        logger.warning("Could not find KAMIS data for %s", commodity)
         return pd.DataFrame()
         
     except Exception as e:
-        print(f"Error downloading commodity data: {e}")
+        logger.warning("Error downloading KAMIS commodity data: %s", e)
         return pd.DataFrame()
 
 
@@ -560,7 +572,7 @@ def scrape_kamis_by_scraping_page() -> pd.DataFrame:
     Returns:
         Combined DataFrame with all commodity data
     """
-    print("Scraping KAMIS page for target commodities...")
+    logger.info("Scraping KAMIS page for target commodities")
     
     all_data = []
     
@@ -572,14 +584,14 @@ def scrape_kamis_by_scraping_page() -> pd.DataFrame:
         'Cabbage': ['Cabbage', 'Cabbages']
     }
     
-    session = requests.Session()
+    session = http_client.new_session()
     session.headers.update({
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
     })
     
     # Get the main page
     response = session.get(KAMIS_MARKET_URL, timeout=30)
-    soup = BeautifulSoup(response.text, 'html.parser')
+    soup = bs4.BeautifulSoup(response.text, 'html.parser')
     
     # Try to find all data in the page source or table
     table = soup.find('table')
@@ -600,19 +612,67 @@ def scrape_kamis_by_scraping_page() -> pd.DataFrame:
     # Combine all data
     if all_data:
         combined_df = pd.concat(all_data, ignore_index=True)
-        print(f"Scraped {len(combined_df)} rows from page")
+        logger.info("Scraped %d rows from KAMIS page", len(combined_df))
         return combined_df
     
     return pd.DataFrame()
 
 
+def get_cached_prices_version() -> Optional[tuple]:
+    """
+    Identifies today's cached price data without parsing it.
+    
+    Used by the API to decide whether a pre-serialized response is still
+    current. Any new or rewritten daily file changes the version.
+    
+    Returns:
+        Tuple of (filename, mtime_ns) for today's daily files, or None if
+        there is no cached data for today
+    """
+    today_str = datetime.now().strftime("%Y%m%d")
+    today = datetime.now().date()
+    
+    if not os.path.exists(DATA_DIR):
+        return None
+    
+    version = []
+    for filename in sorted(os.listdir(DATA_DIR)):
+        if filename.startswith(f"kamis_daily_{today_str}") and filename.endswith(".xlsx"):
+            stat = os.stat(os.path.join(DATA_DIR, filename))
+            if datetime.fromtimestamp(stat.st_mtime).date() == today:
+                version.append((filename, stat.st_mtime_ns))
+    
+    return tuple(version) or None
+
+
 def get_cached_prices_for_today() -> Optional[Dict]:
     """
     Check if we've already scraped today and return cached prices.
     
+    Today's file is parsed once per version and shared by all workers as
+    the "prices" snapshot (see snapshots).
+    
     Returns:
         Dictionary with prices if today's data exists, None otherwise
     """
+    version = get_cached_prices_version()
+    if version is None:
+        return None
+    
+    snapshot = snapshots.get(PRICES_SNAPSHOT, version, read_cached_prices_for_today)
+    if snapshot is None:
+        return None
+    logger.debug("Using cached prices from today")
+    return dict(snapshot.data())
+
+
+def read_cached_prices_for_today() -> Optional[Dict]:
+    """
+    Reads prices from today's downloaded KAMIS file.
+    
+    Returns:
+        Dictionary with prices if a file from today can be read, None otherwise
+    """
     today_str = datetime.now().strftime("%Y%m%d")
     
     # Look for today's data file
@@ -626,17 +686,16 @@ def get_cached_prices_for_today() -> Optional[Dict]:
             # Check if file is recent (created today)
             file_time = datetime.fromtimestamp(os.path.getmtime(file_path))
             if file_time.date() == datetime.now().date():
-                print(f"✅ Found today's cached data: {filename}")
+                logger.debug("Found today's cached KAMIS data: %s", filename)
                 try:
                     # Read and extract prices from cached file
                     df = pd.read_excel(file_path, engine='openpyxl')
                     prices = extract_nairobi_prices(df)
                     prices['source'] = 'cache'
                     prices['cached_file'] = filename
-                    print(f"📦 Using cached prices from today")
                     return prices
                 except Exception as e:
-                    print(f"⚠️  Error reading cached file: {e}")
+                    logger.warning("Error reading cached KAMIS file %s: %s", filename, e)
                     continue
     
     return None
@@ -661,50 +720,55 @@ def scrape_kamis(force_refresh: bool = False) -> Dict:
     Args:
         force_refresh: If True, bypasses cache and performs fresh scrape
     """
-    print("Scraping KAMIS for Nairobi prices...")
-    print("=" * 70)
+    today = datetime.now().strftime("%Y-%m-%d")
     
-    # Check for cached data (unless force refresh)
+    # Check for cached data (unless force refresh): this node's file first,
+    # then prices another node scraped today
     if not force_refresh:
         cached_prices = get_cached_prices_for_today()
+        metrics.increment("cache_requests_total", cache="kamis_daily", result="hit" if cached_prices else "miss")
+        if not cached_prices:
+            cached_prices = prices_cache.get("nairobi", version=today)
+            if cached_prices:
+                cached_prices['source'] = 'cache'
+                logger.info("Using prices cached by another node today")
         if cached_prices:
-            print("=" * 70)
             return cached_prices
         else:
-            print("ℹ️  No cached data for today, performing fresh scrape...")
+            logger.info("No cached KAMIS data for today, performing fresh scrape")
     else:
-        print("🔄 Force refresh requested, bypassing cache...")
+        logger.info("Force refresh requested, bypassing KAMIS cache")
     
     try:
         # Check if we need initial historical download
-        if needs_initial_download():
-            print("\n🔄 Initial download: Fetching historical data (3000 rows per commodity)...")
-            excel_path = download_all_commodities_historical(per_page=3000)
-        else:
-            print("\n🔄 Daily update: Fetching today's data only...")
-            excel_path = download_todays_data()
+        with metrics.upstream_call(metrics.UPSTREAM_KAMIS):
+            if needs_initial_download():
+                logger.info("Initial KAMIS download: fetching historical data (3000 rows per commodity)")
+                excel_path = download_all_commodities_historical(per_page=3000)
+            else:
+                logger.info("Daily KAMIS update: fetching today's data only")
+                excel_path = download_todays_data()
         
         # Read the downloaded data
         df = pd.read_excel(excel_path, engine='openpyxl')
         
-        print(f"\n📊 Processing {len(df)} rows...")
+        logger.debug("Processing %d KAMIS rows", len(df))
         
         # Extract Nairobi prices for our target crops
         prices = extract_nairobi_prices(df)
         
         if prices.get('source') == 'kamis':
-            print(f"\n✅ Successfully extracted prices from KAMIS")
+            logger.info("Extracted Nairobi prices from KAMIS")
+            prices_cache.set("nairobi", prices, version=today)
             return prices
         else:
-            print(f"\n⚠️ Using default prices (crops not found in data)")
+            logger.warning("Using default prices (crops not found in KAMIS data)")
             return prices
         
     except Exception as e:
-        print(f"\n❌ Error in scrape_kamis: {e}")
-        print("Using fallback default prices...")
+        logger.error("Error in scrape_kamis: %s; using fallback default prices", e)
         
         # Fallback to reasonable defaults if scraping fails
-        today = datetime.now().strftime("%Y-%m-%d")
         prices = {
             "date": today,
             "tomato": 80,
@@ -788,7 +852,7 @@ def extract_nairobi_prices(df: pd.DataFrame) -> Dict:
                     if wholesale_prices:
                         avg_price = round(sum(wholesale_prices) / len(wholesale_prices))
                         prices[key] = avg_price
-                        print(f"  ✅ {key.capitalize()}: KSh {avg_price}/kg (avg of {len(wholesale_prices)} prices)")
+                        logger.debug("%s: KSh %s/kg (avg of %d prices)", key.capitalize(), avg_price, len(wholesale_prices))
     
     else:
         # Fallback to old method: match by commodity name
@@ -820,7 +884,7 @@ def extract_nairobi_prices(df: pd.DataFrame) -> Dict:
                             price = extract_price_value(price_str)
                             if price:
                                 prices[key] = price
-                                print(f"  ✅ {key.capitalize()}: KSh {price}/kg")
+                                logger.debug("%s: KSh %s/kg", key.capitalize(), price)
                                 break
     
     # Fill in any missing prices with reasonable defaults
@@ -837,7 +901,7 @@ def extract_nairobi_prices(df: pd.DataFrame) -> Dict:
     for key, default_price in defaults.items():
         if prices[key] is None:
             if key in ["tomato", "sukuma", "onion", "cabbage"]:  # Only warn for main crops
-                print(f"  ⚠️  {key.capitalize()}: No Nairobi price found, using default KSh {default_price}/kg")
+                logger.warning("%s: no Nairobi price found, using default KSh %s/kg", key.capitalize(), default_price)
             prices[key] = default_price
             any_defaults_used = True
     
@@ -900,12 +964,16 @@ def get_latest_kamis_file() -> Optional[str]:
         return kamis_files[0]
         
     except Exception as e:
-        print(f"Error getting latest KAMIS file: {e}")
+        logger.warning("Error getting latest KAMIS file: %s", e)
         return None
 
 
 if __name__ == "__main__":
     import sys
+    from app.services import logging_setup
+    
+    # Show the scraper's progress messages
+    logging_setup.configure_logging()
     
     print("\n" + "=" * 70)
     print("KAMIS Scraper Test")
@@ -958,7 +1026,7 @@ if __name__ == "__main__":
     if latest_file:
         file_size = os.path.getsize(latest_file)
         file_time = datetime.fromtimestamp(os.path.getmtime(latest_file)).strftime("%Y-%m-%d %H:%M:%S")
-        print(f"\n📁 Latest KAMIS file:")
+        print("\n📁 Latest KAMIS file:")
         print(f"   Path: {latest_file}")
         print(f"   Size: {file_size:,} bytes")
         print(f"   Modified: {file_time}")
@@ -0,0 +1,75 @@
+"""
+Lazy Imports - Defers heavy dependencies until first use
+
+pandas, numpy, openpyxl, BeautifulSoup, gspread and google-auth take
+most of the app's import time, yet endpoints like / or the /webhook
+verification never touch them. Modules bind them with lazy_module()
+instead of import, e.g.
+
+    pd = lazy_module("pandas")
+
+and the real import happens the first time an attribute is read
+(pd.read_excel). The module-level name is then rebound to the real
+module, so later lookups cost nothing extra. Modules using a lazy name
+in annotations need "from __future__ import annotations" so the
+annotation is not evaluated at import time.
+
+benchmarks/bench_startup.py checks that importing app.main stays within
+its time budget and loads none of these.
+"""
+import importlib
+import importlib.util
+import sys
+from types import ModuleType
+from typing import Dict, Optional
+
+
+class LazyModule:
+    """
+    Stands in for a module until an attribute is first read.
+    """
+
+    __slots__ = ("_name", "_module", "_namespace")
+
+    def __init__(self, name: str, namespace: Optional[Dict] = None):
+        self._name = name
+        self._module: Optional[ModuleType] = None
+        self._namespace = namespace
+
+    def _load(self) -> ModuleType:
+        # import_module holds the module's import lock, so threads racing
+        # here wait for one complete import rather than see a partial module
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+            if self._namespace is not None:
+                for key, value in list(self._namespace.items()):
+                    if value is self:
+                        self._namespace[key] = module
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_module(name: str) -> LazyModule:
+    """
+    A stand-in for module name that imports it on first use and then
+    replaces itself in the calling module's globals.
+    """
+    return LazyModule(name, sys._getframe(1).f_globals)
+
+
+def module_available(name: str) -> bool:
+    """
+    Whether a module can be imported, without importing it (parent
+    packages are imported).
+    """
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ImportError:
+        return False
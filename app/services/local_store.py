@@ -0,0 +1,89 @@
+"""
+Local Store - Shared SQLite database for state that must survive restarts
+and be visible to every uvicorn worker on this machine.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+# Path to the local database (lives next to the other data files)
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data"))
+DB_FILE = os.getenv("AGROSOKO_DB_PATH", os.path.join(DATA_DIR, "agrosoko.db"))
+
+# How long a writer waits for another process to release the lock
+BUSY_TIMEOUT_SECONDS = 30
+
+_local = threading.local()
+_schemas_applied = set()
+_schema_lock = threading.Lock()
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Returns this thread's connection to the local database.
+
+    Connections run in autocommit mode; use transaction() for writes that
+    must be atomic across processes.
+
+    Returns:
+        sqlite3 connection with Row factory
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(DB_FILE) or ".", exist_ok=True)
+        conn = sqlite3.connect(DB_FILE, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    return conn
+
+
+def ensure_schema(name: str, ddl: str) -> None:
+    """
+    Applies a block of CREATE statements once per process.
+
+    Args:
+        name: Unique name of the schema block (usually the module name)
+        ddl: SQL script with CREATE TABLE/INDEX IF NOT EXISTS statements
+    """
+    if name in _schemas_applied:
+        return
+    with _schema_lock:
+        if name in _schemas_applied:
+            return
+        get_connection().executescript(ddl)
+        _schemas_applied.add(name)
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """
+    Opens a write transaction that holds the database lock until it ends.
+
+    BEGIN IMMEDIATE takes the write lock up front, so a read-then-write
+    inside the block cannot race with another worker.
+
+    Yields:
+        The thread's connection
+    """
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _reset_after_fork() -> None:
+    # A connection opened before fork (app/prefork.py warms caches in the
+    # master) must not be used by the child; each child opens its own
+    global _local
+    _local = threading.local()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
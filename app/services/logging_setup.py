@@ -0,0 +1,240 @@
+"""
+Logging Setup - Structured, non-blocking logging for the API and broadcast
+
+Log calls only format a record and put it on an in-memory queue; a
+listener thread does the actual write to stdout (captured by systemd or
+Render). The request handlers and the daily loop therefore never wait on
+the log file.
+
+Configuration (environment):
+    LOG_LEVEL     Root level (default INFO)
+    LOG_LEVELS    Per-logger levels, e.g. "app.services.weather_api=WARNING,uvicorn.access=WARNING"
+    LOG_FORMAT    "json" (default) or "text"
+    LOG_SAMPLING  Keep 1 in N records per logger, e.g. "uvicorn.access=10"
+
+Individual high-volume calls can also be sampled with
+    logger.info("Sent message to %s", phone, extra={"sample_every": 100})
+which keeps 1 in 100 records with the same message template.
+"""
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# Records waiting beyond this are dropped rather than blocking the caller
+QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Attributes every LogRecord has; anything else came from extra={...}
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName", "sample_every"}
+
+# Server loggers routed through the same queue
+_SERVER_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["DroppingQueueHandler"] = None
+_configure_lock = threading.Lock()
+
+
+def parse_mapping(value: Optional[str]) -> Dict[str, str]:
+    """
+    Parses "name=value,name=value" settings.
+    """
+    mapping = {}
+    for item in (value or "").split(","):
+        name, sep, setting = item.partition("=")
+        if sep and name.strip() and setting.strip():
+            mapping[name.strip()] = setting.strip()
+    return mapping
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: ts, level, logger, msg, any extra fields and
+    the formatted exception if there is one.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps 1 in N records, counted per logger (LOG_SAMPLING) or per message
+    template (extra={"sample_every": N}). Errors are never sampled out, and
+    warnings only when the call asks for it.
+    """
+
+    def __init__(self, per_logger: Optional[Dict[str, int]] = None):
+        super().__init__()
+        self.per_logger = per_logger or {}
+        self._counts: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+
+        every = getattr(record, "sample_every", None)
+        if every:
+            key = (record.name, record.msg)
+        elif record.levelno >= logging.WARNING:
+            return True
+        else:
+            every = self.per_logger.get(record.name)
+            key = (record.name,)
+        if not every or every <= 1:
+            return True
+
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % every:
+            return False
+        record.sampled = f"1/{every}"
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that drops records when the queue is full instead of
+    raising, and counts how many were dropped.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message and traceback now (the exception object may be
+        # gone by the time the listener runs); keep extra fields for the JSON
+        # formatter. The traceback goes in exc_text, which both formatters print.
+        exc_text = logging.Formatter().formatException(record.exc_info) if record.exc_info else record.exc_text
+        stack_info = record.stack_info
+        record = copy.copy(record)
+        record.exc_info = None
+        record.exc_text = None
+        record.stack_info = None
+        record = super().prepare(record)
+        record.exc_text = exc_text
+        record.stack_info = stack_info
+        record.__dict__.pop("sample_every", None)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(stream=None) -> None:
+    """
+    Installs the queue handler on the root logger and starts the listener
+    thread. Safe to call more than once; only the first call does anything.
+
+    Args:
+        stream: Output stream for the listener (default: stdout)
+    """
+    global _listener, _queue_handler
+
+    with _configure_lock:
+        if _listener is not None:
+            return
+
+        if os.getenv("LOG_FORMAT", "json").lower() == "text":
+            formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        else:
+            formatter = JsonFormatter()
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(formatter)
+
+        sampling = {}
+        for name, every in parse_mapping(os.getenv("LOG_SAMPLING")).items():
+            try:
+                sampling[name] = int(every)
+            except ValueError:
+                pass
+
+        _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=QUEUE_SIZE))
+        _queue_handler.addFilter(SamplingFilter(sampling))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+        # Uvicorn installs its own synchronous handlers; send them through the queue too
+        for name in _SERVER_LOGGERS:
+            server_logger = logging.getLogger(name)
+            server_logger.handlers = []
+            server_logger.propagate = True
+
+        for name, level in parse_mapping(os.getenv("LOG_LEVELS")).items():
+            logging.getLogger(name).setLevel(level.upper())
+
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, output, respect_handler_level=True)
+        _listener.start()
+
+
+def _restart_after_fork() -> None:
+    # The listener thread does not survive fork, and the parent's queue may
+    # have been locked mid-put; give the child a fresh queue and listener
+    global _listener, _configure_lock
+    _configure_lock = threading.Lock()
+    if _listener is None:
+        return
+    _queue_handler.queue = queue.Queue(maxsize=QUEUE_SIZE)
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def shutdown_logging() -> None:
+    """
+    Writes out queued records and stops the listener thread.
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+
+
+def get_stats() -> Dict:
+    """
+    Queue depth and dropped-record count for this process.
+    """
+    if _queue_handler is None:
+        return {"configured": False}
+    return {
+        "configured": True,
+        "queued": _queue_handler.queue.qsize(),
+        "capacity": QUEUE_SIZE,
+        "dropped": _queue_handler.dropped,
+    }
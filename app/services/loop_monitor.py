@@ -0,0 +1,175 @@
+"""
+Loop Monitor - Catches blocking calls that freeze a worker's event loop
+
+A heartbeat task sleeps INTERVAL_SECONDS at a time and records how late
+it wakes up (the scheduling lag every other coroutine on the loop also
+suffers). A watchdog thread checks when the heartbeat last ran; if the
+loop has been stuck for longer than THRESHOLD_SECONDS, it captures the
+stack of the event loop thread with sys._current_frames() - which shows
+the blocking call and the handler that made it - logs it and keeps it for
+GET /metrics/event-loop.
+
+Exported metrics: event_loop_lag_seconds (histogram of heartbeat lag) and
+event_loop_blocked_total (stalls over the threshold).
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.services import metrics
+from app.services.metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+# Seconds between heartbeats (0 disables the monitor)
+INTERVAL_SECONDS = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", "0.1"))
+
+# A loop stuck for longer than this is reported with its stack
+THRESHOLD_SECONDS = float(os.getenv("LOOP_LAG_THRESHOLD_SECONDS", "0.5"))
+
+# Number of recent lag samples kept for percentiles
+LAG_SAMPLES = 1024
+
+# Number of recent stalls kept with their stacks
+MAX_STALLS = 50
+
+# Innermost frames kept per stack
+STACK_DEPTH = 40
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _culprit(frames: List[traceback.FrameSummary]) -> Optional[str]:
+    """
+    The innermost frame in this app's own code, e.g. "main.py:532 in get_buyers_by_commodity".
+    """
+    for frame in reversed(frames):
+        if frame.filename.startswith(APP_DIR):
+            return f"{os.path.relpath(frame.filename, APP_DIR)}:{frame.lineno} in {frame.name}"
+    return None
+
+
+class LoopMonitor:
+    """
+    Heartbeat task plus watchdog thread for one event loop.
+    """
+
+    def __init__(self, interval: float = INTERVAL_SECONDS, threshold: float = THRESHOLD_SECONDS):
+        self.interval = interval
+        self.threshold = threshold
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._lags = deque(maxlen=LAG_SAMPLES)
+        self._stalls = deque(maxlen=MAX_STALLS)
+        # Stall currently in progress, completed by the next heartbeat
+        self._stall: Optional[Dict] = None
+        self._lock = threading.Lock()
+
+        self.beats = 0
+        self.blocked = 0
+        self.max_lag = 0.0
+
+    async def start(self) -> None:
+        """
+        Starts the heartbeat on the running loop and the watchdog thread.
+        """
+        if self.interval <= 0:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat(), name="loop-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join, 2 * self.interval + 1)
+            self._watchdog = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - started - self.interval)
+            self._beat(now, lag)
+
+    def _beat(self, now: float, lag: float) -> None:
+        with self._lock:
+            self._last_beat = now
+            self.beats += 1
+            self._lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            stall, self._stall = self._stall, None
+            if stall is not None:
+                stall["lag_seconds"] = round(lag, 3)
+        metrics.observe("event_loop_lag_seconds", lag)
+        if stall is not None:
+            logger.warning("Event loop was blocked for %.2fs at %s", lag, stall["culprit"] or "unknown")
+
+    def _watch(self) -> None:
+        # Check several times per threshold so a stall is caught while it is happening
+        check_every = max(min(self.interval, self.threshold) / 2, 0.01)
+        while not self._stop.wait(check_every):
+            with self._lock:
+                stuck_for = time.monotonic() - self._last_beat - self.interval
+                if stuck_for < self.threshold or self._stall is not None:
+                    continue
+                frame = sys._current_frames().get(self._loop_thread_id)
+                frames = traceback.extract_stack(frame)[-STACK_DEPTH:] if frame is not None else []
+                stall = self._stall = {
+                    "detected_at": datetime.now().isoformat(timespec="milliseconds"),
+                    "stuck_seconds_at_detection": round(stuck_for, 3),
+                    # Filled in by the heartbeat once the loop runs again
+                    "lag_seconds": None,
+                    "culprit": _culprit(frames),
+                    "stack": [f"{f.filename}:{f.lineno} in {f.name}" for f in frames],
+                }
+                self._stalls.append(stall)
+                self.blocked += 1
+            metrics.increment("event_loop_blocked_total")
+            logger.warning(
+                "Event loop blocked for %.2fs so far at %s\n%s", stuck_for, stall["culprit"] or "unknown",
+                "".join(traceback.format_list(frames))
+            )
+
+    def stats(self) -> Dict:
+        """
+        Lag percentiles (milliseconds), stall count and recent stalls
+        (newest first) with the stack of the loop thread when detected.
+        """
+        with self._lock:
+            lags = list(self._lags)
+            stalls = [dict(stall) for stall in reversed(self._stalls)]
+
+        def ms(value):
+            return round(value * 1000, 2) if value is not None else None
+
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "interval_ms": ms(self.interval),
+            "threshold_ms": ms(self.threshold),
+            "beats": self.beats,
+            "blocked": self.blocked,
+            "lag_ms": {
+                **{f"p{p}": ms(percentile(lags, p)) for p in (50, 95, 99)},
+                "max": ms(self.max_lag),
+            },
+            "stalls": stalls,
+        }
@@ -0,0 +1,119 @@
+"""
+Message Deduplication - Remembers which WhatsApp message IDs were handled
+
+Meta redelivers webhook events when a delivery times out, so the same
+message can arrive more than once, possibly at a different worker. IDs are
+claimed in the shared SQLite store (one claim wins across all workers and
+survives restarts), with a small in-memory LRU in front to skip the
+database for recent repeats.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List
+
+from app.services import local_store
+
+# Meta retries failed deliveries for up to 7 days
+TTL_SECONDS = int(os.getenv("DEDUP_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Recent IDs remembered per process
+MEMORY_SIZE = int(os.getenv("DEDUP_MEMORY_SIZE", "10000"))
+
+# Expired IDs are purged after this many claims
+PURGE_EVERY = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen_messages (
+    message_id TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_seen_messages_seen_at ON seen_messages (seen_at);
+"""
+
+_recent: "OrderedDict[str, float]" = OrderedDict()
+_lock = threading.Lock()
+_claims_since_purge = 0
+
+
+def _remember(message_id: str, seen_at: float) -> None:
+    _recent[message_id] = seen_at
+    _recent.move_to_end(message_id)
+    while len(_recent) > MEMORY_SIZE:
+        _recent.popitem(last=False)
+
+
+def _seen_recently(message_id: str, now: float) -> bool:
+    seen_at = _recent.get(message_id)
+    if seen_at is None:
+        return False
+    if seen_at < now - TTL_SECONDS:
+        del _recent[message_id]
+        return False
+    _recent.move_to_end(message_id)
+    return True
+
+
+def claim_new(message_ids: Iterable[str]) -> List[str]:
+    """
+    Claims message IDs for processing.
+
+    Each ID is returned by at most one call across all workers while it is
+    within TTL_SECONDS; later deliveries of the same ID are filtered out.
+
+    Args:
+        message_ids: WhatsApp message IDs from a webhook payload
+
+    Returns:
+        The IDs that have not been seen before, in input order
+    """
+    global _claims_since_purge
+    now = time.time()
+
+    with _lock:
+        candidates = []
+        for message_id in message_ids:
+            if message_id and not _seen_recently(message_id, now) and message_id not in candidates:
+                candidates.append(message_id)
+
+    if not candidates:
+        return []
+
+    local_store.ensure_schema("message_dedup", SCHEMA)
+    new_ids = []
+    with local_store.transaction() as conn:
+        for message_id in candidates:
+            cursor = conn.execute(
+                """INSERT INTO seen_messages (message_id, seen_at) VALUES (?, ?)
+                   ON CONFLICT (message_id) DO UPDATE SET seen_at = excluded.seen_at
+                   WHERE seen_messages.seen_at < ?""",
+                (message_id, now, now - TTL_SECONDS)
+            )
+            if cursor.rowcount:
+                new_ids.append(message_id)
+
+        _claims_since_purge += len(candidates)
+        if _claims_since_purge >= PURGE_EVERY:
+            conn.execute("DELETE FROM seen_messages WHERE seen_at < ?", (now - TTL_SECONDS,))
+            _claims_since_purge = 0
+
+    with _lock:
+        for message_id in candidates:
+            _remember(message_id, now)
+
+    return new_ids
+
+
+def release(message_id: str) -> None:
+    """
+    Forgets a claimed message ID whose handling failed, so a redelivery of
+    the same message is processed instead of dropped as a duplicate.
+
+    Args:
+        message_id: ID returned by claim_new()
+    """
+    with _lock:
+        _recent.pop(message_id, None)
+    local_store.ensure_schema("message_dedup", SCHEMA)
+    local_store.get_connection().execute("DELETE FROM seen_messages WHERE message_id = ?", (message_id,))
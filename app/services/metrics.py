@@ -0,0 +1,319 @@
+"""
+Metrics - In-process counters and latency histograms
+
+Counters and histograms are keyed by name plus labels, e.g.
+    metrics.increment("broadcast_messages_total", outcome="sent")
+    with metrics.upstream_call("open_meteo"):
+        requests.get(...)
+
+Histograms use fixed buckets, so memory stays constant however many
+observations a run makes, and snapshots from several processes can be
+added together.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Bucket upper bounds in seconds (the last bucket is +Inf)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Upstream services timed with upstream_call()
+UPSTREAM_KAMIS = "kamis"
+UPSTREAM_OPEN_METEO = "open_meteo"
+UPSTREAM_OPENWEATHERMAP = "openweathermap"
+UPSTREAM_GRAPH_API = "graph_api"
+UPSTREAM_SHEETS = "sheets"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def percentile(samples: List[float], pct: float) -> Optional[float]:
+    """
+    Nearest-rank percentile of a list of samples.
+
+    Args:
+        samples: Values to summarize
+        pct: Percentile between 0 and 100
+
+    Returns:
+        The percentile value, or None if there are no samples
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class Histogram:
+    """
+    Bucketed histogram: per-bucket counts, count, sum and max.
+    """
+
+    __slots__ = ("bounds", "counts", "count", "sum", "max")
+
+    def __init__(self, bounds: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimates a quantile (0-1) by interpolating inside its bucket.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.bounds[index - 1] if index > 0 else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else self.max
+                fraction = (rank - seen) / bucket_count
+                return min(lower + (upper - lower) * fraction, self.max)
+            seen += bucket_count
+        return self.max
+
+    def summary(self) -> Dict:
+        """
+        Count, total, mean, max and p50/p95/p99 estimates (seconds).
+        """
+        def rounded(value):
+            return round(value, 4) if value is not None else None
+
+        return {
+            "count": self.count,
+            "sum_seconds": round(self.sum, 4),
+            "mean_seconds": rounded(self.sum / self.count) if self.count else None,
+            "max_seconds": rounded(self.max) if self.count else None,
+            "p50_seconds": rounded(self.quantile(0.50)),
+            "p95_seconds": rounded(self.quantile(0.95)),
+            "p99_seconds": rounded(self.quantile(0.99)),
+        }
+
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, LabelKey], float] = {}
+_histograms: Dict[Tuple[str, LabelKey], Histogram] = {}
+_gauges: Dict[Tuple[str, LabelKey], float] = {}
+_gauge_callbacks: Dict[str, Callable[[], float]] = {}
+
+
+def _key(name: str, labels: Dict[str, str]) -> Tuple[str, LabelKey]:
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def increment(name: str, amount: float = 1, **labels) -> None:
+    """
+    Adds to a counter.
+    """
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """
+    Records one observation (usually seconds) in a histogram.
+    """
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(value)
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    """
+    Sets a gauge to a value.
+    """
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def add_gauge(name: str, delta: float, **labels) -> None:
+    """
+    Moves a gauge up or down (e.g. requests in flight).
+    """
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + delta
+
+
+def register_gauge(name: str, callback: Callable[[], float]) -> None:
+    """
+    Registers a gauge read when a snapshot is taken (e.g. a queue depth).
+    """
+    with _lock:
+        _gauge_callbacks[name] = callback
+
+
+@contextmanager
+def timer(name: str, **labels) -> Iterator[None]:
+    """
+    Times the block into a histogram (also when it raises).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+@contextmanager
+def upstream_call(upstream: str) -> Iterator[None]:
+    """
+    Times a call to an upstream service and counts it by outcome.
+
+    Records upstream_call_seconds{upstream} and
+    upstream_calls_total{upstream, outcome="ok"|"error"}. An exception
+    raised inside the block counts as an error and is re-raised.
+    """
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        observe("upstream_call_seconds", time.perf_counter() - started, upstream=upstream)
+        increment("upstream_calls_total", upstream=upstream, outcome=outcome)
+
+
+def snapshot() -> Dict:
+    """
+    Copies every counter and histogram in this process.
+
+    Returns:
+        {"counters": [{name, labels, value}], "gauges": [{name, labels,
+        value}], "histograms": [{name, labels, bounds, counts, count, sum,
+        max}]}
+    """
+    with _lock:
+        callbacks = list(_gauge_callbacks.items())
+    gauges = []
+    for name, callback in callbacks:
+        try:
+            gauges.append({"name": name, "labels": {}, "value": float(callback())})
+        except Exception:
+            continue
+
+    with _lock:
+        gauges.extend(
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in _gauges.items()
+        )
+        counters = [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in _counters.items()
+        ]
+        histograms = [
+            {
+                "name": name, "labels": dict(labels), "bounds": list(histogram.bounds),
+                "counts": list(histogram.counts), "count": histogram.count,
+                "sum": histogram.sum, "max": histogram.max,
+            }
+            for (name, labels), histogram in _histograms.items()
+        ]
+    return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+
+def get_upstream_summary() -> Dict[str, Dict]:
+    """
+    Latency summary and error count per upstream service.
+    """
+    with _lock:
+        summary = {
+            dict(labels)["upstream"]: histogram.summary()
+            for (name, labels), histogram in _histograms.items()
+            if name == "upstream_call_seconds"
+        }
+        for (name, labels), value in _counters.items():
+            labels = dict(labels)
+            if name == "upstream_calls_total" and labels.get("outcome") == "error" and labels["upstream"] in summary:
+                summary[labels["upstream"]]["errors"] = int(value)
+    for stats in summary.values():
+        stats.setdefault("errors", 0)
+    return summary
+
+
+def reset() -> None:
+    """
+    Clears all counters and histograms (for tests and benchmarks).
+    """
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _gauges.clear()
+
+
+def _reset_after_fork() -> None:
+    # Each process reports only its own work; without this, every worker
+    # forked by app/prefork.py would repeat the master's warm-up counts
+    global _lock
+    _lock = threading.Lock()
+    reset()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class StageTimer:
+    """
+    Time and call counts per stage of one run, plus named counters.
+
+    Each stage keeps a histogram, so a stage timed once per farmer costs
+    constant memory. Stage times are also recorded in the process-wide
+    broadcast_stage_seconds{stage} histogram.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            histogram = self.stages.get(name)
+            if histogram is None:
+                histogram = self.stages[name] = Histogram()
+            histogram.observe(elapsed)
+            observe("broadcast_stage_seconds", elapsed, stage=name)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def summary(self) -> Dict:
+        """
+        Wall time, per-stage timings with their share of the wall time, and
+        counters.
+        """
+        wall = time.perf_counter() - self.started
+        stages = {}
+        for name, histogram in self.stages.items():
+            stats = histogram.summary()
+            stats["share"] = round(histogram.sum / wall, 4) if wall else None
+            stages[name] = stats
+        return {
+            "wall_seconds": round(wall, 3),
+            "stages": stages,
+            "counters": dict(self.counters),
+        }
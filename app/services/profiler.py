@@ -0,0 +1,229 @@
+"""
+Profiler - Opt-in cProfile profiles of individual API requests
+
+A request is profiled when it carries the admin token in the
+X-Profile-Token header, or is picked at random at PROFILE_SAMPLE_RATE.
+Each profile is saved under PROFILE_DIR as a .prof file (load it with
+pstats or snakeviz) next to a small .json description, and the response
+carries its ID in X-Profile-Id. GET /profiles lists them and
+GET /profiles/{profile_id} downloads one.
+
+When neither trigger is configured, the middleware only checks one
+setting per request. One request is profiled at a time per worker, since
+cProfile hooks the whole thread; requests arriving meanwhile run
+unprofiled. Async handlers run on the event loop thread, so a profile
+also contains whatever other requests ran on the loop at the same time,
+and misses work handed to threads (sync endpoints, asyncio.to_thread).
+"""
+import asyncio
+import cProfile
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+
+# Requests carrying this token in X-Profile-Token are profiled (empty: header ignored)
+ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+
+# Serve /profiles without a token when none is configured (development only)
+ALLOW_UNAUTHENTICATED = os.getenv("PROFILE_ALLOW_UNAUTHENTICATED", "false").lower() == "true"
+
+# Fraction of requests profiled at random (0 disables sampling)
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+
+# Oldest profiles are deleted beyond this many
+MAX_PROFILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+TOKEN_HEADER = b"x-profile-token"
+ID_HEADER = b"x-profile-id"
+
+# Never profiled: the profile endpoints (which take the same header) and metrics scrapes
+EXCLUDED_PREFIXES = ("/profiles", "/metrics")
+
+PROFILE_ID_RE = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9]+-[0-9a-f]{6}$")
+
+# One active cProfile per worker
+_active = threading.Lock()
+
+
+def is_authorized(token: Optional[str]) -> bool:
+    """
+    Whether token matches PROFILE_ADMIN_TOKEN. With no token configured,
+    profiles are only served if PROFILE_ALLOW_UNAUTHENTICATED=true, since
+    they contain call stacks and request paths.
+    """
+    if not ADMIN_TOKEN:
+        return ALLOW_UNAUTHENTICATED
+    return bool(token) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def _trigger(scope) -> Optional[str]:
+    """
+    Why this request should be profiled ("header" or "sample"), or None.
+    """
+    if scope["path"].startswith(EXCLUDED_PREFIXES):
+        return None
+    if ADMIN_TOKEN:
+        for name, value in scope.get("headers", ()):
+            if name == TOKEN_HEADER:
+                if hmac.compare_digest(value, ADMIN_TOKEN.encode()):
+                    return "header"
+                break
+    if SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+def _new_id() -> str:
+    return f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}-{os.urandom(3).hex()}"
+
+
+def _path(profile_id: str, extension: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{profile_id}.{extension}")
+
+
+def save(profile_id: str, profile: cProfile.Profile, info: Dict) -> None:
+    """
+    Writes a profile and its description, then prunes old profiles.
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile.dump_stats(_path(profile_id, "prof"))
+
+    stats = pstats.Stats(profile)
+    info = dict(info, id=profile_id, total_calls=stats.total_calls, total_seconds=round(stats.total_tt, 4))
+    temp_path = _path(profile_id, "json.tmp")
+    with open(temp_path, "w") as f:
+        json.dump(info, f)
+    os.replace(temp_path, _path(profile_id, "json"))
+    prune()
+
+
+def prune(keep: int = MAX_PROFILES) -> int:
+    """
+    Deletes all but the newest keep profiles.
+
+    Returns:
+        Number of profiles deleted
+    """
+    try:
+        ids = sorted(name[:-5] for name in os.listdir(PROFILE_DIR) if name.endswith(".json"))
+    except FileNotFoundError:
+        return 0
+    stale = ids[:-keep] if keep > 0 else ids
+    for profile_id in stale:
+        for extension in ("prof", "json"):
+            try:
+                os.remove(_path(profile_id, extension))
+            except FileNotFoundError:
+                pass
+    return len(stale)
+
+
+def list_profiles(limit: int = 50) -> List[Dict]:
+    """
+    Descriptions of saved profiles, newest first.
+    """
+    try:
+        names = sorted((name for name in os.listdir(PROFILE_DIR) if name.endswith(".json")), reverse=True)
+    except FileNotFoundError:
+        return []
+
+    profiles = []
+    for name in names[:limit]:
+        try:
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def get_profile_path(profile_id: str) -> Optional[str]:
+    """
+    Path of a saved .prof file, or None if there is no such profile.
+    """
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    path = _path(profile_id, "prof")
+    return path if os.path.exists(path) else None
+
+
+def render_text(path: str, sort: str = "cumulative", limit: int = 60) -> str:
+    """
+    The pstats report for a saved profile, top limit functions by sort.
+    """
+    stream = io.StringIO()
+    stats = pstats.Stats(path, stream=stream)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles requests picked by _trigger and adds the
+    X-Profile-Id response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (ADMIN_TOKEN or SAMPLE_RATE > 0):
+            await self.app(scope, receive, send)
+            return
+
+        trigger = _trigger(scope)
+        if trigger is None or not _active.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = _new_id()
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = dict(message, headers=list(message.get("headers", [])) + [(ID_HEADER, profile_id.encode())])
+            await send(message)
+
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.disable()
+            _active.release()
+            info = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "route": getattr(scope.get("route"), "path", None),
+                "status": status,
+                "trigger": trigger,
+                "duration_seconds": round(time.perf_counter() - started, 4),
+                "recorded_at": datetime.now().isoformat(timespec="seconds"),
+                "worker": os.getpid(),
+            }
+            try:
+                await asyncio.to_thread(save, profile_id, profile, info)
+                metrics.increment("profiles_recorded_total", trigger=trigger)
+                logger.info("Profiled %s %s in %.3fs (%s)", info["method"], info["path"], info["duration_seconds"], profile_id)
+            except Exception as e:
+                logger.warning("Could not save profile %s: %s", profile_id, e)
@@ -0,0 +1,228 @@
+"""
+Prometheus - /metrics in the Prometheus text format, across all workers
+
+Each uvicorn worker keeps its own counters and histograms (see metrics.py)
+and publishes a snapshot to the shared SQLite store every
+PUBLISH_INTERVAL_SECONDS. Whichever worker answers /metrics publishes its
+own snapshot first, then adds up every worker's: counters and histograms
+are summed (including workers that have since exited, so totals do not
+drop when a worker restarts), gauges only over workers that are still
+publishing.
+"""
+import json
+import os
+import time
+from typing import Dict, List
+
+from app.services import local_store, metrics, run_registry
+
+# How often each worker publishes its snapshot
+PUBLISH_INTERVAL_SECONDS = float(os.getenv("METRICS_PUBLISH_SECONDS", "10"))
+
+# Snapshots not refreshed for this long are dropped entirely
+STALE_SECONDS = int(os.getenv("METRICS_STALE_SECONDS", str(24 * 3600)))
+
+# Prefix for every exported metric name
+PREFIX = "agrosoko_"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics_snapshots (
+    owner TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL,
+    snapshot TEXT NOT NULL
+);
+"""
+
+# Help text for the metrics this app records
+HELP = {
+    "http_request_duration_seconds": "HTTP request latency by route, method and status",
+    "http_requests_in_flight": "HTTP requests currently being handled",
+    "upstream_call_seconds": "Latency of calls to upstream services",
+    "upstream_calls_total": "Calls to upstream services by outcome",
+    "cache_requests_total": "Cache lookups by cache and result",
+    "cache_errors_total": "Cache backend failures (treated as misses) by cache and backend",
+    "broadcast_stage_seconds": "Time spent per daily workflow stage",
+    "webhook_queue_depth": "Webhook payloads waiting to be handled",
+    "broadcast_pending_farmers": "Farmers not yet handled by running daily workflows",
+    "http_client_request_seconds": "Outbound HTTP request latency per host (each attempt)",
+    "http_client_requests_total": "Outbound HTTP requests by host, method and status",
+    "http_client_retries_total": "Outbound HTTP retries per host",
+    "http_client_request_bytes_total": "Outbound HTTP request body bytes per host",
+    "http_client_response_bytes_total": "Outbound HTTP response body bytes per host",
+    "event_loop_lag_seconds": "How late the event loop heartbeat woke up",
+    "event_loop_blocked_total": "Times the event loop was blocked past the lag threshold",
+    "profiles_recorded_total": "Request profiles saved, by trigger (header or sample)",
+    "snapshot_swaps_total": "Data snapshots swapped in, by snapshot and whether this worker published or mapped it",
+}
+
+
+def _ensure_schema():
+    local_store.ensure_schema("prometheus", SCHEMA)
+
+
+def publish() -> None:
+    """
+    Writes this worker's current snapshot to the shared store.
+    """
+    _ensure_schema()
+    local_store.get_connection().execute(
+        """INSERT INTO metrics_snapshots (owner, updated_at, snapshot) VALUES (?, ?, ?)
+           ON CONFLICT (owner) DO UPDATE SET updated_at = excluded.updated_at, snapshot = excluded.snapshot""",
+        (run_registry.owner_id(), time.time(), json.dumps(metrics.snapshot()))
+    )
+
+
+def collect() -> Dict:
+    """
+    Publishes this worker's snapshot and merges every worker's.
+
+    Returns:
+        Merged snapshot (same shape as metrics.snapshot())
+    """
+    publish()
+    now = time.time()
+    conn = local_store.get_connection()
+    conn.execute("DELETE FROM metrics_snapshots WHERE updated_at < ?", (now - STALE_SECONDS,))
+    rows = conn.execute("SELECT updated_at, snapshot FROM metrics_snapshots").fetchall()
+
+    live_after = now - 3 * PUBLISH_INTERVAL_SECONDS
+    snapshots = []
+    for row in rows:
+        snapshot = json.loads(row["snapshot"])
+        if row["updated_at"] < live_after:
+            snapshot["gauges"] = []
+        snapshots.append(snapshot)
+
+    merged = merge(snapshots)
+    # Shared state, reported once rather than per worker
+    merged["gauges"].append({
+        "name": "broadcast_pending_farmers", "labels": {}, "value": run_registry.pending_farmers()
+    })
+    return merged
+
+
+def merge(snapshots: List[Dict]) -> Dict:
+    """
+    Adds up snapshots from several processes.
+    """
+    counters: Dict[tuple, Dict] = {}
+    gauges: Dict[tuple, Dict] = {}
+    histograms: Dict[tuple, Dict] = {}
+
+    for snapshot in snapshots:
+        for kind, merged in (("counters", counters), ("gauges", gauges)):
+            for sample in snapshot.get(kind, []):
+                key = (sample["name"], tuple(sorted(sample["labels"].items())))
+                if key in merged:
+                    merged[key]["value"] += sample["value"]
+                else:
+                    merged[key] = dict(sample)
+
+        for sample in snapshot.get("histograms", []):
+            key = (sample["name"], tuple(sorted(sample["labels"].items())), tuple(sample["bounds"]))
+            existing = histograms.get(key)
+            if existing is None:
+                histograms[key] = dict(sample, counts=list(sample["counts"]))
+                continue
+            existing["counts"] = [a + b for a, b in zip(existing["counts"], sample["counts"])]
+            existing["count"] += sample["count"]
+            existing["sum"] += sample["sum"]
+            existing["max"] = max(existing["max"], sample["max"])
+
+    return {
+        "counters": list(counters.values()),
+        "gauges": list(gauges.values()),
+        "histograms": list(histograms.values()),
+    }
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Dict, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in sorted(labels.items())]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render(snapshot: Dict) -> str:
+    """
+    Formats a snapshot in the Prometheus text exposition format.
+    """
+    families: Dict[str, Dict] = {}
+    for kind, metric_type in (("counters", "counter"), ("gauges", "gauge"), ("histograms", "histogram")):
+        for sample in snapshot.get(kind, []):
+            family = families.setdefault(sample["name"], {"type": metric_type, "samples": []})
+            family["samples"].append(sample)
+
+    lines = []
+    for name in sorted(families):
+        family = families[name]
+        full_name = PREFIX + name
+        if name in HELP:
+            lines.append(f"# HELP {full_name} {HELP[name]}")
+        lines.append(f"# TYPE {full_name} {family['type']}")
+
+        for sample in sorted(family["samples"], key=lambda s: sorted(s["labels"].items())):
+            labels = sample["labels"]
+            if family["type"] != "histogram":
+                lines.append(f"{full_name}{_labels(labels)} {_number(sample['value'])}")
+                continue
+
+            cumulative = 0
+            for bound, count in zip(list(sample["bounds"]) + [float("inf")], sample["counts"]):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{full_name}_bucket{_labels(labels, le)} {cumulative}")
+            lines.append(f"{full_name}_sum{_labels(labels)} {_number(sample['sum'])}")
+            lines.append(f"{full_name}_count{_labels(labels)} {sample['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording http_request_duration_seconds{method, route,
+    status} and http_requests_in_flight.
+
+    The route label is the path template ("/runs/{run_id}"), so IDs in
+    URLs do not create new series; unmatched paths share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        metrics.add_gauge("http_requests_in_flight", 1)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.add_gauge("http_requests_in_flight", -1)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            metrics.observe(
+                "http_request_duration_seconds", time.perf_counter() - started,
+                method=scope["method"], route=route, status=status
+            )
@@ -0,0 +1,231 @@
+"""
+Response Cache - Pre-serialized JSON bodies for read-heavy endpoints
+
+Bodies are built once per data version and kept as bytes with a strong
+ETag. Requests carrying a matching If-None-Match get a 304 without any
+serialization work.
+
+Compressed variants (gzip, and brotli when the package is installed) are
+produced on first request and kept with the body, so compression is paid
+once per data version rather than per request.
+"""
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from app.services import metrics
+
+# Brotli is optional; gzip is always available
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Maximum number of cached bodies (filters on /api/buyers create one each)
+MAX_ENTRIES = 256
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_SIZE = 1024
+
+# Encodings a body can be sent with (None is identity)
+ENCODINGS = (None, "gzip", "br")
+
+# Compression settings (fast levels: large bodies are compressed inline)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+class CachedBody:
+    """
+    A serialized response body, its validator and compressed variants.
+    """
+    __slots__ = ("version", "body", "etag", "_encoded")
+
+    def __init__(self, version: Hashable, body: bytes):
+        self.version = version
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self._encoded = {}
+
+    def encoded(self, encoding: str) -> bytes:
+        """
+        Returns the body compressed with encoding ("gzip" or "br").
+        """
+        data = self._encoded.get(encoding)
+        if data is None:
+            if encoding == "br":
+                data = brotli.compress(self.body, quality=BROTLI_QUALITY)
+            else:
+                data = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+            self._encoded[encoding] = data
+        return data
+
+    def variant_etag(self, encoding: Optional[str]) -> str:
+        """
+        ETag of an encoded variant (strong ETags differ per encoding).
+        """
+        if not encoding:
+            return self.etag
+        return self.etag[:-1] + "-" + encoding + '"'
+
+    def matches(self, etag: str) -> bool:
+        """
+        True if etag is the ETag of this body or of one of its encoded variants.
+        """
+        return any(etag == self.variant_etag(encoding) for encoding in ENCODINGS)
+
+
+_entries: "OrderedDict[Hashable, CachedBody]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def serialize(content) -> bytes:
+    """
+    Serializes content the same way FastAPI's JSONResponse does.
+
+    Content made of plain Python types is dumped directly; anything else
+    (pandas values, models) goes through jsonable_encoder first.
+    """
+    try:
+        text = json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"))
+    except (TypeError, ValueError):
+        text = json.dumps(
+            jsonable_encoder(content),
+            ensure_ascii=False,
+            allow_nan=False,
+            indent=None,
+            separators=(",", ":"),
+        )
+    return text.encode("utf-8")
+
+
+def get_or_build(key: Hashable, version: Hashable, build: Callable[[], dict]) -> CachedBody:
+    """
+    Returns the cached body for key if it was built for this data version,
+    otherwise builds, serializes and stores a new one.
+
+    Args:
+        key: Cache key (endpoint and normalized query parameters)
+        version: Data version the body must match
+        build: Function returning the response content
+
+    Returns:
+        CachedBody for the current version
+    """
+    cache_name = key[0] if isinstance(key, tuple) and key else str(key)
+    with _lock:
+        cached = _entries.get(key)
+        if cached is not None and cached.version == version:
+            _entries.move_to_end(key)
+            hit = True
+        else:
+            hit = False
+    metrics.increment("cache_requests_total", cache=cache_name, result="hit" if hit else "miss")
+    if hit:
+        return cached
+
+    cached = CachedBody(version, serialize(build()))
+
+    with _lock:
+        _entries[key] = cached
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+    return cached
+
+
+def clear() -> None:
+    """
+    Drops every cached body.
+    """
+    with _lock:
+        _entries.clear()
+
+
+def _etag_matches(if_none_match: Optional[str], cached: CachedBody) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        # Any variant's ETag identifies the same representation
+        if cached.matches(candidate):
+            return True
+    return False
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Picks the best content encoding the client accepts.
+
+    Args:
+        accept_encoding: Accept-Encoding request header
+
+    Returns:
+        "br", "gzip" or None for identity
+    """
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    wildcard = accepted.get("*", 0.0)
+    for encoding in (("br", "gzip") if BROTLI_AVAILABLE else ("gzip",)):
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def respond(request: Request, cached: CachedBody, max_age: int, cache_control: str = "public") -> Response:
+    """
+    Builds the HTTP response for a cached body, answering conditional
+    requests with 304 Not Modified and compressing large bodies for
+    clients that accept it.
+
+    Args:
+        request: Incoming request (for If-None-Match and Accept-Encoding)
+        cached: Body from get_or_build()
+        max_age: Seconds clients may reuse the response without revalidating
+        cache_control: "public", or "private" for bodies with personal data
+            that shared caches (proxies, CDNs) must not store
+
+    Returns:
+        200 response with the body, or an empty 304
+    """
+    encoding = None
+    if len(cached.body) >= MIN_COMPRESS_SIZE:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+
+    headers = {
+        "ETag": cached.variant_etag(encoding),
+        "Cache-Control": f"{cache_control}, max-age={max_age}",
+        "Vary": "Accept-Encoding",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), cached):
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return Response(content=cached.encoded(encoding), media_type="application/json", headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
@@ -0,0 +1,551 @@
+"""
+Run Registry - One daily workflow run per day, shared by all workers
+
+Every trigger of the daily workflow goes through claim_run(), which takes
+the SQLite write lock, so only one process on the machine can own a run.
+A run owned by a process on this host is abandoned only once that process
+has exited; a slow scrape or Sheets read never hands it to a second
+worker. For an owner on another host, which cannot be checked, the run is
+abandoned when its heartbeat (renewed by hold_lease() while the run is
+held) is older than LEASE_SECONDS.
+
+Each farmer handled is checkpointed, so a taken-over run skips everyone
+already messaged and continues from the first unprocessed farmer.
+"""
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from app.services import local_store
+
+# Run states
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+
+# A running run with no heartbeat for this long is considered dead
+LEASE_SECONDS = int(os.getenv("RUN_LEASE_SECONDS", "300"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    run_date TEXT NOT NULL,
+    status TEXT NOT NULL,
+    owner TEXT,
+    heartbeat_at REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    total INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    resumed_from INTEGER NOT NULL DEFAULT 0,
+    trigger_count INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+
+CREATE TABLE IF NOT EXISTS run_checkpoints (
+    run_id TEXT NOT NULL,
+    farmer_key TEXT NOT NULL,
+    sent INTEGER NOT NULL,
+    completed_at REAL NOT NULL,
+    PRIMARY KEY (run_id, farmer_key)
+);
+
+CREATE TABLE IF NOT EXISTS run_summaries (
+    run_id TEXT NOT NULL,
+    attempt INTEGER NOT NULL,
+    run_date TEXT NOT NULL,
+    status TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    recorded_at REAL NOT NULL,
+    PRIMARY KEY (run_id, attempt)
+);
+"""
+
+
+def _ensure_schema():
+    local_store.ensure_schema("run_registry", SCHEMA)
+
+
+def _process_start_time(pid: int) -> Optional[str]:
+    # Clock ticks since boot at which the process started (Linux only);
+    # tells a live owner apart from a new process that reused its pid
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rpartition(")")[2].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def owner_id() -> str:
+    """
+    Identifies this worker process (host, pid and, where available, the
+    process start time).
+    """
+    pid = os.getpid()
+    start = _process_start_time(pid)
+    return f"{socket.gethostname()}:{pid}:{start}" if start else f"{socket.gethostname()}:{pid}"
+
+
+def make_run_id(run_date: Optional[str] = None) -> str:
+    """
+    Builds the run ID for a day's workflow.
+
+    Args:
+        run_date: Date as YYYY-MM-DD (default: today)
+
+    Returns:
+        Run ID like "daily-2025-11-21"
+    """
+    run_date = run_date or datetime.now().strftime("%Y-%m-%d")
+    return f"daily-{run_date}"
+
+
+def _row_to_run(row) -> Optional[Dict]:
+    if row is None:
+        return None
+    run = dict(row)
+    run["cancel_requested"] = bool(run["cancel_requested"])
+    run["lease_expired"] = _is_abandoned(run)
+    run.update(_progress_rates(run))
+    return run
+
+
+def _progress_rates(run: Dict) -> Dict:
+    """
+    Throughput of the current attempt and the time left at that rate.
+    """
+    done_this_attempt = run["processed"] - run["resumed_from"]
+    end = run["finished_at"] or run["heartbeat_at"] or time.time()
+    elapsed = end - (run["started_at"] or end)
+
+    rate = done_this_attempt / elapsed if elapsed > 0 and done_this_attempt > 0 else 0.0
+    remaining = max(run["total"] - run["processed"], 0)
+    eta = remaining / rate if rate and run["status"] == STATUS_RUNNING else None
+
+    return {
+        "elapsed_seconds": round(elapsed, 1),
+        "farmers_per_second": round(rate, 3),
+        "eta_seconds": round(eta, 1) if eta is not None else None
+    }
+
+
+def is_local_owner(owner: Optional[str]) -> bool:
+    """
+    True if owner is a process on this host.
+    """
+    parts = (owner or "").split(":")
+    return len(parts) in (2, 3) and parts[0] == socket.gethostname() and parts[1].isdigit()
+
+
+def owner_exited(owner: Optional[str]) -> bool:
+    """
+    True if owner is a process on this host that no longer exists (or
+    whose pid now belongs to a different process).
+    """
+    if not is_local_owner(owner):
+        return False
+    parts = owner.split(":")
+    pid = int(parts[1])
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    if len(parts) == 3:
+        start = _process_start_time(pid)
+        return start is not None and start != parts[2]
+    return False
+
+
+def owner_gone(owner: Optional[str], heartbeat_at: Optional[float], lease_seconds: float,
+               now: Optional[float] = None) -> bool:
+    """
+    Whether work held by owner can be taken over: on this host only once
+    the owner process has exited, elsewhere once its heartbeat is older
+    than lease_seconds.
+    """
+    if is_local_owner(owner):
+        return owner_exited(owner)
+    return (heartbeat_at or 0) < (now or time.time()) - lease_seconds
+
+
+def _is_abandoned(run: Dict, now: Optional[float] = None) -> bool:
+    if run["status"] != STATUS_RUNNING:
+        return False
+    return owner_gone(run["owner"], run["heartbeat_at"], LEASE_SECONDS, now)
+
+
+def claim_run(run_id: str, resume: bool = False) -> Tuple[Dict, bool]:
+    """
+    Claims a run for this process, or returns the run that already exists.
+
+    A new run is created when none exists for run_id. An existing run is
+    taken over only when its owner stopped heartbeating, or when resume is
+    requested for a failed or cancelled run. Completed runs are never
+    restarted.
+
+    Args:
+        run_id: Run ID from make_run_id()
+        resume: Restart a failed or cancelled run
+
+    Returns:
+        (run, started) where started is True if the caller now owns the run
+    """
+    _ensure_schema()
+    now = time.time()
+    me = owner_id()
+
+    with local_store.transaction() as conn:
+        row = conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+
+        if row is None:
+            conn.execute(
+                """INSERT INTO runs (run_id, run_date, status, owner, heartbeat_at,
+                                     created_at, started_at, attempts, trigger_count)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, 1, 1)""",
+                (run_id, run_id.replace("daily-", "", 1), STATUS_RUNNING, me, now, now, now)
+            )
+            started = True
+        else:
+            run = dict(row)
+            takeover = _is_abandoned(run, now) or (
+                resume and run["status"] in (STATUS_FAILED, STATUS_CANCELLED)
+            )
+            if takeover:
+                conn.execute(
+                    """UPDATE runs SET status = ?, owner = ?, heartbeat_at = ?, started_at = ?,
+                                       finished_at = NULL, cancel_requested = 0, error = NULL,
+                                       resumed_from = processed, attempts = attempts + 1,
+                                       trigger_count = trigger_count + 1
+                       WHERE run_id = ?""",
+                    (STATUS_RUNNING, me, now, now, run_id)
+                )
+            else:
+                conn.execute("UPDATE runs SET trigger_count = trigger_count + 1 WHERE run_id = ?", (run_id,))
+            started = takeover
+
+        row = conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+
+    return _row_to_run(row), started
+
+
+def heartbeat(run_id: str, total: int) -> bool:
+    """
+    Renews this process's lease on the run and records the roster size.
+
+    Args:
+        run_id: Run being processed
+        total: Farmers in today's roster
+
+    Returns:
+        True if the run should continue, False if it was cancelled or
+        another process has taken it over
+    """
+    _ensure_schema()
+    conn = local_store.get_connection()
+    cursor = conn.execute(
+        """UPDATE runs SET heartbeat_at = ?, total = ?
+           WHERE run_id = ? AND owner = ? AND status = ?""",
+        (time.time(), total, run_id, owner_id(), STATUS_RUNNING)
+    )
+    if cursor.rowcount == 0:
+        return False
+
+    row = conn.execute("SELECT cancel_requested FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+    return not row["cancel_requested"]
+
+
+def renew_lease(run_id: str) -> bool:
+    """
+    Refreshes the heartbeat of a run this process owns.
+
+    Returns:
+        False if the run is no longer running or owned by this process
+    """
+    _ensure_schema()
+    cursor = local_store.get_connection().execute(
+        "UPDATE runs SET heartbeat_at = ? WHERE run_id = ? AND owner = ? AND status = ?",
+        (time.time(), run_id, owner_id(), STATUS_RUNNING)
+    )
+    return cursor.rowcount == 1
+
+
+@contextmanager
+def hold_lease(run_id: str) -> Iterator[None]:
+    """
+    Renews the run's heartbeat from a background thread every third of
+    LEASE_SECONDS while the block runs, so long stages (KAMIS scrape,
+    Sheets roster) never let the lease lapse.
+
+    Args:
+        run_id: Run owned by this process
+    """
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(LEASE_SECONDS / 3):
+            try:
+                if not renew_lease(run_id):
+                    return
+            except Exception:
+                # A locked database now and then is fine; the next renewal retries
+                pass
+
+    thread = threading.Thread(target=renew, name=f"lease-{run_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def completed_farmers(run_id: str) -> Set[str]:
+    """
+    Gets the farmers already checkpointed for a run.
+
+    Args:
+        run_id: Run being resumed
+
+    Returns:
+        Set of farmer keys (phone numbers) that must not be messaged again
+    """
+    _ensure_schema()
+    rows = local_store.get_connection().execute(
+        "SELECT farmer_key FROM run_checkpoints WHERE run_id = ?", (run_id,)
+    ).fetchall()
+    return {row["farmer_key"] for row in rows}
+
+
+def checkpoint_farmer(run_id: str, farmer_key: str, sent: bool, total: int) -> bool:
+    """
+    Records that a farmer has been handled and renews the lease.
+
+    The checkpoint and the run's progress counters are written in one
+    transaction, so progress always matches the checkpoint table.
+
+    Args:
+        run_id: Run being processed
+        farmer_key: Farmer's phone number
+        sent: Whether the message was sent successfully
+        total: Farmers in today's roster
+
+    Returns:
+        True if the run should continue, False if it was cancelled or
+        another process has taken it over
+    """
+    _ensure_schema()
+
+    with local_store.transaction() as conn:
+        row = conn.execute(
+            "SELECT owner, status, cancel_requested FROM runs WHERE run_id = ?", (run_id,)
+        ).fetchone()
+        if row is None or row["owner"] != owner_id() or row["status"] != STATUS_RUNNING:
+            return False
+
+        record_checkpoint(conn, run_id, farmer_key, sent, total)
+        return not row["cancel_requested"]
+
+
+def record_checkpoint(conn, run_id: str, farmer_key: str, sent: bool, total: Optional[int] = None) -> None:
+    """
+    Writes a farmer's checkpoint and the run's progress inside the caller's
+    transaction, without checking who owns the run (broadcast_shards checks
+    the shard's owner instead).
+
+    Args:
+        conn: Connection with an open transaction
+        run_id: Run being processed
+        farmer_key: Farmer's phone number
+        sent: Whether the message was sent successfully
+        total: Farmers in today's roster (unchanged if None)
+    """
+    now = time.time()
+    conn.execute(
+        "INSERT OR IGNORE INTO run_checkpoints (run_id, farmer_key, sent, completed_at) VALUES (?, ?, ?, ?)",
+        (run_id, farmer_key, int(sent), now)
+    )
+    conn.execute(
+        """UPDATE runs SET heartbeat_at = ?, total = COALESCE(?, total),
+               processed = (SELECT COUNT(*) FROM run_checkpoints WHERE run_id = ?),
+               failed = (SELECT COUNT(*) FROM run_checkpoints WHERE run_id = ? AND sent = 0)
+           WHERE run_id = ?""",
+        (now, total, run_id, run_id, run_id)
+    )
+
+
+def find_abandoned_run(run_date: Optional[str] = None) -> Optional[Dict]:
+    """
+    Gets the day's run if it is still marked running but its owner is gone.
+
+    Returns:
+        Run dictionary or None
+    """
+    run = get_run(make_run_id(run_date))
+    if run and run["lease_expired"]:
+        return run
+    return None
+
+
+def finish_run(run_id: str, status: str, error: Optional[str] = None) -> None:
+    """
+    Marks a run owned by this process as finished.
+
+    Args:
+        run_id: Run to finish
+        status: completed, failed or cancelled
+        error: Error message for failed runs
+    """
+    _ensure_schema()
+    local_store.get_connection().execute(
+        """UPDATE runs SET status = ?, finished_at = ?, error = ?
+           WHERE run_id = ? AND owner = ?""",
+        (status, time.time(), error, run_id, owner_id())
+    )
+
+
+def close_run(conn, run_id: str, status: str, error: Optional[str] = None) -> bool:
+    """
+    Finishes a running run whoever owns it, inside the caller's transaction.
+    Used when the run's work was spread over several processes and the
+    last one to finish closes it.
+
+    Returns:
+        True if the run was still running and is now closed
+    """
+    cursor = conn.execute(
+        "UPDATE runs SET status = ?, finished_at = ?, error = ? WHERE run_id = ? AND status = ?",
+        (status, time.time(), error, run_id, STATUS_RUNNING)
+    )
+    return cursor.rowcount > 0
+
+
+def request_cancel(run_id: str) -> Optional[Dict]:
+    """
+    Asks the owner of a running run to stop at the next farmer.
+
+    Args:
+        run_id: Run to cancel
+
+    Returns:
+        The run, or None if it does not exist
+    """
+    _ensure_schema()
+    conn = local_store.get_connection()
+    conn.execute(
+        "UPDATE runs SET cancel_requested = 1 WHERE run_id = ? AND status = ?",
+        (run_id, STATUS_RUNNING)
+    )
+    return get_run(run_id)
+
+
+def get_run(run_id: str) -> Optional[Dict]:
+    """
+    Gets a run by ID.
+
+    Returns:
+        Run dictionary or None if not found
+    """
+    _ensure_schema()
+    row = local_store.get_connection().execute(
+        "SELECT * FROM runs WHERE run_id = ?", (run_id,)
+    ).fetchone()
+    return _row_to_run(row)
+
+
+def list_runs(limit: int = 30) -> List[Dict]:
+    """
+    Lists the most recent runs, newest first.
+
+    Args:
+        limit: Maximum number of runs to return
+
+    Returns:
+        List of run dictionaries
+    """
+    _ensure_schema()
+    rows = local_store.get_connection().execute(
+        "SELECT * FROM runs ORDER BY created_at DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return [_row_to_run(row) for row in rows]
+
+
+def pending_farmers() -> int:
+    """
+    Farmers not yet handled across all running runs.
+    """
+    _ensure_schema()
+    row = local_store.get_connection().execute(
+        "SELECT COALESCE(SUM(MAX(total - processed, 0)), 0) AS pending FROM runs WHERE status = ?",
+        (STATUS_RUNNING,)
+    ).fetchone()
+    return row["pending"]
+
+
+def save_summary(run_id: str, status: str, summary: Dict) -> None:
+    """
+    Stores the timing summary of this process's attempt at a run.
+
+    Args:
+        run_id: Run that just finished
+        status: How the attempt ended (completed, failed or cancelled)
+        summary: JSON-serializable stage timings and counters
+    """
+    _ensure_schema()
+    with local_store.transaction() as conn:
+        row = conn.execute("SELECT run_date, attempts FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            return
+        conn.execute(
+            """INSERT OR REPLACE INTO run_summaries (run_id, attempt, run_date, status, summary, recorded_at)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (run_id, row["attempts"], row["run_date"], status, json.dumps(summary), time.time())
+        )
+
+
+def _row_to_summary(row) -> Dict:
+    summary = dict(row)
+    summary["summary"] = json.loads(summary["summary"])
+    return summary
+
+
+def get_summaries(run_id: str) -> List[Dict]:
+    """
+    Gets the timing summaries recorded for a run, one per attempt.
+
+    Returns:
+        List of summaries, first attempt first
+    """
+    _ensure_schema()
+    rows = local_store.get_connection().execute(
+        "SELECT * FROM run_summaries WHERE run_id = ? ORDER BY attempt", (run_id,)
+    ).fetchall()
+    return [_row_to_summary(row) for row in rows]
+
+
+def list_summaries(limit: int = 30) -> List[Dict]:
+    """
+    Lists the most recent run summaries, newest first, for comparing days.
+
+    Args:
+        limit: Maximum number of summaries to return
+
+    Returns:
+        List of summaries
+    """
+    _ensure_schema()
+    rows = local_store.get_connection().execute(
+        "SELECT * FROM run_summaries ORDER BY recorded_at DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return [_row_to_summary(row) for row in rows]
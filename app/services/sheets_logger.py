@@ -1,75 +1,150 @@
-import gspread
+from __future__ import annotations
+
 from datetime import datetime
 import os
 import json
+import logging
+import threading
 from typing import Optional, List, Dict
 
-# Try to import google-auth (preferred) and fall back to oauth2client
-try:
-    from google.oauth2.service_account import Credentials as ServiceAccountCredentials
-    USE_GOOGLE_AUTH = True
-except ImportError:
-    from oauth2client.service_account import ServiceAccountCredentials
-    USE_GOOGLE_AUTH = False
+from app.services import http_client, metrics
+from app.services.lazy_imports import lazy_module, module_available
+
+# Imported on first use (see lazy_imports)
+gspread = lazy_module("gspread")
+
+# Use google-auth (preferred) and fall back to oauth2client
+USE_GOOGLE_AUTH = module_available("google.oauth2")
+if USE_GOOGLE_AUTH:
+    google_service_account = lazy_module("google.oauth2.service_account")
+    google_credentials = lazy_module("google.auth.credentials")
+    google_requests = lazy_module("google.auth.transport.requests")
+else:
+    oauth2client_service_account = lazy_module("oauth2client.service_account")
+
+logger = logging.getLogger(__name__)
 
 # Configuration
 CREDS_FILE = os.getenv("GOOGLE_SHEETS_CREDS_PATH", "credentials.json")
 SHEET_NAME = os.getenv("GOOGLE_SHEETS_NAME", "AgroGhala_Logs")
 SPREADSHEET_ID = os.getenv("GOOGLE_SHEETS_ID", None)  # Optional: use spreadsheet ID instead of name
 
+# Local Sheets/Drive stand-in (benchmarks/stubs.py), e.g. "http://127.0.0.1:8900".
+# When set, no credentials are needed and nothing reaches Google.
+EMULATOR_HOST = os.getenv("GOOGLE_SHEETS_EMULATOR_HOST")
+EMULATED_HOSTS = ("sheets.googleapis.com", "www.googleapis.com")
+
 # Required Google API scopes
 SCOPES = [
     'https://www.googleapis.com/auth/spreadsheets',
     'https://www.googleapis.com/auth/drive.file'
 ]
 
+# Authorized client reused until the credentials file changes
+_client_cache = {"version": None, "client": None}
+_client_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    # The cached client's session holds pooled connections (see http_client)
+    global _client_lock
+    _client_cache["version"] = None
+    _client_cache["client"] = None
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def is_configured() -> bool:
+    """
+    Whether Sheets logging can work at all: an emulator is set or the
+    credentials file exists. Does not check that the credentials are valid.
+    """
+    return bool(EMULATOR_HOST and USE_GOOGLE_AUTH) or os.path.exists(CREDS_FILE)
+
 
 def get_sheet_service() -> Optional[gspread.Client]:
     """
     Authenticates and returns a gspread client for Google Sheets.
     
-    Supports both google-auth (preferred) and oauth2client (legacy).
+    Supports both google-auth (preferred) and oauth2client (legacy). With
+    google-auth, requests go through the shared instrumented HTTP client.
+    The client is built once and reused until the credentials file changes,
+    so its connections and access token are reused too.
     
     Returns:
         Authenticated gspread client or None if authentication fails
     """
     try:
+        if EMULATOR_HOST and USE_GOOGLE_AUTH:
+            return _get_emulator_client()
+
         # Check if credentials file exists
         if not os.path.exists(CREDS_FILE):
-            print(f"❌ Credentials file not found: {CREDS_FILE}")
-            print(f"   Please create a service account and download credentials.")
-            print(f"   See GOOGLE_SHEETS_SETUP.md for instructions.")
+            logger.warning(
+                "Credentials file not found: %s. Create a service account and download credentials "
+                "(see GOOGLE_SHEETS_SETUP.md).", CREDS_FILE, extra={"sample_every": 100}
+            )
             return None
         
-        # Authenticate using appropriate library
-        if USE_GOOGLE_AUTH:
-            # Using modern google-auth library
-            creds = ServiceAccountCredentials.from_service_account_file(
-                CREDS_FILE, 
-                scopes=SCOPES
-            )
-            client = gspread.authorize(creds)
-            print(f"✅ Connected to Google Sheets (google-auth)")
-        else:
-            # Using legacy oauth2client library
-            creds = ServiceAccountCredentials.from_json_keyfile_name(CREDS_FILE, SCOPES)
-            client = gspread.authorize(creds)
-            print(f"✅ Connected to Google Sheets (oauth2client)")
+        stat = os.stat(CREDS_FILE)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with _client_lock:
+            if _client_cache["version"] == version:
+                return _client_cache["client"]
+            
+            # Authenticate using appropriate library
+            if USE_GOOGLE_AUTH:
+                # Using modern google-auth library
+                creds = google_service_account.Credentials.from_service_account_file(
+                    CREDS_FILE, 
+                    scopes=SCOPES
+                )
+                session = http_client.instrument_session(google_requests.AuthorizedSession(creds))
+                client = gspread.authorize(creds, session=session)
+                logger.info("Connected to Google Sheets (google-auth)")
+            else:
+                # Using legacy oauth2client library
+                creds = oauth2client_service_account.ServiceAccountCredentials.from_json_keyfile_name(CREDS_FILE, SCOPES)
+                client = gspread.authorize(creds)
+                logger.info("Connected to Google Sheets (oauth2client)")
+            
+            _client_cache["version"] = version
+            _client_cache["client"] = client
         
         return client
         
     except FileNotFoundError:
-        print(f"❌ Credentials file not found: {CREDS_FILE}")
+        logger.error("Credentials file not found: %s", CREDS_FILE)
         return None
     except json.JSONDecodeError:
-        print(f"❌ Invalid JSON in credentials file: {CREDS_FILE}")
+        logger.error("Invalid JSON in credentials file: %s", CREDS_FILE)
         return None
     except Exception as e:
-        print(f"❌ Failed to connect to Google Sheets: {e}")
-        print(f"   Check credentials file and permissions.")
+        logger.error("Failed to connect to Google Sheets: %s. Check credentials file and permissions.", e)
         return None
 
 
+def _get_emulator_client() -> gspread.Client:
+    """
+    A client for the local Sheets emulator (anonymous, via the shared
+    HTTP client's host overrides).
+    """
+    version = ("emulator", EMULATOR_HOST)
+    with _client_lock:
+        if _client_cache["version"] != version:
+            for host in EMULATED_HOSTS:
+                http_client.set_host_override(host, EMULATOR_HOST)
+            session = http_client.instrument_session(
+                google_requests.AuthorizedSession(google_credentials.AnonymousCredentials())
+            )
+            _client_cache["client"] = gspread.authorize(None, session=session)
+            _client_cache["version"] = version
+            logger.info("Connected to Google Sheets emulator at %s", EMULATOR_HOST)
+        return _client_cache["client"]
+
+
 def get_or_create_spreadsheet(client: gspread.Client) -> Optional[gspread.Spreadsheet]:
     """
     Opens existing spreadsheet or creates a new one if it doesn't exist.
@@ -84,20 +159,22 @@ def get_or_create_spreadsheet(client: gspread.Client) -> Optional[gspread.Spread
         # Try to open by ID first (more reliable)
         if SPREADSHEET_ID:
             try:
-                spreadsheet = client.open_by_key(SPREADSHEET_ID)
-                print(f"✅ Opened spreadsheet by ID: {spreadsheet.title}")
+                with metrics.upstream_call(metrics.UPSTREAM_SHEETS):
+                    spreadsheet = client.open_by_key(SPREADSHEET_ID)
+                logger.debug("Opened spreadsheet by ID: %s", spreadsheet.title, extra={"sample_every": 100})
                 return spreadsheet
             except Exception as e:
-                print(f"⚠️  Could not open spreadsheet by ID: {e}")
+                logger.warning("Could not open spreadsheet by ID: %s", e)
         
         # Try to open by name
         try:
-            spreadsheet = client.open(SHEET_NAME)
-            print(f"✅ Opened spreadsheet: {SHEET_NAME}")
+            with metrics.upstream_call(metrics.UPSTREAM_SHEETS):
+                spreadsheet = client.open(SHEET_NAME)
+            logger.debug("Opened spreadsheet: %s", SHEET_NAME, extra={"sample_every": 100})
             return spreadsheet
         except gspread.SpreadsheetNotFound:
             # Create new spreadsheet
-            print(f"📝 Spreadsheet '{SHEET_NAME}' not found. Creating...")
+            logger.info("Spreadsheet '%s' not found. Creating...", SHEET_NAME)
             spreadsheet = client.create(SHEET_NAME)
             
             # Share with yourself (get email from credentials)
@@ -107,13 +184,11 @@ def get_or_create_spreadsheet(client: gspread.Client) -> Optional[gspread.Spread
                     service_email = creds_data.get('client_email')
                     if service_email:
                         spreadsheet.share(service_email, perm_type='user', role='writer')
-                        print(f"✅ Shared with: {service_email}")
+                        logger.info("Shared spreadsheet with: %s", service_email)
             except:
                 pass
             
-            print(f"✅ Created spreadsheet: {SHEET_NAME}")
-            print(f"   ID: {spreadsheet.id}")
-            print(f"   URL: {spreadsheet.url}")
+            logger.info("Created spreadsheet %s (ID %s): %s", SHEET_NAME, spreadsheet.id, spreadsheet.url)
             
             # Initialize worksheets
             initialize_spreadsheet(spreadsheet)
@@ -121,7 +196,7 @@ def get_or_create_spreadsheet(client: gspread.Client) -> Optional[gspread.Spread
             return spreadsheet
             
     except Exception as e:
-        print(f"❌ Error accessing spreadsheet: {e}")
+        logger.error("Error accessing spreadsheet: %s", e)
         return None
 
 
@@ -162,9 +237,9 @@ def initialize_spreadsheet(spreadsheet: gspread.Spreadsheet):
                 ["Peter Ochieng", "254734567890", "Nakuru", "Maize, Beans", "Active"]
             ]
             farmers_sheet.update('A2:E4', sample_farmers)
-            print("   ✅ Created Farmers worksheet with sample data")
+            logger.info("Created Farmers worksheet with sample data")
         except Exception as e:
-            print(f"   ⚠️  Could not create Farmers worksheet: {e}")
+            logger.warning("Could not create Farmers worksheet: %s", e)
         
         # Create Buyers worksheet
         try:
@@ -181,14 +256,14 @@ def initialize_spreadsheet(spreadsheet: gspread.Spreadsheet):
                 ["Onion Wholesalers", "Onions", "90", "254704444444", "Marikiti"]
             ]
             buyers_sheet.update('A2:E5', sample_buyers)
-            print("   ✅ Created Buyers worksheet with sample data")
+            logger.info("Created Buyers worksheet with sample data")
         except Exception as e:
-            print(f"   ⚠️  Could not create Buyers worksheet: {e}")
+            logger.warning("Could not create Buyers worksheet: %s", e)
         
-        print(f"✅ Spreadsheet initialized successfully")
+        logger.info("Spreadsheet initialized successfully")
         
     except Exception as e:
-        print(f"❌ Error initializing spreadsheet: {e}")
+        logger.error("Error initializing spreadsheet: %s", e)
 
 def log_activity(farmer_name: str, county: str, prices_sent: str, 
                  weather_summary: str, farmer_reply: str, buyer_list_sent: str) -> bool:
@@ -209,12 +284,12 @@ def log_activity(farmer_name: str, county: str, prices_sent: str,
     try:
         client = get_sheet_service()
         if not client:
-            print("⚠️  Skipping logging due to connection failure.")
+            logger.debug("Skipping activity log: no Google Sheets connection", extra={"sample_every": 100})
             return False
 
         spreadsheet = get_or_create_spreadsheet(client)
         if not spreadsheet:
-            print("⚠️  Could not access spreadsheet.")
+            logger.warning("Skipping activity log: could not access spreadsheet", extra={"sample_every": 100})
             return False
         
         # Get or create Activity_Log worksheet
@@ -241,12 +316,13 @@ def log_activity(farmer_name: str, county: str, prices_sent: str,
         ]
         
         # Append row
-        sheet.append_row(row)
-        print(f"✅ Logged activity for {farmer_name} to Google Sheets")
+        with metrics.upstream_call(metrics.UPSTREAM_SHEETS):
+            sheet.append_row(row)
+        logger.debug("Logged activity for %s to Google Sheets", farmer_name, extra={"sample_every": 100})
         return True
         
     except Exception as e:
-        print(f"❌ Error logging to sheets: {e}")
+        logger.error("Error logging to sheets: %s", e)
         return False
 
 def get_farmers() -> List[Dict]:
@@ -260,7 +336,7 @@ def get_farmers() -> List[Dict]:
     try:
         client = get_sheet_service()
         if not client:
-            print("⚠️  Using mock farmer data (no Google Sheets connection)")
+            logger.warning("Using mock farmer data (no Google Sheets connection)")
             return [
                 {"Name": "John Kamau", "Phone": "254712345678", "County": "Nairobi", 
                  "Crops": "Tomatoes, Sukuma", "Status": "Active"},
@@ -272,25 +348,26 @@ def get_farmers() -> List[Dict]:
         
         spreadsheet = get_or_create_spreadsheet(client)
         if not spreadsheet:
-            print("⚠️  Using mock farmer data (could not access spreadsheet)")
+            logger.warning("Using mock farmer data (could not access spreadsheet)")
             return get_farmers()  # Return mock data
         
         try:
             sheet = spreadsheet.worksheet("Farmers")
         except gspread.WorksheetNotFound:
-            print("⚠️  Farmers worksheet not found. Using mock data.")
+            logger.warning("Farmers worksheet not found. Using mock data.")
             return get_farmers()  # Return mock data
         
-        farmers = sheet.get_all_records()
+        with metrics.upstream_call(metrics.UPSTREAM_SHEETS):
+            farmers = sheet.get_all_records()
         
         # Filter active farmers
         active_farmers = [f for f in farmers if f.get('Status', '').lower() == 'active']
         
-        print(f"✅ Retrieved {len(active_farmers)} active farmers from Google Sheets")
+        logger.info("Retrieved %d active farmers from Google Sheets", len(active_farmers))
         return active_farmers
         
     except Exception as e:
-        print(f"❌ Error reading farmers: {e}")
+        logger.error("Error reading farmers: %s", e)
         return []
 
 
@@ -308,7 +385,7 @@ def get_buyers(crop: str) -> List[Dict]:
     try:
         client = get_sheet_service()
         if not client:
-            print(f"⚠️  Using mock buyer data for {crop}")
+            logger.warning("Using mock buyer data for %s", crop)
             return [
                 {"Name": "Nairobi Greens Ltd", "Crop": crop, "Price (KSh/kg)": "90", 
                  "Phone": "254701111111", "Location": "Gikomba"},
@@ -323,10 +400,11 @@ def get_buyers(crop: str) -> List[Dict]:
         try:
             sheet = spreadsheet.worksheet("Buyers")
         except gspread.WorksheetNotFound:
-            print(f"⚠️  Buyers worksheet not found. Using mock data for {crop}.")
+            logger.warning("Buyers worksheet not found. Using mock data for %s.", crop)
             return get_buyers(crop)  # Return mock data
         
-        all_buyers = sheet.get_all_records()
+        with metrics.upstream_call(metrics.UPSTREAM_SHEETS):
+            all_buyers = sheet.get_all_records()
         
         # Filter by crop (case-insensitive)
         matching_buyers = [
@@ -334,11 +412,11 @@ def get_buyers(crop: str) -> List[Dict]:
             if b.get('Crop', '').lower() == crop.lower()
         ]
         
-        print(f"✅ Retrieved {len(matching_buyers)} buyers for {crop}")
+        logger.info("Retrieved %d buyers for %s", len(matching_buyers), crop)
         return matching_buyers
         
     except Exception as e:
-        print(f"❌ Error reading buyers: {e}")
+        logger.error("Error reading buyers: %s", e)
         return []
 
 
@@ -0,0 +1,433 @@
+"""
+Snapshots - Versioned, memory-mapped copies of the read-only data sets
+
+Every worker used to parse buyers.xlsx and today's KAMIS workbook itself
+(pandas, once per worker per change) and keep its own copy, and right
+after a change some workers served the old data and some the new. Now
+the first worker that sees a new source version builds the data once and
+publishes it as an immutable snapshot file next to the data:
+
+    SNAPSHOT_DIR/<name>.snapshot (SNAPSHOT_DIR defaults to DATA_DIR)
+
+    magic (8 bytes) | header length, payload length, payload CRC32 (uint32 each)
+    header  JSON: name, version, built_at, built_by (pid), layout
+    payload: the data set
+
+The file is written to a temporary name and renamed over the old one, so
+readers see either the complete old snapshot or the complete new one.
+Publishing holds an exclusive lock on <name>.snapshot.lock, and
+workers that were waiting on it map the new file instead of rebuilding.
+
+Workers map the file read-only (one copy in the page cache for all of
+them) and keep using a mapping until the source version moves on; an
+old mapping stays valid for requests still using it after the swap.
+
+A list is stored as records, so it is used straight from the mapping:
+
+    offsets  uint64 x (count + 1): where each record starts in records
+    postings uint32: record positions for every key of every index
+    records  each record encoded as JSON on its own
+
+The header maps each index key to its run of postings ("county" ->
+{"Nairobi": [start, length]}). lookup() and find() decode only the
+records they return, and nothing decoded is kept, so a worker's heap does
+not grow with the data set however many workers map it. Any other value
+is stored as one JSON payload, decoded once per process by data(); keep
+those small (today's prices).
+"""
+import bisect
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from array import array
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional
+
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Where snapshot files live (next to the data they are built from)
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data"))
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR") or DATA_DIR
+
+MAGIC = b"AGSNAP02"
+_PREFIX = struct.Struct("<8sIII")
+
+# Payload layouts
+LAYOUT_VALUE = "value"
+LAYOUT_RECORDS = "records"
+
+# Offsets and postings are 8-byte aligned in the file
+_ALIGN = 8
+
+# Snapshots mapped by this process, by name
+_mapped: Dict[str, "Snapshot"] = {}
+_lock = threading.Lock()
+
+
+class SnapshotError(Exception):
+    """
+    Raised for a snapshot file that is truncated, corrupt or not a snapshot.
+    """
+
+
+class Snapshot:
+    """
+    A read-only mapping of one snapshot file.
+    """
+
+    __slots__ = ("name", "version", "built_at", "built_by", "size", "layout", "count", "decoded_rss_bytes",
+                 "_mmap", "_start", "_data", "_indexes", "_offsets", "_postings", "_records_at")
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _PREFIX.size:
+                raise SnapshotError(f"{path} is truncated")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, header_length, payload_length, crc = _PREFIX.unpack_from(self._mmap)
+        self._start = _PREFIX.size + header_length
+        if magic != MAGIC or self._start + payload_length != size:
+            raise SnapshotError(f"{path} is not a complete snapshot")
+        if zlib.crc32(self._mmap[self._start:]) != crc:
+            raise SnapshotError(f"{path} failed its checksum")
+
+        header = json.loads(self._mmap[_PREFIX.size:self._start])
+        self.name = header["name"]
+        self.version = header["version"]
+        self.built_at = header["built_at"]
+        self.built_by = header["built_by"]
+        self.size = size
+        self.layout = header.get("layout", LAYOUT_VALUE)
+        self.count = None
+        self.decoded_rss_bytes = None
+        self._data = None
+        self._indexes = {}
+
+        if self.layout == LAYOUT_RECORDS:
+            # Views of the mapping: nothing is copied into this process
+            self.count = header["count"]
+            self._indexes = header["indexes"]
+            view = memoryview(self._mmap)
+            postings_at = self._start + header["postings_at"]
+            self._records_at = self._start + header["records_at"]
+            self._offsets = view[self._start:self._start + 8 * (self.count + 1)].cast("Q")
+            self._postings = view[postings_at:postings_at + 4 * header["postings"]].cast("I")
+
+    def data(self) -> Any:
+        """
+        The data set. A value is decoded from the mapping on first use and
+        shared by every request in this process, so callers must not modify
+        it; decoded_rss_bytes records roughly what it cost.
+
+        Records are decoded afresh on every call and not kept: use lookup()
+        or find() to decode only the records a request needs.
+        """
+        if self.layout == LAYOUT_RECORDS:
+            return self.records()
+
+        data = self._data
+        if data is None:
+            before = _rss_bytes()
+            data = self._data = json.loads(self._mmap[self._start:])
+            if before is not None:
+                self.decoded_rss_bytes = max(0, _rss_bytes() - before)
+        return data
+
+    def record(self, position: int) -> Any:
+        """
+        Decodes the record at position (0 <= position < count).
+        """
+        start = self._records_at + self._offsets[position]
+        end = self._records_at + self._offsets[position + 1]
+        return json.loads(self._mmap[start:end])
+
+    def records(self, positions: Optional[Iterable[int]] = None) -> List:
+        """
+        Decodes the records at positions (every record if None), in that order.
+        """
+        if positions is None:
+            positions = range(self.count)
+        return [self.record(position) for position in positions]
+
+    def keys(self, index: str) -> List[str]:
+        """
+        The keys of an index built by publish(), in sorted order.
+        """
+        return sorted(self._indexes[index])
+
+    def lookup(self, index: str, match: Callable[[str], bool]) -> List:
+        """
+        Decodes the records filed under every key of index that match
+        accepts, in record order (each record once).
+
+        Args:
+            index: Index name given to publish()
+            match: Called with each key of the index
+
+        Returns:
+            Matching records
+        """
+        runs = [run for key, run in self._indexes[index].items() if match(key)]
+        if len(runs) == 1:
+            start, length = runs[0]
+            positions = self._postings[start:start + length].tolist()
+        else:
+            positions = sorted({position for start, length in runs for position in self._postings[start:start + length]})
+        return self.records(positions)
+
+    def find(self, field: str, value: Any) -> Optional[Any]:
+        """
+        The first record whose field equals value, found by searching the
+        encoded records in the mapping (no index needed).
+
+        Returns:
+            The record, or None
+        """
+        needle = json.dumps({field: value}, ensure_ascii=False, separators=(",", ":"))[1:-1].encode("utf-8")
+        end = self._records_at + self._offsets[self.count]
+        found = self._mmap.find(needle, self._records_at, end)
+        while found != -1:
+            position = bisect.bisect_right(self._offsets, found - self._records_at) - 1
+            record = self.record(position)
+            if isinstance(record, dict) and record.get(field) == value:
+                return record
+            # The bytes matched inside another value: carry on after this record
+            found = self._mmap.find(needle, self._records_at + self._offsets[position + 1], end)
+        return None
+
+    def info(self) -> Dict:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "built_at": self.built_at,
+            "built_by": self.built_by,
+            "size_bytes": self.size,
+            "layout": self.layout,
+            "records": self.count,
+            "decoded": self._data is not None,
+            "decoded_rss_bytes": self.decoded_rss_bytes,
+        }
+
+
+def _rss_bytes() -> Optional[int]:
+    # Resident memory of this process (Linux), for measuring a decode
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * mmap.PAGESIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def version_key(version: Hashable) -> str:
+    """
+    The version as stored in the snapshot header (tuples and lists compare equal).
+    """
+    return json.dumps(version, sort_keys=True, default=str, separators=(",", ":"))
+
+
+def snapshot_path(name: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"{name}.snapshot")
+
+
+def _json_default(value):
+    # numpy scalars and the like
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _encode(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, default=_json_default, separators=(",", ":")).encode("utf-8")
+
+
+def _pad(data: bytes, offset: int) -> bytes:
+    # Pads data so that offset + len(data) is aligned
+    return data + b" " * (-(offset + len(data)) % _ALIGN)
+
+
+def _encode_records(records: List, indexes: Dict[str, Callable[[Any], Iterable[str]]]) -> tuple:
+    # Returns (header fields, payload) for the records layout
+    offsets = array("Q", [0])
+    encoded = []
+    filed: Dict[str, Dict[str, List[int]]] = {index: {} for index in indexes}
+    for position, record in enumerate(records):
+        data = _encode(record)
+        encoded.append(data)
+        offsets.append(offsets[-1] + len(data))
+        for index, keys_of in indexes.items():
+            for key in dict.fromkeys(keys_of(record)):
+                filed[index].setdefault(str(key), []).append(position)
+
+    postings = array("I")
+    runs = {}
+    for index, keys in filed.items():
+        runs[index] = {}
+        for key, positions in keys.items():
+            runs[index][key] = [len(postings), len(positions)]
+            postings.extend(positions)
+
+    head = offsets.tobytes() + postings.tobytes()
+    head = _pad(head, 0)
+    fields = {
+        "count": len(records),
+        "postings": len(postings),
+        "postings_at": len(offsets) * offsets.itemsize,
+        "records_at": len(head),
+        "indexes": runs,
+    }
+    return fields, head + b"".join(encoded)
+
+
+def publish(name: str, version: Hashable, data: Any,
+            indexes: Optional[Dict[str, Callable[[Any], Iterable[str]]]] = None) -> Snapshot:
+    """
+    Writes data as the new snapshot for name and swaps it in atomically.
+
+    Args:
+        name: Data set name (also the file name)
+        version: Version of the source the data was built from
+        data: JSON-serializable data; a list is stored as records
+        indexes: For a list, index name -> function returning the keys to
+            file each record under (see Snapshot.lookup)
+
+    Returns:
+        The new Snapshot, mapped
+    """
+    fields = {"layout": LAYOUT_VALUE}
+    if isinstance(data, list):
+        fields, payload = _encode_records(data, indexes or {})
+        fields["layout"] = LAYOUT_RECORDS
+    else:
+        payload = _encode(data)
+    header = json.dumps(dict({
+        "name": name,
+        "version": version_key(version),
+        "built_at": datetime.now().isoformat(timespec="seconds"),
+        "built_by": os.getpid(),
+    }, **fields), ensure_ascii=False).encode("utf-8")
+    # Trailing spaces are valid JSON, and align the payload
+    header = _pad(header, _PREFIX.size)
+
+    path = snapshot_path(name)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(_PREFIX.pack(MAGIC, len(header), len(payload), zlib.crc32(payload)))
+            f.write(header)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+    logger.info("Published %s snapshot (%d bytes, %s)", name, len(payload), fields["layout"])
+    return Snapshot(path)
+
+
+@contextmanager
+def _publish_lock(name: str) -> Iterator[None]:
+    # flock conflicts between separate open()s, so this also serializes
+    # threads within one process
+    path = snapshot_path(name) + ".lock"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _map_if_current(name: str, key: str) -> Optional[Snapshot]:
+    try:
+        snapshot = Snapshot(snapshot_path(name))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, SnapshotError) as e:
+        logger.warning("Ignoring %s snapshot: %s", name, e)
+        return None
+    return snapshot if snapshot.version == key else None
+
+
+def get(name: str, version: Hashable, build: Callable[[], Any],
+        indexes: Optional[Dict[str, Callable[[Any], Iterable[str]]]] = None) -> Optional[Snapshot]:
+    """
+    Returns the snapshot of name for this source version.
+
+    Uses the mapping this process already has when it is current, then the
+    file on disk (published by another worker), and only builds when
+    neither matches - once across all workers.
+
+    Args:
+        name: Data set name
+        version: Current version of the source data
+        build: Function returning the data for this version, or None when
+            it cannot be built (nothing is published then)
+        indexes: Indexes to build when publishing a list (see publish)
+
+    Returns:
+        Snapshot for the version, or None if build returned None
+    """
+    key = version_key(version)
+    with _lock:
+        snapshot = _mapped.get(name)
+    hit = snapshot is not None and snapshot.version == key
+    metrics.increment("cache_requests_total", cache=f"{name}_snapshot", result="hit" if hit else "miss")
+    if hit:
+        return snapshot
+
+    result = "mapped"
+    snapshot = _map_if_current(name, key)
+    if snapshot is None:
+        with _publish_lock(name):
+            snapshot = _map_if_current(name, key)
+            if snapshot is None:
+                data = build()
+                if data is None:
+                    return None
+                snapshot = publish(name, version, data, indexes)
+                result = "published"
+
+    with _lock:
+        _mapped[name] = snapshot
+    metrics.increment("snapshot_swaps_total", snapshot=name, result=result)
+    return snapshot
+
+
+def stats() -> Dict[str, Dict]:
+    """
+    The snapshots this process has mapped, by name.
+    """
+    with _lock:
+        return {name: snapshot.info() for name, snapshot in _mapped.items()}
+
+
+def clear() -> None:
+    """
+    Forgets this process's mappings (the files stay).
+    """
+    with _lock:
+        _mapped.clear()
+
+
+def _reset_after_fork() -> None:
+    global _lock
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,225 @@
+"""
+Twilio Events - Local record of Twilio debugger events with periodic
+summaries to Google Sheets
+
+Each event is stored locally (one small SQLite insert). A background task
+groups unflushed events by time window, level and error code, and writes
+one Activity_Log row per group. An error storm from Twilio therefore
+costs a few Sheets writes per interval instead of one per event.
+"""
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.services import local_store, sheets_logger
+
+logger = logging.getLogger(__name__)
+
+# Summaries are written to Sheets at most this often (also the window size)
+SUMMARY_INTERVAL_SECONDS = int(os.getenv("TWILIO_SUMMARY_INTERVAL_SECONDS", "300"))
+
+# Maximum Sheets rows per flush; remaining groups are folded into one row
+MAX_SUMMARY_ROWS = 20
+
+# Events are kept locally this long (reported to Sheets or not)
+RETENTION_SECONDS = 7 * 24 * 3600
+
+# Failed Sheets writes in a row before the pending events are given up on;
+# after each failure the next 2^n - 1 flushes are skipped
+MAX_FLUSH_ATTEMPTS = int(os.getenv("TWILIO_SUMMARY_MAX_ATTEMPTS", "5"))
+
+# twilio_events.flushed: 0 pending, 1 reported (or being reported),
+# 2 given up after MAX_FLUSH_ATTEMPTS failed writes
+FLUSH_PENDING = 0
+FLUSH_REPORTED = 1
+FLUSH_DROPPED = 2
+
+# Consecutive failed flushes in this process, and flushes left to skip
+_backoff = {"failures": 0, "skip": 0}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS twilio_events (
+    sid TEXT PRIMARY KEY,
+    received_at REAL NOT NULL,
+    level TEXT,
+    error_code TEXT,
+    account_sid TEXT,
+    flushed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_twilio_events_flushed ON twilio_events (flushed, received_at);
+"""
+
+
+def _ensure_schema():
+    local_store.ensure_schema("twilio_events", SCHEMA)
+
+
+def extract_error_code(payload: Optional[str]) -> Optional[str]:
+    """
+    Gets the Twilio error code from a debugger event's JSON Payload field.
+    """
+    if not payload:
+        return None
+    try:
+        data = json.loads(payload)
+    except (TypeError, ValueError):
+        return None
+    code = data.get("error_code") if isinstance(data, dict) else None
+    return str(code) if code is not None else None
+
+
+def record_event(event_data: Dict) -> bool:
+    """
+    Stores one debugger event (repeated Sids are ignored).
+
+    Args:
+        event_data: Form fields from the Twilio debugger webhook
+
+    Returns:
+        True if the event was new
+    """
+    _ensure_schema()
+    sid = event_data.get("Sid") or f"unknown-{time.time_ns()}"
+    cursor = local_store.get_connection().execute(
+        """INSERT OR IGNORE INTO twilio_events (sid, received_at, level, error_code, account_sid)
+           VALUES (?, ?, ?, ?, ?)""",
+        (
+            sid,
+            time.time(),
+            event_data.get("Level"),
+            extract_error_code(event_data.get("Payload")),
+            event_data.get("AccountSid"),
+        )
+    )
+    return cursor.rowcount == 1
+
+
+def _group_key(row) -> tuple:
+    window_start = int(row["received_at"] // SUMMARY_INTERVAL_SECONDS) * SUMMARY_INTERVAL_SECONDS
+    return (window_start, row["level"] or "Unknown", row["error_code"] or "none")
+
+
+def _group_rows(rows) -> List[Dict]:
+    groups = {}
+    for row in rows:
+        key = _group_key(row)
+        groups[key] = groups.get(key, 0) + 1
+    return [
+        {"window_start": key[0], "level": key[1], "error_code": key[2], "count": count, "keys": [key]}
+        for key, count in sorted(groups.items())
+    ]
+
+
+def get_summary(since_seconds: int = 3600) -> List[Dict]:
+    """
+    Event counts by window, level and error code.
+
+    Args:
+        since_seconds: How far back to look
+
+    Returns:
+        List of groups with window_start (Unix time), level, error_code, count
+    """
+    _ensure_schema()
+    rows = local_store.get_connection().execute(
+        "SELECT received_at, level, error_code FROM twilio_events WHERE received_at >= ?",
+        (time.time() - since_seconds,)
+    ).fetchall()
+    return [
+        {name: group[name] for name in ("window_start", "level", "error_code", "count")}
+        for group in _group_rows(rows)
+    ]
+
+
+def flush_summaries() -> int:
+    """
+    Claims every unflushed event from completed windows and writes one
+    Activity_Log row per (window, level, error code).
+
+    Events are claimed in a write transaction, so when several workers run
+    this only one of them reports each event. If Sheets logging fails, the
+    events are released and retried with exponential backoff; after
+    MAX_FLUSH_ATTEMPTS failures in a row they are marked dropped. Nothing is
+    claimed while Sheets is not configured.
+
+    Returns:
+        Number of summary rows written
+    """
+    _ensure_schema()
+    now = time.time()
+    cutoff = int(now // SUMMARY_INTERVAL_SECONDS) * SUMMARY_INTERVAL_SECONDS
+
+    local_store.get_connection().execute(
+        "DELETE FROM twilio_events WHERE received_at < ?", (now - RETENTION_SECONDS,)
+    )
+    if not sheets_logger.is_configured():
+        return 0
+    if _backoff["skip"] > 0:
+        _backoff["skip"] -= 1
+        return 0
+
+    with local_store.transaction() as conn:
+        rows = conn.execute(
+            "SELECT sid, received_at, level, error_code FROM twilio_events WHERE flushed = ? AND received_at < ?",
+            (FLUSH_PENDING, cutoff)
+        ).fetchall()
+        if not rows:
+            return 0
+        conn.execute(
+            "UPDATE twilio_events SET flushed = ? WHERE flushed = ? AND received_at < ?",
+            (FLUSH_REPORTED, FLUSH_PENDING, cutoff)
+        )
+
+    groups = _group_rows(rows)
+    if len(groups) > MAX_SUMMARY_ROWS:
+        # Keep the largest groups and fold the rest into one row
+        groups.sort(key=lambda group: group["count"], reverse=True)
+        rest = groups[MAX_SUMMARY_ROWS - 1:]
+        groups = groups[:MAX_SUMMARY_ROWS - 1] + [{
+            "window_start": min(group["window_start"] for group in rest),
+            "level": "Mixed",
+            "error_code": f"{len(rest)} other codes",
+            "count": sum(group["count"] for group in rest),
+            "keys": [key for group in rest for key in group["keys"]],
+        }]
+
+    written = 0
+    for index, group in enumerate(groups):
+        window = datetime.fromtimestamp(group["window_start"]).strftime("%H:%M")
+        ok = sheets_logger.log_activity(
+            farmer_name="System",
+            county="N/A",
+            prices_sent="N/A",
+            weather_summary="N/A",
+            farmer_reply=f"Twilio {group['level']} {group['error_code']}",
+            buyer_list_sent=f"{group['count']} events from {window} ({SUMMARY_INTERVAL_SECONDS // 60} min)"
+        )
+        if not ok:
+            pending = {key for remaining in groups[index:] for key in remaining["keys"]}
+            sids = [row["sid"] for row in rows if _group_key(row) in pending]
+            _backoff["failures"] += 1
+            if _backoff["failures"] >= MAX_FLUSH_ATTEMPTS:
+                _mark(sids, FLUSH_DROPPED)
+                logger.error("Could not write Twilio summaries to Sheets %d times; dropped %d events",
+                             _backoff["failures"], len(sids))
+                _backoff.update(failures=0, skip=0)
+            else:
+                # Release the events not yet reported so a later flush retries them
+                _mark(sids, FLUSH_PENDING)
+                _backoff["skip"] = 2 ** _backoff["failures"] - 1
+                logger.warning("Could not write Twilio summaries to Sheets; will retry %d events in %d min",
+                               len(sids), (_backoff["skip"] + 1) * SUMMARY_INTERVAL_SECONDS // 60)
+            return written
+        written += 1
+
+    _backoff.update(failures=0, skip=0)
+    logger.info("Logged %d Twilio summary rows covering %d events", written, len(rows))
+    return written
+
+
+def _mark(sids: List[str], flushed: int) -> None:
+    conn = local_store.get_connection()
+    conn.executemany("UPDATE twilio_events SET flushed = ? WHERE sid = ?", [(flushed, sid) for sid in sids])
@@ -1,7 +1,17 @@
-import requests
 import os
+import logging
 from datetime import datetime
-from typing import Dict, Tuple, Optional
+from typing import Dict, Iterable, Tuple, Optional
+
+from app.services import cache, http_client, metrics
+
+logger = logging.getLogger(__name__)
+
+# How long a county's forecast is reused (entries are also keyed by date)
+CACHE_TTL_SECONDS = int(os.getenv("WEATHER_CACHE_TTL_SECONDS", "1800"))
+
+# Forecasts per county, shared by workers and nodes (see cache)
+weather_cache = cache.Cache("weather", ttl=CACHE_TTL_SECONDS)
 
 # Kenyan Counties with their approximate coordinates (latitude, longitude)
 KENYA_COUNTIES = {
@@ -81,8 +91,9 @@ def get_weather_open_meteo(lat: float, lon: float) -> Dict:
             "forecast_days": 1
         }
         
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
+        with metrics.upstream_call(metrics.UPSTREAM_OPEN_METEO):
+            response = http_client.get(url, params=params, timeout=10)
+            response.raise_for_status()
         
         data = response.json()
         
@@ -109,7 +120,7 @@ def get_weather_open_meteo(lat: float, lon: float) -> Dict:
         }
         
     except Exception as e:
-        print(f"Error fetching from Open-Meteo: {e}")
+        logger.warning("Error fetching from Open-Meteo: %s", e)
         return None
 
 
@@ -129,8 +140,9 @@ def get_weather_openweathermap(lat: float, lon: float, api_key: str) -> Dict:
             "units": "metric"
         }
         
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
+        with metrics.upstream_call(metrics.UPSTREAM_OPENWEATHERMAP):
+            response = http_client.get(url, params=params, timeout=10)
+            response.raise_for_status()
         
         data = response.json()
         
@@ -163,7 +175,7 @@ def get_weather_openweathermap(lat: float, lon: float, api_key: str) -> Dict:
         }
         
     except Exception as e:
-        print(f"Error fetching from OpenWeatherMap: {e}")
+        logger.warning("Error fetching from OpenWeatherMap: %s", e)
         return None
 
 
@@ -171,10 +183,7 @@ def get_weather(county: str) -> Dict:
     """
     Fetches rainfall probability and amount for a given Kenyan county.
     
-    Uses multiple weather APIs with fallback:
-    1. Open-Meteo (free, no API key)
-    2. OpenWeatherMap (if API key is provided)
-    3. Mock data (as last resort)
+    Forecasts are cached per county and day for CACHE_TTL_SECONDS.
     
     Args:
         county: Name of the Kenyan county
@@ -185,17 +194,57 @@ def get_weather(county: str) -> Dict:
         - rainfall_mm: float (millimeters)
         - source: str (API source used)
     """
-    print(f"Fetching weather for {county}...")
+    return get_weather_many([county])[county]
+
+
+def get_weather_many(counties: Iterable[str]) -> Dict[str, Dict]:
+    """
+    Weather for several counties, looking them all up in the cache at once
+    and fetching only the missing ones.
     
-    # Get coordinates for the county
-    coords = get_coordinates(county)
+    Args:
+        counties: County names
+        
+    Returns:
+        Weather dictionary (see get_weather) by county name
+    """
+    counties = list(dict.fromkeys(counties))
+    # Unknown counties share Nairobi's entry
+    resolved = {county: county if county in KENYA_COUNTIES else "Nairobi" for county in counties}
+    for county, name in resolved.items():
+        if name != county:
+            logger.warning("County '%s' not found in database. Using Nairobi as default.", county)
     
-    if not coords:
-        print(f"Warning: County '{county}' not found in database. Using Nairobi as default.")
-        coords = KENYA_COUNTIES["Nairobi"]
+    today = datetime.now().strftime("%Y-%m-%d")
+    found = weather_cache.get_many(set(resolved.values()), version=today)
     
-    lat, lon = coords
-    print(f"Coordinates: {lat}, {lon}")
+    fetched = {}
+    for name in set(resolved.values()) - set(found):
+        found[name] = fetch_weather(name)
+        # Mock data is not worth sharing: the next lookup retries the APIs
+        if not found[name].get("source", "").startswith("Mock"):
+            fetched[name] = found[name]
+    weather_cache.set_many(fetched, version=today)
+    
+    return {county: dict(found[name]) for county, name in resolved.items()}
+
+
+def fetch_weather(county: str) -> Dict:
+    """
+    Fetches a county's weather from the APIs, without the cache.
+    
+    Uses multiple weather APIs with fallback:
+    1. Open-Meteo (free, no API key)
+    2. OpenWeatherMap (if API key is provided)
+    3. Mock data (as last resort)
+    
+    Args:
+        county: Name of a county in KENYA_COUNTIES
+        
+    Returns:
+        Weather dictionary (see get_weather)
+    """
+    lat, lon = KENYA_COUNTIES[county]
     
     # Try Open-Meteo first (free, no API key required)
     weather_data = get_weather_open_meteo(lat, lon)
@@ -204,12 +253,12 @@ def get_weather(county: str) -> Dict:
     if not weather_data:
         api_key = os.getenv("OPENWEATHER_API_KEY")
         if api_key:
-            print("Trying OpenWeatherMap API...")
+            logger.info("Open-Meteo failed for %s; trying OpenWeatherMap API", county)
             weather_data = get_weather_openweathermap(lat, lon, api_key)
     
     # If all APIs fail, use mock data as fallback
     if not weather_data:
-        print("Warning: All weather APIs failed. Using mock data.")
+        logger.warning("All weather APIs failed for %s. Using mock data.", county)
         import random
         weather_data = {
             "rainfall_probability": random.randint(20, 80),
@@ -217,7 +266,7 @@ def get_weather(county: str) -> Dict:
             "source": "Mock (API unavailable)"
         }
     
-    print(f"Weather for {county}: {weather_data}")
+    logger.debug("Weather for %s: %s", county, weather_data, extra={"sample_every": 100})
     return weather_data
 
 
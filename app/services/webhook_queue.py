@@ -0,0 +1,141 @@
+"""
+Webhook Queue - Bounded in-process queue between the webhook endpoint and
+the code that acts on incoming messages
+
+The endpoint only validates and enqueues; worker tasks drain the queue and
+run the (blocking) handler in a thread. Meta gets its 200 immediately, and
+a reply storm after the morning broadcast backs up here instead of in
+open HTTP requests.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from app.services.metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+# Payloads waiting beyond this are refused with 503 so Meta retries later
+QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+
+# Concurrent handler threads per worker process
+WORKER_COUNT = int(os.getenv("WEBHOOK_WORKERS", "4"))
+
+# Number of recent samples kept for latency percentiles
+LATENCY_SAMPLES = 1024
+
+
+class WebhookQueue:
+    """
+    Bounded queue of webhook payloads drained by worker tasks.
+    """
+
+    def __init__(self, maxsize: int = QUEUE_SIZE, workers: int = WORKER_COUNT):
+        self.maxsize = maxsize
+        self.worker_count = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._handler: Optional[Callable] = None
+
+        self.enqueued = 0
+        self.rejected = 0
+        self.processed = 0
+        self.errors = 0
+        self._wait_times = deque(maxlen=LATENCY_SAMPLES)
+        self._handle_times = deque(maxlen=LATENCY_SAMPLES)
+
+    async def start(self, handler: Callable[[dict], None]) -> None:
+        """
+        Starts the worker tasks.
+
+        Args:
+            handler: Blocking function called with each payload (runs in a thread)
+        """
+        self._handler = handler
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"webhook-worker-{i}")
+            for i in range(self.worker_count)
+        ]
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """
+        Waits up to timeout seconds for queued payloads, then stops workers.
+        """
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Stopping webhook workers with %d payloads still queued", self._queue.qsize())
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def enqueue(self, payload: dict) -> bool:
+        """
+        Adds a payload without waiting.
+
+        Args:
+            payload: Decoded webhook JSON
+
+        Returns:
+            True if queued, False if the queue is full or not running
+        """
+        if self._queue is None:
+            self.rejected += 1
+            return False
+        try:
+            self._queue.put_nowait((time.monotonic(), payload))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            queued_at, payload = await self._queue.get()
+            started = time.monotonic()
+            self._wait_times.append(started - queued_at)
+            try:
+                await asyncio.to_thread(self._handler, payload)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                logger.exception("Error handling webhook payload: %s", e)
+            finally:
+                self._handle_times.append(time.monotonic() - started)
+                self._queue.task_done()
+
+    def depth(self) -> int:
+        """
+        Payloads currently waiting.
+        """
+        return self._queue.qsize() if self._queue else 0
+
+    def stats(self) -> Dict:
+        """
+        Queue depth, counters and drain latency percentiles (milliseconds).
+        """
+        waits = list(self._wait_times)
+        handles = list(self._handle_times)
+
+        def ms(value):
+            return round(value * 1000, 1) if value is not None else None
+
+        return {
+            "depth": self.depth(),
+            "capacity": self.maxsize,
+            "workers": len(self._workers),
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "errors": self.errors,
+            "queue_wait_ms": {f"p{p}": ms(percentile(waits, p)) for p in (50, 95, 99)},
+            "handle_ms": {f"p{p}": ms(percentile(handles, p)) for p in (50, 95, 99)},
+        }
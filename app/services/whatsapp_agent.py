@@ -1,11 +1,16 @@
-import requests
 import os
 import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from app.services import http_client, metrics
 
 # WhatsApp Cloud API credentials
 WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN", "mock_token")
 PHONE_NUMBER_ID = os.getenv("WHATSAPP_PHONE_ID", "mock_phone_id")
 
+logger = logging.getLogger(__name__)
+
 def send_whatsapp_message(to_phone, message_body):
     """
     Sends a message via WhatsApp Cloud API.
@@ -22,20 +27,62 @@ def send_whatsapp_message(to_phone, message_body):
         "text": {"body": message_body}
     }
     
-    print(f"Sending WhatsApp message to {to_phone}: {message_body}")
+    logger.debug("Sending WhatsApp message to %s (%d chars)", to_phone, len(message_body), extra={"sample_every": 100})
     
     if WHATSAPP_TOKEN == "mock_token":
-        print("Mock send successful.")
+        logger.debug("Mock send to %s", to_phone, extra={"sample_every": 100})
         return {"status": "success", "mock": True}
 
     try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
+        with metrics.upstream_call(metrics.UPSTREAM_GRAPH_API):
+            response = http_client.post(url, headers=headers, json=data)
+            response.raise_for_status()
         return response.json()
     except Exception as e:
-        print(f"Error sending WhatsApp message: {e}")
+        logger.warning("Error sending WhatsApp message to %s: %s", to_phone, e)
+        return None
+
+def get_message_id(response) -> Optional[str]:
+    """
+    Extracts the WhatsApp message ID (wamid) from a send response.
+    
+    Returns:
+        Message ID, or None for mock sends and failures
+    """
+    try:
+        return response["messages"][0]["id"]
+    except (TypeError, KeyError, IndexError):
         return None
 
+def parse_webhook_payload(data: Dict) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Collects every message and status event in a Cloud API webhook payload.
+    
+    Meta batches several entries, changes, messages and statuses into one
+    POST under load, so all of them are returned, in payload order.
+    
+    Args:
+        data: Decoded webhook JSON
+        
+    Returns:
+        (messages, statuses) - each item is the event dict from the payload,
+        with the receiving phone_number_id added as "_phone_number_id"
+    """
+    messages = []
+    statuses = []
+    
+    for entry in data.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            phone_number_id = (value.get("metadata") or {}).get("phone_number_id")
+            
+            for message in value.get("messages") or []:
+                messages.append(dict(message, _phone_number_id=phone_number_id))
+            for status in value.get("statuses") or []:
+                statuses.append(dict(status, _phone_number_id=phone_number_id))
+    
+    return messages, statuses
+
 def format_daily_message(fair_prices, weather_data, farmer_county):
     """
     Formats the daily 4:45 AM message with enhanced weather information.
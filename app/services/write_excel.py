@@ -1,9 +1,13 @@
-import pandas as pd
-from openpyxl import load_workbook
 import os
 from datetime import datetime
 
-DATA_FILE = "/Users/ratego/Dev/agrosoko.ai/data/prices.xlsx"
+from app.services.lazy_imports import lazy_module
+
+# Imported on first use (see lazy_imports); pandas loads openpyxl itself
+pd = lazy_module("pandas")
+
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data"))
+DATA_FILE = os.path.join(DATA_DIR, "prices.xlsx")
 
 def write_to_excel(data):
     """
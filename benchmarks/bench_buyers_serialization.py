@@ -0,0 +1,121 @@
+"""
+Benchmark: Buyer Record Serialization
+=====================================
+Compares serializing /api/buyers from raw DataFrame records (pandas and
+numpy values, NaN, Timestamps) against records normalized to plain Python
+types at load time.
+
+Usage:
+    python benchmarks/bench_buyers_serialization.py [--rows 10000] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+
+from app.services import buyers_service, response_cache
+
+
+def make_buyers_frame(rows: int) -> pd.DataFrame:
+    """
+    Builds a buyers DataFrame shaped like data/buyers.xlsx, with the value
+    types read_excel produces (int64, float64 with NaN, Timestamps).
+    """
+    rng = np.random.default_rng(42)
+    volumes = rng.integers(50, 2000, rows).astype(float)
+    volumes[rng.random(rows) < 0.05] = np.nan  # Missing volumes become NaN
+
+    return pd.DataFrame({
+        "Buyer ID": [f"BYR{i:06d}" for i in range(rows)],
+        "Buyer Name": [f"Buyer {i}" for i in range(rows)],
+        "Buyer Type": rng.choice(["Hotel", "Restaurant", "Mama Mboga", "Supermarket", "Wholesaler"], rows),
+        "County": rng.choice(["Nairobi", "Kiambu", "Nakuru", "Mombasa", "Kisumu"], rows),
+        "Location": rng.choice(["CBD", "Westlands", "Gikomba", "Ruaka"], rows),
+        "Contact Phone": rng.integers(254700000000, 254799999999, rows),
+        "Crops Interested": rng.choice(["Tomatoes, Onions", "Sukuma Wiki, Cabbage", "Tomatoes, Sukuma Wiki"], rows),
+        "Weekly Volume (kg)": volumes,
+        "Quality Required": rng.choice(["Grade A", "Grade B"], rows),
+        "Payment Terms": rng.choice(["Net 30", "Net 15", "Cash on Delivery"], rows),
+        "Price Range (KSh/kg)": rng.choice(["40-55", "30-45"], rows),
+        "Status": rng.choice(["Active", "Inactive"], rows),
+        "Verified": rng.choice(["Yes", "No"], rows),
+        "Registration Date": pd.to_datetime("2025-01-01") + pd.to_timedelta(rng.integers(0, 365, rows), unit="D"),
+    })
+
+
+def best_of(func, repeat: int) -> float:
+    """
+    Runs func repeat times and returns the fastest wall time in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def serialize_raw(records):
+    """
+    The old /api/buyers path: FastAPI's jsonable_encoder over raw records.
+    NaN is only accepted because allow_nan is relaxed here; FastAPI's own
+    JSONResponse (allow_nan=False) rejects it.
+    """
+    return json.dumps(
+        jsonable_encoder({"count": len(records), "buyers": records}),
+        ensure_ascii=False, allow_nan=True, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    df = make_buyers_frame(args.rows)
+
+    print("=" * 70)
+    print(f"BUYER SERIALIZATION BENCHMARK ({args.rows:,} buyers, best of {args.repeat})")
+    print("=" * 70)
+
+    raw_records = df.to_dict("records")
+    normalized = buyers_service.normalize_records(df)
+
+    # Does the raw path survive FastAPI's strict JSON rendering?
+    try:
+        response_cache.serialize({"count": len(raw_records), "buyers": raw_records})
+        strict_ok = "ok"
+    except ValueError as e:
+        strict_ok = f"fails ({e})"
+
+    results = {
+        "to_dict('records')": best_of(lambda: df.to_dict("records"), args.repeat),
+        "normalize_records (load once)": best_of(lambda: buyers_service.normalize_records(df), args.repeat),
+        "serialize raw records": best_of(lambda: serialize_raw(raw_records), args.repeat),
+        "serialize normalized records": best_of(
+            lambda: response_cache.serialize({"count": len(normalized), "buyers": normalized}), args.repeat
+        ),
+    }
+
+    for name, seconds in results.items():
+        print(f"  {name:.<45} {seconds * 1000:9.1f} ms")
+
+    speedup = results["serialize raw records"] / results["serialize normalized records"]
+    print(f"\n  Per-response serialization speedup: {speedup:.1f}x")
+    print(f"  Raw records with strict JSON (allow_nan=False): {strict_ok}")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Benchmark: Cache Backends
+=========================
+Runs the same checks and timings against each cache backend
+(app/services/cache.py):
+
+- memory: dict in this process
+- sqlite: local store table in a temporary database
+- redis: benchmarks/fake_redis.py started here, or a real server with
+  --redis-url
+
+Checks (any failure exits with status 1): values round-trip, bulk get/set
+return what single calls do, a new version does not see old entries,
+entries expire after their TTL, and an unreachable Redis degrades to
+misses instead of errors.
+
+Timings compare --keys single lookups with one bulk lookup of the same
+keys, which is the difference that matters once the cache is across the
+network.
+
+Usage:
+    python benchmarks/bench_cache_backends.py [--keys 500] [--redis-url redis://host:6379/0]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add parent directory to path
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# The sqlite backend uses a throwaway database
+DATA_DIR = tempfile.mkdtemp(prefix="agrosoko-cache-")
+os.environ["AGROSOKO_DB_PATH"] = os.path.join(DATA_DIR, "agrosoko.db")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+from app.services import cache
+from fake_redis import FakeRedis
+
+SAMPLE = {"rainfall_probability": 40, "rainfall_mm": 2.5, "source": "Open-Meteo", "county": "Nyandarua"}
+
+
+def check(backend, failures: list) -> None:
+    def expect(condition, message):
+        if not condition:
+            failures.append(f"{backend.name}: {message}")
+
+    backend.clear()
+    store = cache.Cache("bench", ttl=60, backend=backend)
+
+    store.set("Nairobi", SAMPLE, version="v1")
+    expect(store.get("Nairobi", version="v1") == SAMPLE, "value did not round-trip")
+    expect(store.get("Nairobi", version="v2") is None, "a new version saw the old entry")
+    expect(store.get("Kisumu", version="v1") is None, "missing key returned a value")
+
+    items = {f"county-{i}": dict(SAMPLE, index=i) for i in range(50)}
+    store.set_many(items, version="v1")
+    found = store.get_many(list(items) + ["missing"], version="v1")
+    expect(found == items, f"bulk get returned {len(found)} of {len(items)} entries")
+    expect(store.get("county-7", version="v1") == items["county-7"], "single get disagrees with bulk set")
+
+    store.delete("county-7", version="v1")
+    expect(store.get("county-7", version="v1") is None, "deleted entry still returned")
+
+    store.set("short-lived", SAMPLE, ttl=0.2)
+    expect(store.get("short-lived") == SAMPLE, "entry with TTL missing before it expired")
+    time.sleep(0.3)
+    expect(store.get("short-lived") is None, "entry returned after its TTL")
+
+    calls = []
+    built = store.get_or_set("built", lambda: calls.append(1) or SAMPLE)
+    again = store.get_or_set("built", lambda: calls.append(1) or SAMPLE)
+    expect(built == again == SAMPLE and len(calls) == 1, "get_or_set built the value more than once")
+
+
+def time_backend(backend, keys: int) -> dict:
+    store = cache.Cache("bench", ttl=600, backend=backend)
+    names = [f"key-{i}" for i in range(keys)]
+    items = {name: dict(SAMPLE, index=i) for i, name in enumerate(names)}
+
+    timings = {}
+    started = time.perf_counter()
+    for name, value in items.items():
+        store.set(name, value, version="timing")
+    timings["set"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    store.set_many(items, version="timing")
+    timings["set_many"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for name in names:
+        store.get(name, version="timing")
+    timings["get"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    store.get_many(names, version="timing")
+    timings["get_many"] = time.perf_counter() - started
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", type=int, default=500)
+    parser.add_argument("--redis-url", help="Use this Redis server instead of the local fake")
+    args = parser.parse_args()
+
+    fake = None
+    redis_url = args.redis_url
+    if not redis_url:
+        fake = FakeRedis(password="bench").start()
+        redis_url = fake.url
+
+    backends = [cache.MemoryBackend(), cache.SQLiteBackend(), cache.RedisBackend(redis_url)]
+    failures = []
+
+    print("=" * 70)
+    print(f"CACHE BACKENDS ({args.keys} keys; redis at {redis_url})")
+    print("=" * 70)
+    print(f"  {'backend':<10}{'set':>12}{'set_many':>12}{'get':>12}{'get_many':>12}   (ms for all keys)")
+    for backend in backends:
+        check(backend, failures)
+        timings = time_backend(backend, args.keys)
+        print(f"  {backend.name:<10}" + "".join(f"{timings[step] * 1000:12.1f}" for step in ("set", "set_many", "get", "get_many")))
+
+    # Nothing listens on port 1: lookups must miss, not raise
+    unreachable = cache.Cache("bench", backend=cache.RedisBackend("redis://127.0.0.1:1/0", timeout=0.2))
+    try:
+        unreachable.set("Nairobi", SAMPLE)
+        if unreachable.get("Nairobi") is not None:
+            failures.append("redis (unreachable): lookup returned a value")
+    except Exception as e:
+        failures.append(f"redis (unreachable): raised {e!r} instead of missing")
+
+    if fake is not None:
+        fake.stop()
+
+    print()
+    for failure in failures:
+        print(f"  FAIL: {failure}")
+    if not failures:
+        print("  OK: all backends passed the checks")
+    print("=" * 70)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Benchmark: Offline Suite
+========================
+Times the main code paths against local stand-ins for KAMIS, Open-Meteo,
+the WhatsApp Graph API and Google Sheets (benchmarks/stubs.py), so nothing
+touches the network, and saves the results as JSON for comparing commits.
+
+Measures:
+- scrape_kamis (fresh download of today's exports)
+- extract_nairobi_prices on a daily and a historical export
+- buyer filtering (by crop, county and commodity) over N buyers
+- daily message formatting for N farmers
+- run_daily_workflow end to end for N farmers (stage timings included)
+
+All app state (KAMIS downloads, buyers.xlsx, prices.xlsx, agrosoko.db) goes
+to a temporary DATA_DIR.
+
+Usage:
+    python benchmarks/bench_offline_suite.py [--sizes 100,10000,100000] [--repeat 3]
+        [--output benchmarks/results] [--compare benchmarks/results/<earlier>.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+# Add parent directory to path
+sys.path.insert(0, ROOT_DIR)
+
+import synthetic
+from stubs import StubUpstreams, make_kamis_export
+
+# App modules (and bench_buyers_serialization, which imports them) read their
+# configuration at import time, so they are imported inside the benchmarks,
+# after main() has pointed the environment at the stubs.
+
+
+def git_commit() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=ROOT_DIR, capture_output=True, text=True, timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+    return {"commit": git("rev-parse", "--short", "HEAD") or "unknown", "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def quietly(func):
+    """
+    Runs func with its print() output discarded (the scraper prints per row).
+    """
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return func()
+    return run
+
+
+def bench_kamis(repeat: int) -> dict:
+    from app.services import kamis_scraper
+    from bench_buyers_serialization import best_of
+
+    # Daily mode: skip the one-off historical download
+    os.makedirs(kamis_scraper.DATA_DIR, exist_ok=True)
+    with open(kamis_scraper.INITIAL_DOWNLOAD_MARKER, "w") as f:
+        f.write(datetime.now().isoformat())
+
+    prices = quietly(lambda: kamis_scraper.scrape_kamis(force_refresh=True))()
+    results = {
+        "scrape_kamis_seconds": best_of(quietly(lambda: kamis_scraper.scrape_kamis(force_refresh=True)), repeat),
+        "scrape_kamis_cached_seconds": best_of(quietly(lambda: kamis_scraper.scrape_kamis()), repeat),
+        "scrape_kamis_source": prices.get("source"),
+    }
+
+    for name, rows in (("daily", 100), ("historical", 3000)):
+        frames = []
+        for product_id, (_, _, crop_category, _) in synthetic.KAMIS_COMMODITIES.items():
+            frame = pd.read_excel(io.BytesIO(make_kamis_export(product_id, rows)), engine="openpyxl")
+            frame["crop_category"] = crop_category
+            frames.append(frame)
+        df = pd.concat(frames, ignore_index=True)
+        results[f"extract_nairobi_prices_{name}_seconds"] = best_of(
+            quietly(lambda: kamis_scraper.extract_nairobi_prices(df.copy())), repeat
+        )
+        results[f"extract_nairobi_prices_{name}_rows"] = len(df)
+    return results
+
+
+def bench_buyers(size: int, repeat: int) -> dict:
+    from app.services import buyers_service
+    from bench_buyers_serialization import best_of
+
+    synthetic.write_buyers_store(os.path.dirname(buyers_service.BUYERS_FILE), size)
+
+    started = time.perf_counter()
+    loaded = len(buyers_service.get_all_buyers())
+    load_seconds = time.perf_counter() - started
+
+    return {
+        "buyers_loaded": loaded,
+        "buyers_load_seconds": load_seconds,
+        "buyers_by_crop_seconds": best_of(lambda: buyers_service.get_buyers_by_crop("Tomatoes"), repeat),
+        "buyers_by_county_seconds": best_of(lambda: buyers_service.get_buyers_by_county("Nairobi"), repeat),
+        "buyers_by_commodity_seconds": best_of(lambda: buyers_service.get_buyers_by_commodity("Nairobi"), repeat),
+    }
+
+
+def bench_formatting(size: int, repeat: int) -> dict:
+    from app.services import price_engine, whatsapp_agent
+    from bench_buyers_serialization import best_of
+
+    fair_prices = price_engine.calculate_fair_prices({"tomato": 80, "sukuma": 45, "onion": 100, "cabbage": 35})
+    weather = {"rainfall_probability": 55, "rainfall_mm": 6.2, "source": "Open-Meteo"}
+    counties = [county for _, _, county, _, _ in synthetic.farmer_rows(size)]
+
+    def format_all():
+        for county in counties:
+            whatsapp_agent.format_daily_message(fair_prices, weather, county)
+
+    seconds = best_of(format_all, repeat)
+    return {"format_messages_seconds": seconds, "format_messages_per_second": size / seconds if seconds else None}
+
+
+def bench_workflow(stubs: StubUpstreams, size: int) -> dict:
+    from app import main
+    from app.services import metrics, run_registry
+
+    stubs.set_farmers(size)
+    stubs.reset_counts()
+    metrics.reset()
+
+    run_id = f"bench-{size}-{int(time.time() * 1000)}"
+    run_registry.claim_run(run_id)
+
+    started = time.perf_counter()
+    quietly(lambda: main.run_daily_workflow(run_id))()
+    seconds = time.perf_counter() - started
+
+    run = run_registry.get_run(run_id) or {}
+    summaries = run_registry.get_summaries(run_id)
+    return {
+        "workflow_seconds": seconds,
+        "workflow_farmers_per_second": size / seconds if seconds else None,
+        "workflow_status": run.get("status"),
+        "workflow_summary": summaries[-1]["summary"] if summaries else None,
+        "upstream_requests": stubs.stats()["requests"],
+    }
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current: dict, previous_path: str) -> None:
+    with open(previous_path) as f:
+        previous = json.load(f)
+
+    old = {k: v for k, v in flatten(previous["results"]).items() if k.endswith("_seconds")}
+    new = {k: v for k, v in flatten(current["results"]).items() if k.endswith("_seconds")}
+
+    print(f"\n  Compared with {previous.get('commit')} ({os.path.basename(previous_path)}):")
+    for name in sorted(set(old) & set(new)):
+        if "workflow_summary" in name or not old[name]:
+            continue
+        change = (new[name] - old[name]) / old[name] * 100
+        print(f"  {name:.<60} {old[name] * 1000:10.1f} -> {new[name] * 1000:10.1f} ms ({change:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,10000,100000", help="Farmer/buyer counts, comma separated")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results"))
+    parser.add_argument("--compare", help="Earlier results file to compare with")
+    parser.add_argument("--skip-workflow", action="store_true", help="Skip the end-to-end run_daily_workflow runs")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+
+    data_dir = tempfile.mkdtemp(prefix="agrosoko-bench-")
+    stubs = StubUpstreams().start()
+
+    # Must be set before the app modules read their configuration
+    os.environ.update(stubs.environment())
+    os.environ["DATA_DIR"] = data_dir
+    os.environ["AGROSOKO_DB_PATH"] = os.path.join(data_dir, "agrosoko.db")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    print("=" * 70)
+    print(f"OFFLINE BENCHMARK SUITE (sizes {', '.join(f'{s:,}' for s in sizes)}, best of {args.repeat})")
+    print(f"  Stubs: {stubs.base_url}   Data: {data_dir}")
+    print("=" * 70)
+
+    results = {"kamis": bench_kamis(args.repeat)}
+    for name, value in results["kamis"].items():
+        if name.endswith("_seconds"):
+            print(f"  {name:.<55} {value * 1000:9.1f} ms")
+
+    for size in sizes:
+        print(f"\n  {size:,} farmers / buyers")
+        entry = {}
+        entry.update(bench_buyers(size, args.repeat))
+        entry.update(bench_formatting(size, args.repeat))
+        if not args.skip_workflow:
+            entry.update(bench_workflow(stubs, size))
+        results[str(size)] = entry
+
+        for name, value in entry.items():
+            if name.endswith("_seconds"):
+                print(f"  {name:.<55} {value * 1000:9.1f} ms")
+        if "workflow_seconds" in entry:
+            print(f"  {'workflow status':.<55} {entry['workflow_status']}")
+            print(f"  {'workflow farmers/s':.<55} {entry['workflow_farmers_per_second']:9.1f}")
+            print(f"  {'upstream requests':.<55} {sum(entry['upstream_requests'].values()):,}")
+
+    stubs.stop()
+
+    report = {
+        **git_commit(),
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": sizes,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{datetime.now():%Y%m%d-%H%M%S}-{report['commit']}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+
+    print(f"\n  Results saved to {path}")
+    if args.compare:
+        compare(report, args.compare)
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Benchmark: Pre-fork Memory
+==========================
+Starts the server twice with the same number of workers, then compares
+memory per process (RSS, PSS, shared, private) and the time until every
+worker answers:
+
+- no preload: each worker imports the app and builds its caches after
+  fork, the way `uvicorn --workers N` runs
+- preload: the master imports and warms once, then forks
+  (python -m app.prefork)
+
+Both runs get the same traffic first (WARM_PATHS), so every worker has
+loaded what it serves. PSS shares each
+shared page between the processes mapping it, so the PSS total is the
+real memory cost of the server.
+
+Then --workers separate processes map the buyers snapshot and run the
+buyer lookups the API serves (by type, county, crop and ID), each
+reporting its private memory growth: the records are read from the
+shared mapping, so the growth should stay flat as workers are added,
+and the PSS of the mapping is split between them. With --buyers N the
+snapshot is built from N synthetic buyers (benchmarks/synthetic.py)
+instead of the served data.
+
+Usage:
+    python benchmarks/bench_prefork_memory.py [--workers 4] [--requests 50] [--data-dir data]
+        [--buyers 100000]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add parent directory to path
+sys.path.insert(0, ROOT_DIR)
+
+import synthetic
+from app.prefork import memory_report
+
+# /api/prices is left out: without today's KAMIS files it would scrape KAMIS
+WARM_PATHS = ("/api/counties", "/api/buyers", "/api/buyers/stats", "/api/buyers/by-commodity")
+
+# Run in a process per worker, started together and kept alive until all
+# have reported: map the buyers snapshot (publishing it if needed), serve
+# lookups from it and print the private memory growth and the PSS
+LOOKUP_SCRIPT = """
+import json, os, sys
+from app.prefork import memory_info
+from app.services import buyers_service
+snapshot = buyers_service.get_buyers_snapshot()
+before = memory_info(os.getpid())["private"]
+returned = 0
+for _ in range(3):
+    for county in buyers_service.get_buyer_counties():
+        returned += len(buyers_service.get_buyers_by_county(county))
+    for buyer_type in buyers_service.get_buyer_types():
+        returned += len(buyers_service.get_buyers_by_type(buyer_type))
+    for crop in ("Tomatoes", "Sukuma", "Onions", "Cabbage"):
+        returned += len(buyers_service.get_buyers_by_crop(crop))
+        buyers_service.get_buyers_by_commodity("Nairobi")
+buyers_service.get_buyer_by_id(snapshot.record(snapshot.count - 1)["Buyer ID"])
+info = memory_info(os.getpid())
+print(json.dumps({"rows": snapshot.count, "mapped": snapshot.size, "returned": returned,
+                  "private_growth": info["private"] - before, "pss": info["pss"]}), flush=True)
+sys.stdin.read()
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def children(pid: int) -> list:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def get(url: str) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return 0
+
+
+def run_mode(preload: bool, workers: int, requests: int, data_dir: str) -> dict:
+    port = free_port()
+    env = dict(os.environ, DATA_DIR=data_dir, AGROSOKO_DB_PATH=os.path.join(data_dir, "agrosoko.db"),
+               LOG_LEVEL="WARNING", LOOP_LAG_INTERVAL_SECONDS="0")
+    command = [sys.executable, "-m", "app.prefork", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--memory-report-after", "0"]
+    if not preload:
+        command.append("--no-preload")
+
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        while get(f"{base_url}/") != 200:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with status {process.returncode}")
+            time.sleep(0.05)
+        first_response = time.perf_counter() - started
+
+        # Connections spread over the workers, so each one sees the warm-up paths
+        for _ in range(requests):
+            for path in WARM_PATHS:
+                get(base_url + path)
+        time.sleep(1)
+
+        pids = {"master": process.pid}
+        for index, pid in enumerate(sorted(children(process.pid)), 1):
+            pids[f"worker-{index}"] = pid
+        return {"first_response_seconds": first_response, "memory": memory_report(pids)}
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=40)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def snapshot_lookup_cost(workers: int, data_dir: str) -> list:
+    env = dict(os.environ, DATA_DIR=data_dir, AGROSOKO_DB_PATH=os.path.join(data_dir, "agrosoko.db"),
+               LOG_LEVEL="WARNING")
+    # One worker publishes the snapshot, so the others only map it
+    subprocess.run([sys.executable, "-c", "from app.services import buyers_service; buyers_service.get_buyers_snapshot()"],
+                   cwd=ROOT_DIR, env=env, check=True)
+
+    # Started one by one and kept alive, so each report includes the workers before it
+    processes, results = [], []
+    try:
+        for _ in range(workers):
+            process = subprocess.Popen([sys.executable, "-c", LOOKUP_SCRIPT], cwd=ROOT_DIR, env=env,
+                                       stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+            processes.append(process)
+            results.append(json.loads(process.stdout.readline()))
+    finally:
+        for process in processes:
+            process.stdin.close()
+            process.wait()
+    return results
+
+
+def print_report(name: str, result: dict) -> None:
+    def mb(value):
+        return f"{value / 1024 / 1024:9.1f}"
+
+    print(f"\n  {name} (first response after {result['first_response_seconds']:.2f}s)")
+    print(f"  {'process':<12}{'RSS MB':>10}{'PSS MB':>10}{'shared MB':>11}{'private MB':>12}")
+    for row in result["memory"]:
+        print(f"  {row['name']:<12}{mb(row['rss']):>10}{mb(row['pss']):>10}{mb(row['shared']):>11}{mb(row['private']):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=50, help="Rounds of warm-up requests per run")
+    parser.add_argument("--data-dir", default=os.path.join(ROOT_DIR, "data"),
+                        help="Data to serve (copied to a temporary directory)")
+    parser.add_argument("--buyers", type=int, default=0,
+                        help="Measure the snapshot decode with this many synthetic buyers (0: the served buyers.xlsx)")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="agrosoko-prefork-")
+    for name in os.listdir(args.data_dir):
+        if name.endswith(".xlsx") or name.startswith(".kamis"):
+            shutil.copy(os.path.join(args.data_dir, name), data_dir)
+
+    print("=" * 70)
+    print(f"PRE-FORK MEMORY ({args.workers} workers, {args.requests} rounds of {', '.join(WARM_PATHS)})")
+    print("=" * 70)
+
+    results = {}
+    for name, preload in (("no preload (uvicorn --workers)", False), ("preload (app.prefork)", True)):
+        results[name] = run_mode(preload, args.workers, args.requests, data_dir)
+        print_report(name, results[name])
+
+    before, after = (result["memory"][-1] for result in results.values())
+    worker_pss = [
+        [row["pss"] for row in result["memory"] if row["name"].startswith("worker-")]
+        for result in results.values()
+    ]
+    print()
+    print(f"  {'total PSS':.<45} {before['pss'] / 1024 / 1024:8.1f} -> {after['pss'] / 1024 / 1024:8.1f} MB")
+    if all(worker_pss):
+        average = [sum(values) / len(values) / 1024 / 1024 for values in worker_pss]
+        print(f"  {'average worker PSS':.<45} {average[0]:8.1f} -> {average[1]:8.1f} MB")
+
+    decode_dir = data_dir
+    if args.buyers:
+        decode_dir = tempfile.mkdtemp(prefix="agrosoko-decode-")
+        synthetic.write_buyers_store(decode_dir, args.buyers)
+    lookups = snapshot_lookup_cost(args.workers, decode_dir)
+    mapped = lookups[0]["mapped"] / 1024 / 1024
+    print(f"\n  Buyers snapshot ({lookups[0]['rows']:,} rows, {mapped:.1f} MB mapped once, shared)")
+    print(f"  {'worker':<12}{'buyers returned':>17}{'heap growth MB':>16}{'PSS MB':>10}")
+    for index, lookup in enumerate(lookups, 1):
+        print(f"  {f'worker-{index}':<12}{lookup['returned']:>17,}{lookup['private_growth'] / 1024 / 1024:>16.1f}"
+              f"{lookup['pss'] / 1024 / 1024:>10.1f}")
+    total = sum(lookup["private_growth"] for lookup in lookups) / 1024 / 1024
+    print(f"  {'heap growth, all workers':.<45} {total:8.1f} MB")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
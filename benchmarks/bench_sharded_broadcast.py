@@ -0,0 +1,222 @@
+"""
+Benchmark: Sharded Broadcast
+============================
+Sends one daily broadcast split into --shards shards (BROADCAST_SHARDS)
+with 1, 2, 4... worker processes working on it, against the stand-ins in
+benchmarks/stubs.py, and reports how the send phase scales with workers.
+
+Every worker is a separate process. With --backend sqlite they share one
+temporary agrosoko.db, as the workers of one host share the local store
+in production; with --backend redis the plan and claims live on a
+benchmarks/fake_redis.py server, as workers on several hosts would share
+one Redis. The run is planned once (scrape, fair prices, roster) and each
+--workers count sends a fresh copy of the plan.
+
+The stubs use the realistic latency profile without rate limits: a quota
+caps the send rate however many workers share it (simulate_broadcast.py
+projects that case).
+
+A failover check then kills a worker mid-shard and starts another: the run
+must still complete, with the killed worker's shard re-queued and at most
+the message in flight when it died sent twice. Any failure exits with
+status 1.
+
+Usage:
+    python benchmarks/bench_sharded_broadcast.py [--farmers 120] [--shards 8] [--workers 1,2,4]
+        [--backend sqlite|redis]
+"""
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+# Add parent directory to path
+sys.path.insert(0, ROOT_DIR)
+
+from fake_redis import FakeRedis
+from stubs import StubProcess
+
+# App modules read their configuration at import time, so they are imported
+# after main() has set the environment (and again in each worker process).
+
+NO_RATE_LIMITS = {"graph_api": (0, 0), "sheets_read": (0, 0), "sheets_write": (0, 0)}
+
+
+def worker(run_id: str, environment: dict) -> None:
+    os.environ.update(environment)
+    from app import main
+    with contextlib.redirect_stdout(io.StringIO()):
+        main.work_shards(run_id)
+
+
+def start_worker(run_id: str) -> multiprocessing.Process:
+    process = multiprocessing.get_context("spawn").Process(target=worker, args=(run_id, dict(os.environ)), daemon=True)
+    process.start()
+    return process
+
+
+def plan_run(prepared: tuple, shards: int, label: str) -> str:
+    from app.services import broadcast_shards, run_registry
+
+    run_id = f"bench-shards-{label}-{int(time.time() * 1000)}"
+    run_registry.claim_run(run_id)
+    fair_prices, farmers = prepared
+    broadcast_shards.create_plan(run_id, fair_prices, farmers, shard_count=shards)
+    return run_id
+
+
+def sent_since(stubs: StubProcess, before: int) -> int:
+    return stubs.stats()["messages_sent"] - before
+
+
+def run_outcome(run_id: str) -> dict:
+    # How the run closed and what its shards checkpointed, from the shard
+    # store (with redis, the local run record is closed by its owner only)
+    from app.services import broadcast_shards
+
+    closed = broadcast_shards.closed_status(run_id) or {}
+    shard_rows = broadcast_shards.list_shards(run_id)
+    return {
+        "status": closed.get("status"),
+        "processed": sum(shard["processed"] for shard in shard_rows),
+        "shards": shard_rows,
+    }
+
+
+def bench_workers(stubs: StubProcess, prepared: tuple, shards: int, workers: int) -> dict:
+    from app.services import broadcast_shards
+
+    run_id = plan_run(prepared, shards, f"{workers}w")
+    before = stubs.stats()["messages_sent"]
+
+    started = time.perf_counter()
+    processes = [start_worker(run_id) for _ in range(workers)]
+    for process in processes:
+        process.join()
+    seconds = time.perf_counter() - started
+
+    outcome = run_outcome(run_id)
+    return {
+        "seconds": seconds,
+        "status": outcome["status"],
+        "processed": outcome["processed"],
+        "sent": sent_since(stubs, before),
+        "owners": len(broadcast_shards.combined_summary(run_id)["owners"]),
+    }
+
+
+def check_failover(stubs: StubProcess, prepared: tuple, shards: int, failures: list) -> None:
+    from app.services import broadcast_shards
+
+    run_id = plan_run(prepared, shards, "failover")
+    before = stubs.stats()["messages_sent"]
+    farmers = len(prepared[1])
+
+    doomed = start_worker(run_id)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        # Owners are "host:pid[:start time]"
+        if any((shard["owner"] or "").split(":")[1:2] == [str(doomed.pid)] and shard["status"] == broadcast_shards.SHARD_CLAIMED and shard["processed"]
+               for shard in broadcast_shards.list_shards(run_id)):
+            break
+        time.sleep(0.05)
+    doomed.kill()
+    doomed.join()
+
+    survivor = start_worker(run_id)
+    survivor.join()
+
+    run = run_outcome(run_id)
+    sent = sent_since(stubs, before)
+    retried = [shard["shard"] for shard in run["shards"] if shard["attempts"] > 1]
+
+    print(f"  killed worker pid {doomed.pid}; shards re-queued: {retried or 'none'}")
+    print(f"  run {run['status']}, {run['processed']}/{farmers} farmers, {sent} messages sent")
+    if run["status"] != "completed":
+        failures.append(f"failover: run ended {run['status']}")
+    if run["processed"] != farmers:
+        failures.append(f"failover: {run['processed']} of {farmers} farmers checkpointed")
+    if not retried:
+        failures.append("failover: no shard was re-queued after the worker was killed")
+    if not farmers <= sent <= farmers + 1:
+        failures.append(f"failover: {sent} messages for {farmers} farmers")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--farmers", type=int, default=120)
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--workers", default="1,2,4", help="Worker counts to time, comma separated")
+    parser.add_argument("--backend", choices=("sqlite", "redis"), default="sqlite",
+                        help="Shard store (BROADCAST_SHARD_BACKEND); redis runs against fake_redis.py")
+    args = parser.parse_args()
+    worker_counts = [int(count) for count in args.workers.split(",") if count.strip()]
+
+    data_dir = tempfile.mkdtemp(prefix="agrosoko-shards-")
+    stubs = StubProcess(farmers=args.farmers, profile="realistic", rate_limits=NO_RATE_LIMITS)
+
+    # Must be set before the app modules read their configuration
+    os.environ.update(stubs.environment())
+    os.environ["DATA_DIR"] = data_dir
+    os.environ["AGROSOKO_DB_PATH"] = os.path.join(data_dir, "agrosoko.db")
+    os.environ["BROADCAST_SHARDS"] = str(args.shards)
+    os.environ["BROADCAST_SHARD_BACKEND"] = args.backend
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    redis = None
+    if args.backend == "redis":
+        redis = FakeRedis().start()
+        os.environ["BROADCAST_SHARD_URL"] = redis.url
+
+    from app import main as app_main
+    from app.services import kamis_scraper, metrics
+
+    # Daily mode: skip the one-off historical download
+    os.makedirs(kamis_scraper.DATA_DIR, exist_ok=True)
+    with open(kamis_scraper.INITIAL_DOWNLOAD_MARKER, "w") as f:
+        f.write(datetime.now().isoformat())
+
+    print("=" * 70)
+    print(f"SHARDED BROADCAST ({args.farmers:,} farmers in {args.shards} shards, {args.backend} store)")
+    print(f"  Stubs: {stubs.base_url}   Data: {data_dir}")
+    print("=" * 70)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        prepared = app_main.prepare_broadcast(metrics.StageTimer())
+
+    failures = []
+    baseline = None
+    print(f"  {'workers':>7}{'seconds':>10}{'farmers/s':>11}{'speedup':>9}{'owners':>8}{'sent':>7}   status")
+    for workers in worker_counts:
+        result = bench_workers(stubs, prepared, args.shards, workers)
+        baseline = baseline or result["seconds"]
+        print(f"  {workers:>7}{result['seconds']:>10.2f}{args.farmers / result['seconds']:>11.1f}"
+              f"{baseline / result['seconds']:>8.2f}x{result['owners']:>8}{result['sent']:>7}   {result['status']}")
+        if result["status"] != "completed" or result["sent"] != args.farmers:
+            failures.append(f"{workers} workers: {result['status']} with {result['sent']} of {args.farmers} messages")
+
+    print()
+    check_failover(stubs, prepared, args.shards, failures)
+    stubs.stop()
+    if redis is not None:
+        redis.stop()
+
+    print()
+    for failure in failures:
+        print(f"  FAIL: {failure}")
+    if not failures:
+        print("  OK: every run completed; the killed worker's shard was re-queued")
+    print("=" * 70)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Benchmark: Startup Time
+=======================
+Measures how long a fresh interpreter takes to import app.main (what a
+uvicorn worker does before it can answer its first request), and fails
+when startup regresses:
+
+- importing app.main takes longer than --budget-ms (median of --repeat runs)
+- any heavy dependency (HEAVY_MODULES) is imported by app.main instead of
+  lazily at first use (see app/services/lazy_imports.py)
+
+Also reports the slowest imports (python -X importtime) and what each
+deferred dependency costs the first request that needs it.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat 5] [--budget-ms 800] [--top 15]
+        [--output startup.json]
+
+Exits with status 1 if the budget or the lazy-import check fails.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported on first use, never by app.main
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl", "bs4", "gspread", "google.auth", "google.oauth2", "oauth2client")
+
+# Default import budget for app.main (milliseconds)
+DEFAULT_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "800"))
+
+# Runs in a fresh interpreter: times import app.main, then each deferred module
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import app.main
+import_seconds = time.perf_counter() - started
+loaded = [name for name in HEAVY if name in sys.modules]
+modules = len(sys.modules)
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+deferred = {}
+for name in HEAVY:
+    started = time.perf_counter()
+    try:
+        __import__(name)
+    except ImportError:
+        continue
+    deferred[name] = time.perf_counter() - started
+print(json.dumps({"import_seconds": import_seconds, "heavy_loaded": loaded, "modules": modules,
+                  "rss_bytes": rss, "deferred_seconds": deferred}))
+"""
+
+
+def probe_environment(data_dir: str) -> dict:
+    env = dict(os.environ)
+    env.update({"DATA_DIR": data_dir, "AGROSOKO_DB_PATH": os.path.join(data_dir, "agrosoko.db"), "LOG_LEVEL": "WARNING"})
+    env.pop("PYTHONPROFILEIMPORTTIME", None)
+    return env
+
+
+def run_probe(env: dict) -> dict:
+    code = f"HEAVY = {HEAVY_MODULES!r}\n{PROBE}"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, env=env, capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing app.main failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(env: dict, top: int) -> list:
+    """
+    The top modules by cumulative import time (microseconds) under -X importtime.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True, timeout=120
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|", 2)
+        entries.append({"module": name.strip(), "self_us": int(own), "cumulative_us": int(cumulative)})
+    return sorted(entries, key=lambda entry: -entry["cumulative_us"])[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="Median import time allowed for app.main")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    env = probe_environment(tempfile.mkdtemp(prefix="agrosoko-startup-"))
+    # The first run warms the bytecode and filesystem caches
+    run_probe(env)
+    runs = [run_probe(env) for _ in range(args.repeat)]
+
+    times = sorted(run["import_seconds"] for run in runs)
+    median = statistics.median(times)
+    heavy = sorted({name for run in runs for name in run["heavy_loaded"]})
+    deferred = {name: statistics.median(run["deferred_seconds"].get(name, 0) for run in runs) for name in HEAVY_MODULES}
+
+    print("=" * 70)
+    print(f"STARTUP TIME (import app.main, {args.repeat} fresh interpreters)")
+    print("=" * 70)
+    print(f"  {'median':.<45} {median * 1000:9.1f} ms")
+    print(f"  {'min / max':.<45} {times[0] * 1000:9.1f} / {times[-1] * 1000:.1f} ms")
+    print(f"  {'budget':.<45} {args.budget_ms:9.1f} ms")
+    print(f"  {'modules loaded':.<45} {runs[-1]['modules']:9,}")
+    print(f"  {'peak RSS after import':.<45} {runs[-1]['rss_bytes'] / 1024 / 1024:9.1f} MB")
+
+    print("\n  Deferred to first use (import cost paid by the first request needing it)")
+    for name, seconds in deferred.items():
+        state = "LOADED AT STARTUP" if name in heavy else f"{seconds * 1000:9.1f} ms"
+        print(f"  {name:.<45} {state}")
+
+    slowest = slowest_imports(env, args.top)
+    print("\n  Slowest imports (cumulative, python -X importtime)")
+    for entry in slowest:
+        print(f"  {entry['module']:.<45} {entry['cumulative_us'] / 1000:9.1f} ms")
+
+    failures = []
+    if median * 1000 > args.budget_ms:
+        failures.append(f"import app.main took {median * 1000:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+    if heavy:
+        failures.append(f"imported at startup instead of lazily: {', '.join(heavy)}")
+
+    print()
+    for failure in failures:
+        print(f"  FAIL: {failure}")
+    if not failures:
+        print("  OK: within budget, heavy dependencies deferred")
+    print("=" * 70)
+
+    if args.output:
+        report = {
+            "python": sys.version.split()[0],
+            "budget_ms": args.budget_ms,
+            "median_seconds": median,
+            "runs": runs,
+            "slowest_imports": slowest,
+            "failures": failures,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"  Report saved to {args.output}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Fake Redis
+==========
+A small in-memory server speaking the Redis protocol (RESP2), for
+running the redis cache backend (app/services/cache.py) and the redis
+broadcast shard store (app/services/broadcast_shards.py) without a real
+Redis. It supports the commands they use, with expiry:
+
+    PING, AUTH, SELECT, GET, MGET, SET [EX|PX] [NX|XX], DEL, EXISTS,
+    PTTL, PEXPIRE, INCR, RPUSH, LRANGE, LLEN, SCAN [MATCH] [COUNT],
+    DBSIZE, FLUSHDB
+
+Used by benchmarks/bench_cache_backends.py; also runs on its own:
+
+Usage:
+    python benchmarks/fake_redis.py [--port 6379] [--password secret]
+"""
+
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class FakeRedis(socketserver.ThreadingTCPServer):
+    """
+    Threaded RESP server over one shared keyspace per database number.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, password: Optional[str] = None):
+        super().__init__((host, port), _Handler)
+        self.password = password
+        self.lock = threading.Lock()
+        # db -> key -> (expires_at, value)
+        self.databases: Dict[int, Dict[bytes, Tuple[Optional[float], bytes]]] = {}
+        self.commands = 0
+        self._swept_at = 0.0
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}{host}:{port}/0"
+
+    def start(self) -> "FakeRedis":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-redis", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def keyspace(self, db: int) -> Dict[bytes, Tuple[Optional[float], bytes]]:
+        """
+        The keyspace of db, dropping expired keys at most once a second
+        (caller holds lock; single keys are checked with lookup()).
+        """
+        keyspace = self.databases.setdefault(db, {})
+        now = time.time()
+        if now - self._swept_at >= 1:
+            self._swept_at = now
+            for key in [key for key, (expires_at, _) in keyspace.items() if expires_at is not None and expires_at <= now]:
+                del keyspace[key]
+        return keyspace
+
+
+def lookup(keyspace: Dict, key: bytes) -> Optional[bytes]:
+    entry = keyspace.get(key)
+    if entry is None:
+        return None
+    if entry[0] is not None and entry[0] <= time.time():
+        del keyspace[key]
+        return None
+    return entry[1]
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    # Replies to a pipeline are written one by one
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.db = 0
+        self.authenticated = self.server.password is None
+
+    def handle(self):
+        while True:
+            try:
+                command = self.read_command()
+            except (ConnectionError, ValueError):
+                return
+            if command is None:
+                return
+            self.server.commands += 1
+            self.wfile.write(self.execute(command))
+
+    def read_command(self) -> Optional[List[bytes]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline command (redis-cli over telnet)
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def execute(self, command: List[bytes]) -> bytes:
+        name, args = command[0].upper().decode(), command[1:]
+        if name == "AUTH":
+            if args and args[-1].decode() == self.server.password:
+                self.authenticated = True
+                return ok()
+            return error("WRONGPASS invalid username-password pair")
+        if not self.authenticated:
+            return error("NOAUTH Authentication required.")
+        if name == "PING":
+            return b"+PONG\r\n"
+        if name == "SELECT":
+            self.db = int(args[0])
+            return ok()
+
+        with self.server.lock:
+            keyspace = self.server.keyspace(self.db)
+            if name == "GET":
+                value = lookup(keyspace, args[0])
+                if isinstance(value, list):
+                    return WRONGTYPE
+                return bulk(value)
+            if name == "MGET":
+                # Keys holding lists read as missing, as in Redis
+                return b"*%d\r\n" % len(args) + b"".join(
+                    bulk(value if isinstance(value, bytes) else None)
+                    for value in (lookup(keyspace, key) for key in args)
+                )
+            if name == "SET":
+                expires_at = None
+                options = [arg.upper() for arg in args[2:]]
+                exists = lookup(keyspace, args[0]) is not None
+                if (b"NX" in options and exists) or (b"XX" in options and not exists):
+                    return bulk(None)
+                if b"EX" in options:
+                    expires_at = time.time() + int(args[2 + options.index(b"EX") + 1])
+                elif b"PX" in options:
+                    expires_at = time.time() + int(args[2 + options.index(b"PX") + 1]) / 1000
+                keyspace[args[0]] = (expires_at, args[1])
+                return ok()
+            if name == "PEXPIRE":
+                value = lookup(keyspace, args[0])
+                if value is None:
+                    return integer(0)
+                keyspace[args[0]] = (time.time() + int(args[1]) / 1000, value)
+                return integer(1)
+            if name == "INCR":
+                entry = keyspace.get(args[0]) if lookup(keyspace, args[0]) is not None else None
+                expires_at, value = entry or (None, b"0")
+                if isinstance(value, list):
+                    return WRONGTYPE
+                value = str(int(value) + 1).encode()
+                keyspace[args[0]] = (expires_at, value)
+                return integer(int(value))
+            if name in ("RPUSH", "LRANGE", "LLEN"):
+                value = lookup(keyspace, args[0])
+                if value is not None and not isinstance(value, list):
+                    return WRONGTYPE
+                items = value or []
+                if name == "RPUSH":
+                    items = items + list(args[1:])
+                    keyspace[args[0]] = (keyspace[args[0]][0] if value is not None else None, items)
+                    return integer(len(items))
+                if name == "LLEN":
+                    return integer(len(items))
+                start, stop = int(args[1]), int(args[2])
+                stop = stop + 1 if stop >= 0 else len(items) + stop + 1
+                selected = items[start:stop]
+                return b"*%d\r\n" % len(selected) + b"".join(bulk(item) for item in selected)
+            if name == "DEL":
+                deleted = 0
+                for key in args:
+                    if lookup(keyspace, key) is not None:
+                        del keyspace[key]
+                        deleted += 1
+                return integer(deleted)
+            if name == "EXISTS":
+                return integer(sum(lookup(keyspace, key) is not None for key in args))
+            if name == "PTTL":
+                if lookup(keyspace, args[0]) is None:
+                    return integer(-2)
+                entry = keyspace[args[0]]
+                return integer(-1 if entry[0] is None else int((entry[0] - time.time()) * 1000))
+            if name == "SCAN":
+                options = [arg.upper() for arg in args[1:]]
+                pattern = args[1 + options.index(b"MATCH") + 1].decode() if b"MATCH" in options else "*"
+                # One pass over the whole keyspace: the cursor always ends at 0
+                keys = [key for key in list(keyspace) if lookup(keyspace, key) is not None and fnmatch.fnmatchcase(key.decode(errors="replace"), pattern)]
+                return b"*2\r\n" + bulk(b"0") + b"*%d\r\n" % len(keys) + b"".join(bulk(key) for key in keys)
+            if name == "DBSIZE":
+                return integer(sum(lookup(keyspace, key) is not None for key in list(keyspace)))
+            if name == "FLUSHDB":
+                keyspace.clear()
+                return ok()
+        return error(f"ERR unknown command '{name}'")
+
+
+WRONGTYPE = b"-WRONGTYPE Operation against a key holding the wrong kind of value\r\n"
+
+
+def ok() -> bytes:
+    return b"+OK\r\n"
+
+
+def error(message: str) -> bytes:
+    return f"-{message}\r\n".encode()
+
+
+def integer(value: int) -> bytes:
+    return b":%d\r\n" % value
+
+
+def bulk(value: Optional[bytes]) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--password")
+    args = parser.parse_args()
+
+    server = FakeRedis(args.host, args.port, args.password)
+    print(f"Fake Redis listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
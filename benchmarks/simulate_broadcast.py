@@ -0,0 +1,266 @@
+"""
+Simulation: Daily Broadcast
+===========================
+Runs run_daily_workflow end to end against stand-ins for KAMIS, Open-Meteo,
+the WhatsApp Graph API and Google Sheets (benchmarks/stubs.py) with a
+synthetic roster, then projects how long the real 4:30 AM run would take.
+
+The stubs run in their own process and apply a latency profile (log-normal
+per route) and each upstream's rate limits, answering with its 429 response
+when a limit is hit, so the sample run pays the same waits and failures the
+real run would. Nothing is sent to a real farmer or sheet.
+
+Reports:
+- wall time, farmers/s and messages/s for the sample roster
+- failed sends and activity log writes, time per stage
+- upstream calls and rate-limited responses per route, and per farmer
+- peak memory (RSS) of the workflow process
+- projected wall time and finish time for each --project roster
+  size and --workers count, and what limits it (per-farmer time or a quota)
+
+The projection is linear: setup stages are counted once, everything else
+per farmer, and a quota caps the rate however many workers share it.
+
+Usage:
+    python benchmarks/simulate_broadcast.py [--farmers 300] [--project 100000,1000000]
+        [--profile realistic] [--workers 1,4] [--graph-rate 80] [--sheets-write-rate 1]
+        [--start 04:30] [--output report.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+# Add parent directory to path
+sys.path.insert(0, ROOT_DIR)
+
+from stubs import PROFILES, ROUTE_QUOTAS, StubProcess
+
+# App modules read their configuration at import time, so they are imported
+# in simulate(), after main() has pointed the environment at the stubs.
+
+# Stages run once per workflow rather than once per farmer
+SETUP_STAGES = ("scrape", "excel", "fair_prices", "farmers")
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def current_rss() -> int:
+    """
+    Resident set size of this process in bytes.
+    """
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+class PeakMemory:
+    """
+    Samples RSS every interval seconds while active and keeps the peak.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="peak-memory", daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self) -> "PeakMemory":
+        self.baseline = self.peak = current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        # ru_maxrss (KiB on Linux) catches peaks between samples
+        self.peak = max(self.peak, current_rss(), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+
+def simulate(farmers: int) -> dict:
+    from app import main
+    from app.services import http_client, kamis_scraper, metrics, run_registry
+
+    # Daily mode: skip the one-off historical download
+    os.makedirs(kamis_scraper.DATA_DIR, exist_ok=True)
+    with open(kamis_scraper.INITIAL_DOWNLOAD_MARKER, "w") as f:
+        f.write(datetime.now().isoformat())
+
+    metrics.reset()
+    run_id = f"simulate-{farmers}-{int(time.time() * 1000)}"
+    run_registry.claim_run(run_id)
+
+    with PeakMemory() as memory, contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        main.run_daily_workflow(run_id)
+        seconds = time.perf_counter() - started
+
+    run = run_registry.get_run(run_id) or {}
+    summaries = run_registry.get_summaries(run_id)
+    return {
+        "run_id": run_id,
+        "status": run.get("status"),
+        "wall_seconds": seconds,
+        "summary": summaries[-1]["summary"] if summaries else {},
+        "rss_baseline_bytes": memory.baseline,
+        "rss_peak_bytes": memory.peak,
+        "http_hosts": http_client.get_host_stats(),
+        "upstreams": metrics.get_upstream_summary(),
+    }
+
+
+def project(result: dict, stub_stats: dict, farmers: int, total: int, workers: int,
+            rate_limits: dict, start: datetime) -> dict:
+    """
+    Extrapolates the sample run to total farmers split across workers.
+    """
+    stages = result["summary"].get("stages", {})
+    setup = sum(stages.get(name, {}).get("sum_seconds", 0) for name in SETUP_STAGES)
+    per_farmer = max(result["wall_seconds"] - setup, 0) / farmers
+
+    # Seconds each limit needs for the whole roster: per-farmer time split
+    # across workers, and each quota shared by all of them
+    limits = {"per_farmer_time": setup + per_farmer * total / workers}
+    requests = stub_stats.get("requests", {})
+    for quota, (rate, _) in rate_limits.items():
+        calls = sum(count for route, count in requests.items() if ROUTE_QUOTAS.get(route) == quota)
+        if rate and calls:
+            limits[quota] = setup + calls / farmers * total / rate
+
+    limited_by = max(limits, key=limits.get)
+    seconds = limits[limited_by]
+    finish = start + timedelta(seconds=seconds)
+    days = (finish.date() - start.date()).days
+    return {
+        "farmers": total,
+        "workers": workers,
+        "seconds": round(seconds, 1),
+        "finish": finish.strftime("%H:%M") + (f" +{days}d" if days else ""),
+        "messages_per_second": round(total / seconds, 2) if seconds else None,
+        "limited_by": limited_by,
+        "limits_seconds": {name: round(value, 1) for name, value in limits.items()},
+    }
+
+
+def parse_time(value: str) -> datetime:
+    clock = datetime.strptime(value, "%H:%M")
+    return datetime.now().replace(hour=clock.hour, minute=clock.minute, second=0, microsecond=0)
+
+
+def megabytes(value: int) -> str:
+    return f"{value / 1024 / 1024:,.1f} MB"
+
+
+def duration(seconds: float) -> str:
+    minutes = round(seconds / 60)
+    return f"{minutes // 60}h{minutes % 60:02d}m"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--farmers", type=int, default=300, help="Synthetic roster size for the sample run")
+    parser.add_argument("--project", default="100000,1000000", help="Roster sizes to project to, comma separated")
+    parser.add_argument("--workers", default="1,4", help="Worker counts to project for, comma separated")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="realistic")
+    parser.add_argument("--graph-rate", type=float, help="Graph API messages per second (profile default)")
+    parser.add_argument("--sheets-read-rate", type=float, help="Sheets reads per second (profile default)")
+    parser.add_argument("--sheets-write-rate", type=float, help="Sheets writes per second (profile default)")
+    parser.add_argument("--start", default="04:30", help="Broadcast start time, HH:MM")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    rate_limits = dict(PROFILES[args.profile]["rate_limits"])
+    for quota, rate in (("graph_api", args.graph_rate), ("sheets_read", args.sheets_read_rate),
+                        ("sheets_write", args.sheets_write_rate)):
+        if rate is not None:
+            burst = rate_limits.get(quota, (rate, rate))[1]
+            rate_limits[quota] = (rate, burst)
+
+    data_dir = tempfile.mkdtemp(prefix="agrosoko-simulate-")
+    stubs = StubProcess(farmers=args.farmers, profile=args.profile, rate_limits=rate_limits, seed=args.seed)
+
+    # Must be set before the app modules read their configuration
+    os.environ.update(stubs.environment())
+    os.environ["DATA_DIR"] = data_dir
+    os.environ["AGROSOKO_DB_PATH"] = os.path.join(data_dir, "agrosoko.db")
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+    print("=" * 70)
+    print(f"BROADCAST SIMULATION ({args.farmers:,} farmers, profile {args.profile})")
+    print(f"  Stubs: {stubs.base_url}   Data: {data_dir}")
+    for quota, (rate, burst) in sorted(rate_limits.items()):
+        print(f"  {quota + ' limit':.<40} {rate:g}/s (burst {burst:g})")
+    print("=" * 70)
+
+    try:
+        result = simulate(args.farmers)
+        stub_stats = stubs.stats()
+    finally:
+        stubs.stop()
+
+    summary = result["summary"]
+    counters = summary.get("counters", {})
+    sent = counters.get("messages_sent", 0)
+    seconds = result["wall_seconds"]
+
+    print(f"\n  Sample run ({result['status']})")
+    print(f"  {'wall time':.<40} {seconds:10.1f} s")
+    print(f"  {'farmers/s':.<40} {args.farmers / seconds:10.2f}")
+    print(f"  {'messages/s':.<40} {sent / seconds:10.2f}")
+    for name in ("messages_sent", "messages_failed", "sheets_log_failed", "weather_mock"):
+        print(f"  {name:.<40} {counters.get(name, 0):10,}")
+    print(f"  {'peak RSS':.<40} {megabytes(result['rss_peak_bytes']):>13} (from {megabytes(result['rss_baseline_bytes'])})")
+
+    print("\n  Stages")
+    for name, stats in sorted(summary.get("stages", {}).items(), key=lambda item: -item[1]["sum_seconds"]):
+        print(f"  {name:.<40} {stats['sum_seconds']:10.2f} s  {stats['share'] * 100:5.1f}%  p95 {(stats['p95_seconds'] or 0) * 1000:8.1f} ms")
+
+    print("\n  Upstream calls            requests  rate limited  per farmer")
+    limited = stub_stats.get("rate_limited", {})
+    for route, count in sorted(stub_stats.get("requests", {}).items()):
+        print(f"  {route:<26}{count:9,} {limited.get(route, 0):13,} {count / args.farmers:11.2f}")
+
+    start = parse_time(args.start)
+    projections = []
+    print(f"\n  Projection (start {args.start})")
+    for total in (int(size) for size in args.project.split(",") if size.strip()):
+        for workers in (int(count) for count in args.workers.split(",") if count.strip()):
+            projected = project(result, stub_stats, args.farmers, total, workers, rate_limits, start)
+            projections.append(projected)
+            print(f"  {total:>9,} farmers x {workers} worker(s): {duration(projected['seconds']):>9}  "
+                  f"done {projected['finish']:>8}  {projected['messages_per_second']:8.2f} msg/s  limited by {projected['limited_by']}")
+    print("=" * 70)
+
+    if args.output:
+        report = {
+            "recorded_at": datetime.now().isoformat(timespec="seconds"),
+            "farmers": args.farmers,
+            "profile": args.profile,
+            "rate_limits": rate_limits,
+            "result": result,
+            "stubs": stub_stats,
+            "projections": projections,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"  Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+"""
+Stub Upstreams - Local stand-ins for KAMIS, Open-Meteo, the WhatsApp
+Graph API and Google Sheets
+===================================================================
+One threaded HTTP server answers the requests the app makes to each
+upstream, with generated data, so benchmarks run without network access:
+
+    KAMIS        GET  /site/market?product=&per_page=&export=excel  (xlsx export)
+    Open-Meteo   GET  /v1/forecast
+    Graph API    POST /v17.0/{phone_id}/messages
+    Sheets       GET  /v4/spreadsheets/{id}                        (metadata)
+                 GET  /v4/spreadsheets/{id}/values/{range}
+                 POST /v4/spreadsheets/{id}/values/{range}:append
+    Drive        GET  /drive/v3/files                              (open by name)
+
+Point the app at it with HTTP_HOST_OVERRIDES and GOOGLE_SHEETS_EMULATOR_HOST
+(see environment()).
+
+A profile (PROFILES) adds per-route latency and per-upstream rate limits;
+requests over a limit get the upstream's 429 response. GET /_stub/stats
+returns request, rate-limited and latency counts per route. StubProcess
+runs the server in a child process, so it does not share the measured
+process's CPU, GIL or memory.
+
+Usage:
+    with StubUpstreams(farmers=10000) as stubs:
+        os.environ.update(stubs.environment())
+        ...
+"""
+
+import io
+import json
+import math
+import multiprocessing
+import random
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import synthetic
+
+# Hosts answered by the stub server
+KAMIS_HOST = "kamis.kilimo.go.ke"
+OPEN_METEO_HOST = "api.open-meteo.com"
+GRAPH_API_HOST = "graph.facebook.com"
+
+SPREADSHEET_ID = "bench-spreadsheet"
+SPREADSHEET_NAME = "AgroGhala_Logs"
+
+SHEET_HEADERS = {
+    "Activity_Log": ["Date", "Farmer Name", "County", "Prices Sent", "Weather Summary", "Farmer Reply", "Buyer List Sent", "Timestamp"],
+    "Farmers": synthetic.FARMER_COLUMNS,
+    "Buyers": ["Name", "Crop", "Price (KSh/kg)", "Phone", "Location"],
+}
+
+# Route -> the upstream quota it counts against
+ROUTE_QUOTAS = {
+    "graph_messages": "graph_api",
+    "sheets_metadata": "sheets_read",
+    "sheets_values_get": "sheets_read",
+    "drive_files_list": "sheets_read",
+    "sheets_values_append": "sheets_write",
+}
+
+# latency: route -> (median, p95) seconds, drawn from a log-normal distribution
+# rate_limits: quota -> (requests per second, burst)
+PROFILES = {
+    "instant": {"latency": {}, "rate_limits": {}},
+    "realistic": {
+        # Round trips from a Nairobi VPS
+        "latency": {
+            "kamis_export": (1.5, 5.0),
+            "open_meteo_forecast": (0.12, 0.4),
+            "graph_messages": (0.25, 0.8),
+            "sheets_metadata": (0.15, 0.5),
+            "sheets_values_get": (0.3, 1.2),
+            "sheets_values_append": (0.35, 1.2),
+            "drive_files_list": (0.2, 0.6),
+        },
+        "rate_limits": {
+            # Cloud API default throughput: 80 messages/s
+            "graph_api": (80.0, 80),
+            # Sheets: 60 reads and 60 writes per minute per user (one service account)
+            "sheets_read": (1.0, 60),
+            "sheets_write": (1.0, 60),
+        },
+    },
+}
+
+RATE_LIMITED_BODIES = {
+    "graph_api": {"error": {"message": "(#130429) Rate limit hit", "type": "OAuthException", "code": 130429}},
+    "sheets_read": {"error": {"code": 429, "message": "Quota exceeded for quota metric 'Read requests'", "status": "RESOURCE_EXHAUSTED"}},
+    "sheets_write": {"error": {"code": 429, "message": "Quota exceeded for quota metric 'Write requests'", "status": "RESOURCE_EXHAUSTED"}},
+}
+
+
+def environment(base_url: str) -> Dict[str, str]:
+    """
+    Environment variables that send the app's upstream calls to base_url.
+    Set them before the app modules are imported.
+    """
+    overrides = ",".join(f"{host}={base_url}" for host in (KAMIS_HOST, OPEN_METEO_HOST, GRAPH_API_HOST))
+    return {
+        "HTTP_HOST_OVERRIDES": overrides,
+        "HTTP_FIXTURES_MODE": "off",
+        "GOOGLE_SHEETS_EMULATOR_HOST": base_url,
+        "GOOGLE_SHEETS_ID": SPREADSHEET_ID,
+        "GOOGLE_SHEETS_NAME": SPREADSHEET_NAME,
+        "WHATSAPP_TOKEN": "stub-token",
+        "WHATSAPP_PHONE_ID": "stub-phone-id",
+        "KAMIS_REQUEST_DELAY_SECONDS": "0",
+        "OPENWEATHER_API_KEY": "",
+    }
+
+
+class TokenBucket:
+    """
+    Allows rate requests per second on average, and up to burst at once.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def sample_latency(median: float, p95: float, rng: random.Random) -> float:
+    """
+    A log-normal latency with the given median and 95th percentile.
+    """
+    sigma = math.log(p95 / median) / 1.645 if p95 > median else 0.0
+    return rng.lognormvariate(math.log(median), sigma)
+
+
+# Markets in each KAMIS export (the real site lists a few dozen per commodity)
+KAMIS_EXPORT_MARKETS = 30
+
+
+def make_kamis_export(product_id: int, rows: int, seed: int = 42) -> bytes:
+    """
+    A KAMIS "Export to Excel" workbook for one commodity, newest rows
+    (dated today) first, as the site returns it.
+    """
+    buffer = io.BytesIO()
+    generated = synthetic.kamis_rows(KAMIS_EXPORT_MARKETS, years=100, products=[product_id], seed=seed)
+    synthetic.write_xlsx(buffer, synthetic.KAMIS_COLUMNS, islice(generated, rows), sheet_name="Market Prices")
+    return buffer.getvalue()
+
+
+class StubUpstreams:
+    """
+    The stub server and its data. Counts every request per route, and keeps
+    Activity_Log appends in memory.
+    """
+
+    def __init__(
+        self,
+        farmers: int = 100,
+        profile: str = "instant",
+        rate_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        seed: int = 42,
+    ):
+        self.lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.rate_limited: Dict[str, int] = {}
+        self.latency_seconds: Dict[str, float] = {}
+        self.latency = dict(PROFILES[profile]["latency"])
+        limits = dict(PROFILES[profile]["rate_limits"], **(rate_limits or {}))
+        self.buckets = {quota: TokenBucket(rate, burst) for quota, (rate, burst) in limits.items() if rate}
+        self._rng = random.Random(seed)
+        self.activity_rows = 0
+        self.messages_sent = 0
+        self._kamis_cache: Dict[tuple, bytes] = {}
+        self.set_farmers(farmers)
+
+        self.server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def set_farmers(self, count: int) -> None:
+        """
+        Replaces the Farmers worksheet with count synthetic farmers,
+        generated on the first read.
+        """
+        with self.lock:
+            self.farmers = count
+            self._farmers_values = None
+
+    def _farmer_values(self) -> bytes:
+        # Kept JSON-encoded: a million rows as lists would take several hundred MB
+        with self.lock:
+            if self._farmers_values is None:
+                header = json.dumps(SHEET_HEADERS["Farmers"]).encode("utf-8")
+                rows = (json.dumps(row).encode("utf-8") for row in synthetic.farmer_rows(self.farmers))
+                self._farmers_values = b"[" + b",".join([header, *rows]) + b"]"
+            return self._farmers_values
+
+    def environment(self) -> Dict[str, str]:
+        return environment(self.base_url)
+
+    def admit(self, route: str) -> Optional[str]:
+        """
+        Counts a request, waits out its simulated latency and applies the
+        route's rate limit.
+
+        Returns:
+            The exhausted quota if the request is rate limited, else None
+        """
+        quota = ROUTE_QUOTAS.get(route)
+        bucket = self.buckets.get(quota)
+        limited = bucket is not None and not bucket.take()
+
+        delay = 0.0
+        if route in self.latency:
+            with self.lock:
+                delay = sample_latency(*self.latency[route], self._rng)
+        with self.lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            self.latency_seconds[route] = self.latency_seconds.get(route, 0.0) + delay
+            if limited:
+                self.rate_limited[route] = self.rate_limited.get(route, 0) + 1
+        if delay:
+            time.sleep(delay)
+        return quota if limited else None
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "requests": dict(self.requests),
+                "rate_limited": dict(self.rate_limited),
+                "latency_seconds": {route: round(total, 3) for route, total in self.latency_seconds.items()},
+                "messages_sent": self.messages_sent,
+                "activity_rows": self.activity_rows,
+            }
+
+    def reset_counts(self) -> None:
+        with self.lock:
+            self.requests.clear()
+            self.rate_limited.clear()
+            self.latency_seconds.clear()
+            self.activity_rows = 0
+            self.messages_sent = 0
+
+    def start(self) -> "StubUpstreams":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-upstreams", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "StubUpstreams":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # Upstream responses -------------------------------------------------
+
+    def kamis_export(self, query: Dict[str, str]) -> bytes:
+        product_id = int(query.get("product", "61"))
+        rows = int(query.get("per_page", "100"))
+        key = (product_id, rows, datetime.now().strftime("%Y-%m-%d"))
+        with self.lock:
+            export = self._kamis_cache.get(key)
+        if export is None:
+            export = make_kamis_export(product_id, rows)
+            with self.lock:
+                self._kamis_cache[key] = export
+        return export
+
+    @staticmethod
+    def forecast(query: Dict[str, str]) -> Dict:
+        rng = random.Random(f"{query.get('latitude')},{query.get('longitude')}")
+        return {
+            "latitude": float(query.get("latitude", 0)),
+            "longitude": float(query.get("longitude", 0)),
+            "timezone": query.get("timezone", "GMT"),
+            "daily": {
+                "time": [datetime.now().strftime("%Y-%m-%d")],
+                "precipitation_sum": [round(rng.uniform(0, 20), 1)],
+                "precipitation_probability_max": [rng.randint(0, 100)],
+            },
+        }
+
+    def send_message(self, body: Dict) -> Dict:
+        with self.lock:
+            self.messages_sent += 1
+            number = self.messages_sent
+        return {
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": body.get("to"), "wa_id": body.get("to")}],
+            "messages": [{"id": f"wamid.stub{number:010d}"}],
+        }
+
+    @staticmethod
+    def spreadsheet_metadata() -> Dict:
+        return {
+            "spreadsheetId": SPREADSHEET_ID,
+            "properties": {"title": SPREADSHEET_NAME, "locale": "en_US", "timeZone": "Africa/Nairobi"},
+            "sheets": [
+                {"properties": {
+                    "sheetId": index, "title": title, "index": index, "sheetType": "GRID",
+                    "gridProperties": {"rowCount": 1000, "columnCount": len(headers)},
+                }}
+                for index, (title, headers) in enumerate(SHEET_HEADERS.items())
+            ],
+            "spreadsheetUrl": f"https://docs.google.com/spreadsheets/d/{SPREADSHEET_ID}",
+        }
+
+    def sheet_values(self, range_name: str) -> bytes:
+        title = range_name.split("!")[0].strip("'")
+        if title == "Farmers":
+            values = self._farmer_values()
+        elif title == "Buyers":
+            values = json.dumps([SHEET_HEADERS["Buyers"], ["Nairobi Greens Ltd", "Tomatoes", "60", "254701111111", "Gikomba"]]).encode("utf-8")
+        else:
+            values = json.dumps([SHEET_HEADERS.get(title, [])]).encode("utf-8")
+        prefix = json.dumps({"range": range_name, "majorDimension": "ROWS"})[:-1].encode("utf-8")
+        return prefix + b', "values": ' + values + b"}"
+
+    def append_values(self, range_name: str, body: Dict) -> Dict:
+        rows = len(body.get("values") or [])
+        with self.lock:
+            self.activity_rows += rows
+            first_row = self.activity_rows
+        return {
+            "spreadsheetId": SPREADSHEET_ID,
+            "updates": {
+                "spreadsheetId": SPREADSHEET_ID,
+                "updatedRange": f"{range_name.split('!')[0]}!A{first_row + 1}:H{first_row + rows}",
+                "updatedRows": rows,
+                "updatedColumns": len(body["values"][0]) if rows else 0,
+                "updatedCells": sum(len(row) for row in body.get("values") or []),
+            },
+        }
+
+
+def _make_handler(stubs: StubUpstreams):
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, so the client's connection pools behave as with the real hosts
+        protocol_version = "HTTP/1.1"
+        # Headers and body are separate writes; without this, delayed ACKs add ~40 ms per response
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _query(self) -> Dict[str, str]:
+            return {name: values[-1] for name, values in parse_qs(urlsplit(self.path).query).items()}
+
+        def _body(self) -> Dict:
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            return json.loads(raw) if raw else {}
+
+        def _send(self, status: int, body: bytes, content_type: str = "application/json; charset=UTF-8") -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, data: Dict, status: int = 200) -> None:
+            self._send(status, json.dumps(data).encode("utf-8"))
+
+        def _not_found(self) -> None:
+            stubs.admit("not_found")
+            self._json({"error": {"code": 404, "message": f"No stub for {self.command} {self.path}"}}, 404)
+
+        def _admit(self, route: str) -> bool:
+            quota = stubs.admit(route)
+            if quota is None:
+                return True
+            self._json(RATE_LIMITED_BODIES[quota], 429)
+            return False
+
+        def do_GET(self):
+            path = unquote(urlsplit(self.path).path)
+            if path == "/_stub/stats":
+                self._json(stubs.stats())
+            elif path == "/site/market":
+                if self._admit("kamis_export"):
+                    self._send(200, stubs.kamis_export(self._query()),
+                               "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+            elif path == "/v1/forecast":
+                if self._admit("open_meteo_forecast"):
+                    self._json(stubs.forecast(self._query()))
+            elif path == f"/v4/spreadsheets/{SPREADSHEET_ID}":
+                if self._admit("sheets_metadata"):
+                    self._json(stubs.spreadsheet_metadata())
+            elif path.startswith(f"/v4/spreadsheets/{SPREADSHEET_ID}/values/"):
+                if self._admit("sheets_values_get"):
+                    self._send(200, stubs.sheet_values(path.rsplit("/values/", 1)[1]))
+            elif path == "/drive/v3/files":
+                if self._admit("drive_files_list"):
+                    self._json({"files": [{"id": SPREADSHEET_ID, "name": SPREADSHEET_NAME,
+                                           "createdTime": "2025-01-01T00:00:00.000Z",
+                                           "modifiedTime": "2025-01-01T00:00:00.000Z"}]})
+            else:
+                self._not_found()
+
+        def do_POST(self):
+            path = unquote(urlsplit(self.path).path)
+            body = self._body()
+            if path.endswith("/messages") and path.startswith("/v"):
+                if self._admit("graph_messages"):
+                    self._json(stubs.send_message(body))
+            elif path.startswith(f"/v4/spreadsheets/{SPREADSHEET_ID}/values/") and path.endswith(":append"):
+                if self._admit("sheets_values_append"):
+                    range_name = path.rsplit("/values/", 1)[1][:-len(":append")]
+                    self._json(stubs.append_values(range_name, body))
+            else:
+                self._not_found()
+
+    return Handler
+
+
+def _serve(conn, kwargs: Dict) -> None:
+    stubs = StubUpstreams(**kwargs).start()
+    conn.send(stubs.base_url)
+    conn.recv()  # Until the parent says stop (or exits)
+    stubs.stop()
+
+
+class StubProcess:
+    """
+    StubUpstreams running in a child process.
+    """
+
+    def __init__(self, **kwargs):
+        self._conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve, args=(child_conn, kwargs), name="stub-upstreams", daemon=True)
+        self.process.start()
+        self.base_url = self._conn.recv()
+
+    def environment(self) -> Dict[str, str]:
+        return environment(self.base_url)
+
+    def stats(self) -> Dict:
+        with urllib.request.urlopen(f"{self.base_url}/_stub/stats", timeout=10) as response:
+            return json.load(response)
+
+    def stop(self) -> None:
+        try:
+            self._conn.send("stop")
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=10)
@@ -0,0 +1,427 @@
+"""
+Synthetic Data - Large, realistic data sets for benchmarks and load tests
+=========================================================================
+Row generators, deterministic for a given seed and streamed, so a million
+rows never have to sit in memory at once:
+
+    kamis_rows()    KAMIS market price exports: hundreds of markets over
+                    years, newest first, with the gaps the real export has
+                    (" - " wholesale prices, empty supply volumes)
+    buyer_rows()    Rows shaped like data/buyers.xlsx
+    farmer_rows()   Farmers worksheet rows with unique phones spread across
+                    weather_api.KENYA_COUNTIES
+
+Each can be written as xlsx, CSV, or straight into the app's own stores
+(DATA_DIR files and agrosoko.db) with the write_*_store() helpers.
+
+Usage:
+    python benchmarks/synthetic.py kamis --markets 300 --years 3 --format xlsx --output kamis.xlsx
+    python benchmarks/synthetic.py buyers --rows 100000 --format csv --output buyers.csv
+    python benchmarks/synthetic.py farmers --rows 1000000 --format store --data-dir /tmp/agrosoko-data
+"""
+
+import argparse
+import csv
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from openpyxl import Workbook
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Largest number of data rows an xlsx sheet can hold (plus the header)
+XLSX_MAX_ROWS = 1048575
+
+KAMIS_COLUMNS = ["Commodity", "Classification", "Grade", "Sex", "Market", "Wholesale", "Retail", "Supply Volume", "County", "Date"]
+BUYER_COLUMNS = [
+    "Buyer ID", "Buyer Name", "Buyer Type", "County", "Location", "Contact Phone", "Crops Interested",
+    "Weekly Volume (kg)", "Quality Required", "Payment Terms", "Price Range (KSh/kg)", "Status", "Verified",
+    "Registration Date",
+]
+FARMER_COLUMNS = ["Name", "Phone", "County", "Crops", "Status"]
+
+# KAMIS product ID -> (commodity, classification, crop_category, typical KSh/kg)
+KAMIS_COMMODITIES = {
+    61: ("Tomatoes", "-", "tomatoes", 70),
+    158: ("Dry Onions", "-", "onions", 95),
+    154: ("Kales/Sukuma Wiki", "-", "sukuma", 40),
+    58: ("Cabbages", "-", "cabbage", 30),
+    1: ("Dry Maize", "White Maize", "maize", 45),
+    29: ("Beans Red Haricot (Wairimu)", "-", "beans", 120),
+}
+
+# Real markets first; the rest are named after their county
+KNOWN_MARKETS = [
+    ("Wakulima", "Nairobi"), ("Gikomba", "Nairobi"), ("Kangemi", "Nairobi"), ("Kawangware", "Nairobi"),
+    ("Marikiti", "Nairobi"), ("Githurai", "Kiambu"), ("Kongowea", "Mombasa"), ("Kibuye", "Kisumu"),
+    ("Wakulima (Nakuru)", "Nakuru"), ("Kisasi", "Kitui"), ("Mumias", "Kakamega"), ("Ndanai Market", "Bomet"),
+]
+
+# Relative share of farmers per county; counties not listed get 1
+FARMER_COUNTY_WEIGHTS = {
+    "Nairobi": 4, "Kiambu": 8, "Nakuru": 8, "Meru": 7, "Nyeri": 5, "Murang'a": 6, "Kirinyaga": 5,
+    "Machakos": 5, "Kakamega": 6, "Bungoma": 6, "Uasin Gishu": 5, "Trans Nzoia": 5, "Kisii": 5,
+    "Nyandarua": 5, "Embu": 4, "Kericho": 4, "Narok": 4, "Makueni": 3, "Kitui": 3, "Kisumu": 3,
+}
+
+FARMER_CROPS = [
+    "Tomatoes", "Tomatoes, Sukuma", "Sukuma, Cabbage", "Cabbage, Onions", "Onions", "Maize, Beans",
+    "Maize", "Tomatoes, Onions, Cabbage", "Sukuma Wiki", "Beans",
+]
+BUYER_CROPS = [
+    "Tomatoes, Onions, Cabbage, Sukuma Wiki", "Tomatoes, Sukuma Wiki, Cabbage", "Tomatoes, Sukuma Wiki, Onions, Cabbage",
+    "All Crops", "Sukuma Wiki, Tomatoes", "Tomatoes, Onions, Cabbage", "Tomatoes, Onions, Sukuma Wiki", "Onions",
+    "Cabbage, Sukuma Wiki", "Tomatoes",
+]
+
+# Buyer type -> (share, typical weekly kg, name suffixes)
+BUYER_TYPES = {
+    "Mama Mboga": (40, 150, ["Greengrocers", "Vegetables", "Fresh Produce"]),
+    "Restaurant": (20, 250, ["Restaurant", "Eatery", "Kitchen"]),
+    "Hotel": (12, 500, ["Hotel", "Lodge", "Resort"]),
+    "Wholesaler": (12, 3000, ["Wholesalers", "Traders", "Distributors"]),
+    "Supermarket": (10, 2000, ["Supermarket", "Mart", "Stores"]),
+    "Restaurant Chain": (6, 800, ["Ltd", "Group", "Foods"]),
+}
+
+NAIROBI_LOCATIONS = [
+    "Nairobi CBD", "Westlands", "Karen", "Eastleigh", "Thika Road", "Lavington", "Muthaiga", "Langata",
+    "Kasarani", "Githurai", "Kangemi", "Kawangware", "Embakasi", "Kilimani", "Wakulima Market", "Marikiti",
+]
+
+FIRST_NAMES = [
+    "John", "Mary", "Peter", "Grace", "James", "Faith", "Joseph", "Mercy", "David", "Esther", "Samuel", "Ann",
+    "Daniel", "Lucy", "Paul", "Jane", "Stephen", "Caroline", "Francis", "Nancy", "Kevin", "Wanjiru", "Otieno",
+    "Akinyi", "Kiprop", "Chebet", "Mutua", "Mwikali", "Wafula", "Nafula",
+]
+SURNAMES = [
+    "Kamau", "Wanjiku", "Ochieng", "Mwangi", "Otieno", "Njoroge", "Kipchoge", "Mutiso", "Wekesa", "Kariuki",
+    "Odhiambo", "Cheruiyot", "Mutua", "Njeri", "Omondi", "Kimani", "Rotich", "Wambui", "Barasa", "Maina",
+]
+
+
+def kenya_counties() -> List[str]:
+    """
+    County names from weather_api.KENYA_COUNTIES. Imported on first use:
+    the app's modules read their configuration (e.g. HTTP_HOST_OVERRIDES)
+    at import time, and callers may still be setting it up.
+    """
+    from app.services.weather_api import KENYA_COUNTIES
+    return sorted(KENYA_COUNTIES)
+
+
+def kamis_markets(count: int) -> List[tuple]:
+    """
+    (market, county) pairs: the known markets, then one or more per county.
+    """
+    markets = list(KNOWN_MARKETS[:count])
+    counties = kenya_counties()
+    index = 0
+    while len(markets) < count:
+        county = counties[index % len(counties)]
+        markets.append((f"{county} Market {index // len(counties) + 1}", county))
+        index += 1
+    return markets
+
+
+def kamis_rows(
+    markets: int = 300,
+    years: float = 3,
+    products: Optional[Sequence[int]] = None,
+    end: Optional[date] = None,
+    report_rate: float = 0.3,
+    seed: int = 42,
+) -> Iterator[List]:
+    """
+    KAMIS export rows (KAMIS_COLUMNS), newest day first.
+
+    Each market reports each product on about report_rate of days. Prices
+    follow a yearly season plus a per-market random walk.
+
+    Args:
+        markets: Number of markets
+        years: Days covered, in years, ending at end (default today);
+            at least one day
+        products: KAMIS product IDs (default all of KAMIS_COMMODITIES)
+        report_rate: Share of (market, product, day) combinations reported
+        seed: Random seed
+    """
+    rng = random.Random(seed)
+    end = end or date.today()
+    products = list(products or KAMIS_COMMODITIES)
+    market_list = kamis_markets(markets)
+    days = max(1, int(years * 365))
+
+    # Per (market, product): price level relative to the typical price, and a walk
+    levels = {(m, p): rng.uniform(0.8, 1.25) for m in range(len(market_list)) for p in products}
+    walks = dict.fromkeys(levels, 0.0)
+
+    for offset in range(days):
+        day = end - timedelta(days=offset)
+        season = 1 + 0.2 * math.sin(2 * math.pi * day.timetuple().tm_yday / 365)
+        day_text = day.strftime("%Y-%m-%d")
+        for m, (market, county) in enumerate(market_list):
+            for product in products:
+                key = (m, product)
+                walks[key] = max(-0.4, min(0.4, walks[key] + rng.gauss(0, 0.02)))
+                if rng.random() >= report_rate:
+                    continue
+                commodity, classification, _, typical = KAMIS_COMMODITIES[product]
+                wholesale = typical * levels[key] * season * (1 + walks[key])
+                retail = wholesale * rng.uniform(1.1, 1.6)
+                yield [
+                    commodity, classification, "-", "-", market,
+                    " - " if rng.random() < 0.08 else f"{wholesale:.2f}/Kg",
+                    f"{retail:.2f}/Kg",
+                    None if rng.random() < 0.3 else float(rng.randrange(100, 50000, 50)),
+                    county, day_text,
+                ]
+
+
+def buyer_rows(count: int = 100000, seed: int = 42) -> Iterator[List]:
+    """
+    Buyer rows (BUYER_COLUMNS) like data/buyers.xlsx: mostly Nairobi, a mix
+    of types with matching volumes, phones unique.
+    """
+    rng = random.Random(seed)
+    types = list(BUYER_TYPES)
+    type_weights = [BUYER_TYPES[name][0] for name in types]
+    counties = kenya_counties()
+    start = date(2025, 1, 1)
+
+    for i in range(count):
+        buyer_type = rng.choices(types, type_weights)[0]
+        _, volume, suffixes = BUYER_TYPES[buyer_type]
+        county = "Nairobi" if rng.random() < 0.6 else rng.choice(counties)
+        location = rng.choice(NAIROBI_LOCATIONS) if county == "Nairobi" else f"{county} Town"
+        grade = "Grade A" if buyer_type in ("Hotel", "Supermarket", "Restaurant Chain") or rng.random() < 0.3 else "Grade B"
+        yield [
+            f"BYR{i + 1:06d}",
+            f"{rng.choice(SURNAMES)} {rng.choice(suffixes)}",
+            buyer_type,
+            county,
+            location,
+            unique_phone(i, seed + 1),
+            rng.choice(BUYER_CROPS),
+            None if rng.random() < 0.05 else int(volume * rng.uniform(0.5, 2.0)),
+            grade,
+            rng.choice(["Net 30", "Net 15", "Net 7", "Cash on Delivery", "M-Pesa on Delivery"]),
+            "40-55" if grade == "Grade A" else "30-45",
+            "Active" if rng.random() < 0.9 else "Inactive",
+            "Yes" if rng.random() < 0.75 else "No",
+            (start + timedelta(days=rng.randrange(0, 600))).strftime("%Y-%m-%d"),
+        ]
+
+
+def farmer_rows(count: int = 1000000, seed: int = 42, inactive_rate: float = 0.02) -> Iterator[List]:
+    """
+    Farmers worksheet rows (FARMER_COLUMNS) with unique phones, spread
+    across every county in KENYA_COUNTIES (FARMER_COUNTY_WEIGHTS).
+    """
+    rng = random.Random(seed)
+    counties = kenya_counties()
+    weights = [FARMER_COUNTY_WEIGHTS.get(county, 1) for county in counties]
+
+    for i in range(count):
+        yield [
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(SURNAMES)}",
+            str(unique_phone(i, seed)),
+            rng.choices(counties, weights)[0],
+            rng.choice(FARMER_CROPS),
+            "Inactive" if rng.random() < inactive_rate else "Active",
+        ]
+
+
+def unique_phone(index: int, seed: int = 0) -> int:
+    """
+    A Kenyan mobile number (2547XXXXXXXX), different for every index below
+    100 million, scattered rather than sequential.
+    """
+    # 48271 is coprime with 10^8, so index -> number is one-to-one
+    return 254700000000 + (index * 48271 + seed * 7919) % 100000000
+
+
+# Writers -----------------------------------------------------------------
+
+def write_xlsx(path, columns: List[str], rows: Iterable[List], sheet_name: str = "Sheet1") -> int:
+    """
+    Streams rows into an xlsx file (openpyxl write-only mode).
+
+    Args:
+        path: File path, or a binary file object (e.g. BytesIO)
+
+    Returns:
+        Number of data rows written
+
+    Raises:
+        ValueError: If there are more rows than one sheet can hold (use CSV)
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
+    sheet.append(columns)
+    written = 0
+    for row in rows:
+        if written >= XLSX_MAX_ROWS:
+            raise ValueError(f"More than {XLSX_MAX_ROWS} rows do not fit in one xlsx sheet; write CSV instead")
+        sheet.append(row)
+        written += 1
+    if isinstance(path, str):
+        _atomic_save(path, workbook.save)
+    else:
+        workbook.save(path)
+    return written
+
+
+def write_csv(path: str, columns: List[str], rows: Iterable[List]) -> int:
+    """
+    Streams rows into a CSV file.
+
+    Returns:
+        Number of data rows written
+    """
+    written = 0
+
+    def save(tmp_path):
+        nonlocal written
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(["" if value is None else value for value in row])
+                written += 1
+
+    _atomic_save(path, save)
+    return written
+
+
+def _atomic_save(path: str, save) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        save(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def with_crop_category(rows: Iterable[List]) -> Iterator[List]:
+    """
+    Adds the crop_category column kamis_scraper adds to its saved files.
+    """
+    categories = {commodity: category for commodity, _, category, _ in KAMIS_COMMODITIES.values()}
+    for row in rows:
+        yield row + [categories.get(row[0])]
+
+
+def write_kamis_store(data_dir: str, markets: int = 300, years: float = 3, seed: int = 42) -> Dict[str, int]:
+    """
+    Installs KAMIS data the way kamis_scraper leaves it: a historical file
+    plus the initial-download marker, and today's daily file (so
+    scrape_kamis() answers from cache).
+
+    Returns:
+        Rows written per file
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    columns = KAMIS_COLUMNS + ["crop_category"]
+
+    historical = os.path.join(data_dir, f"kamis_historical_{stamp}.xlsx")
+    daily = os.path.join(data_dir, f"kamis_daily_{stamp}.xlsx")
+    counts = {
+        historical: write_xlsx(historical, columns, with_crop_category(kamis_rows(markets, years, seed=seed))),
+        # years=0 still covers one day: today
+        daily: write_xlsx(daily, columns, with_crop_category(kamis_rows(markets, years=0, seed=seed))),
+    }
+    with open(os.path.join(data_dir, ".kamis_initial_download_complete"), "w") as f:
+        f.write(datetime.now().isoformat())
+    return counts
+
+
+def write_buyers_store(data_dir: str, count: int = 100000, seed: int = 42) -> Dict[str, int]:
+    """
+    Writes DATA_DIR/buyers.xlsx (what buyers_service reads).
+    """
+    path = os.path.join(data_dir, "buyers.xlsx")
+    return {path: write_xlsx(path, BUYER_COLUMNS, buyer_rows(count, seed))}
+
+
+def write_farmers_store(count: int = 1000000, seed: int = 42, run_id: str = "synthetic", batch_size: int = 10000) -> Dict[str, int]:
+    """
+    Writes a conversation state per active farmer into agrosoko.db, as the
+    daily broadcast leaves it (stage awaiting_reply), for load-testing the
+    reply webhooks. Uses the DATA_DIR / AGROSOKO_DB_PATH of this process.
+    """
+    from app.services import conversation_store, local_store
+
+    written = 0
+    rows = (row for row in farmer_rows(count, seed) if row[4] == "Active")
+    while True:
+        batch = [
+            (phone, {
+                "stage": conversation_store.STAGE_AWAITING_REPLY,
+                "run_id": run_id,
+                "name": name,
+                "county": county,
+                "crops": [crop.strip() for crop in crops.split(",") if crop.strip()],
+            })
+            for name, phone, county, crops, _ in islice(rows, batch_size)
+        ]
+        if not batch:
+            break
+        written += conversation_store.set_many(batch)
+    return {local_store.DB_FILE: written}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataset", choices=["kamis", "buyers", "farmers"])
+    parser.add_argument("--format", choices=["xlsx", "csv", "store"], default="xlsx")
+    parser.add_argument("--output", help="Output file (xlsx/csv)")
+    parser.add_argument("--data-dir", help="DATA_DIR to install into (store)")
+    parser.add_argument("--rows", type=int, help="Buyers or farmers (default 100,000 / 1,000,000)")
+    parser.add_argument("--markets", type=int, default=300)
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.format == "store":
+        if not args.data_dir:
+            parser.error("--data-dir is required with --format store")
+        # Before the app's stores are imported
+        os.environ["DATA_DIR"] = args.data_dir
+        os.environ.setdefault("AGROSOKO_DB_PATH", os.path.join(args.data_dir, "agrosoko.db"))
+        if args.dataset == "kamis":
+            counts = write_kamis_store(args.data_dir, args.markets, args.years, args.seed)
+        elif args.dataset == "buyers":
+            counts = write_buyers_store(args.data_dir, args.rows or 100000, args.seed)
+        else:
+            counts = write_farmers_store(args.rows or 1000000, args.seed)
+    else:
+        if not args.output:
+            parser.error("--output is required with --format xlsx/csv")
+        if args.dataset == "kamis":
+            columns, rows = KAMIS_COLUMNS, kamis_rows(args.markets, args.years, seed=args.seed)
+        elif args.dataset == "buyers":
+            columns, rows = BUYER_COLUMNS, buyer_rows(args.rows or 100000, args.seed)
+        else:
+            columns, rows = FARMER_COLUMNS, farmer_rows(args.rows or 1000000, args.seed)
+        writer = write_csv if args.format == "csv" else write_xlsx
+        counts = {args.output: writer(args.output, columns, rows)}
+
+    for path, count in counts.items():
+        print(f"  {count:>10,} rows -> {path}")
+    print(f"  Done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()